@@ -0,0 +1,350 @@
+"""Artifact API endpoints"""
+
+import logging
+from contextlib import AbstractContextManager, asynccontextmanager
+from functools import lru_cache
+from typing import AsyncIterator, TypeVar
+from urllib.parse import quote
+
+from fastapi import APIRouter, HTTPException, Query, Request, status
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+
+from buildserver.api.jobs.models import (
+    ArtifactRead,
+    ArtifactUpload,
+    JobBundle,
+    JobRead,
+)
+from buildserver.artifacts import bundle
+from buildserver.artifacts.artifactstore import blob_store
+from buildserver.artifacts.blobstore import (
+    DigestMismatchError,
+    InvalidDigestError,
+    UploadConflictError,
+    UploadNotFoundError,
+)
+from buildserver.config import LOG_LEVEL, BLOB_ACCEL_REDIRECT
+from buildserver.database.core import DbSession
+from buildserver.services.builds import (
+    get_artifact_by_id,
+    get_job_artifacts,
+    get_job_by_id,
+    register_artifacts,
+    set_job_bundle,
+)
+from buildserver.services.retention import record_artifact_access, record_blob_access
+
+logger = logging.getLogger(__name__)
+logger.setLevel(LOG_LEVEL)
+
+router = APIRouter()
+
+# blobs never change, a digest names the same bytes forever
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+T = TypeVar("T")
+
+
+def _blob_path(digest: str):
+    try:
+        return blob_store.path(digest)
+    except InvalidDigestError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+
+def _require_blobs(digests: set[str]) -> None:
+    """Touch the blobs an upload refers to, 400 if any isn't stored."""
+    missing = sorted(digest for digest in digests if not blob_store.touch(digest))
+    if missing:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=[{"msg": "Blobs not uploaded", "digests": missing}],
+        )
+
+
+@router.head("/artifacts/blobs/{digest}")
+def head_blob(digest: str) -> Response:
+    """
+    Check whether a blob is stored, so uploading it can be skipped.
+
+    A hit protects the blob from garbage collection for a while, long enough
+    for the caller to register an artifact that references it.
+    """
+    path = _blob_path(digest)
+    if not blob_store.touch(digest):
+        return Response(status_code=status.HTTP_404_NOT_FOUND)
+    return Response(
+        headers={
+            "Content-Length": str(path.stat().st_size),
+            "ETag": f'"{digest}"',
+            "Cache-Control": IMMUTABLE,
+            "Accept-Ranges": "bytes",
+        }
+    )
+
+
+@router.get("/artifacts/blobs/{digest}")
+def get_blob(digest: str, request: Request, dbsession: DbSession) -> Response:
+    """Download a blob. Supports Range, If-Range and If-None-Match."""
+    response = _serve_blob(request, digest)
+    record_blob_access(dbsession, digest)
+    return response
+
+
+@router.get("/artifacts/{artifact_id}")
+def get_artifact(artifact_id: int, request: Request, dbsession: DbSession) -> Response:
+    """Download an artifact under its file name."""
+    artifact = get_artifact_by_id(dbsession, artifact_id)
+    if artifact is None or artifact.digest is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Artifact with id {artifact_id} not found",
+        )
+    response = _serve_blob(request, artifact.digest, artifact.artifact_file_name)
+    record_artifact_access(dbsession, artifact_id)
+    return response
+
+
+def _serve_blob(request: Request, digest: str, filename: str | None = None):
+    """
+    Respond with a blob's contents.
+
+    The digest is a strong ETag, so caches can revalidate with
+    If-None-Match and resume with If-Range. The file itself is sent by the
+    server (http.response.pathsend) or nginx (X-Accel-Redirect) where
+    available, so its bytes don't pass through Python.
+    """
+    path = _blob_path(digest)
+    if not path.is_file():
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail=f"Blob {digest} not found"
+        )
+    etag = f'"{digest}"'
+    headers = {"ETag": etag, "Cache-Control": IMMUTABLE}
+    if filename is not None:
+        headers["Content-Disposition"] = _content_disposition(filename)
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    if BLOB_ACCEL_REDIRECT:
+        # nginx serves the file, ranges included, with these headers
+        location = path.relative_to(blob_store.root).as_posix()
+        headers["X-Accel-Redirect"] = f"{BLOB_ACCEL_REDIRECT.rstrip('/')}/{location}"
+        return Response(headers=headers, media_type="application/octet-stream")
+    return FileResponse(path, headers=headers, media_type="application/octet-stream")
+
+
+def _etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if if_none_match is None:
+        return False
+    # If-None-Match uses the weak comparison
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags
+
+
+def _content_disposition(filename: str) -> str:
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"attachment; filename*=utf-8''{quoted}"
+    return f'attachment; filename="{filename}"'
+
+
+@router.post("/artifacts/uploads", status_code=status.HTTP_201_CREATED)
+def start_upload(response: Response) -> dict:
+    """Begin a resumable blob upload."""
+    upload_id = blob_store.start_upload()
+    response.headers["Location"] = f"/artifacts/uploads/{upload_id}"
+    return {"upload_id": upload_id, "offset": 0}
+
+
+@router.get("/artifacts/uploads/{upload_id}")
+def get_upload(upload_id: str) -> dict:
+    """Report how much of an upload was received, to resume it from there."""
+    try:
+        offset = blob_store.upload_size(upload_id)
+    except UploadNotFoundError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    return {"upload_id": upload_id, "offset": offset}
+
+
+@asynccontextmanager
+async def _in_threadpool(cm: AbstractContextManager[T]) -> AsyncIterator[T]:
+    """Enter and exit a blocking context manager in the threadpool."""
+    value = await run_in_threadpool(cm.__enter__)
+    try:
+        yield value
+    except BaseException as e:
+        if not await run_in_threadpool(cm.__exit__, type(e), e, e.__traceback__):
+            raise
+    else:
+        await run_in_threadpool(cm.__exit__, None, None, None)
+
+
+@router.patch("/artifacts/uploads/{upload_id}")
+async def append_upload(
+    upload_id: str,
+    request: Request,
+    offset: int = Query(
+        ..., ge=0, description="Position of the body in the blob, for retries"
+    ),
+) -> dict:
+    """
+    Append the request body to an upload.
+
+    The body is streamed to disk and hashed as it arrives, it is never held
+    in memory as a whole.
+    """
+    try:
+        # opening locks the file and may re-hash what was uploaded so far
+        async with _in_threadpool(blob_store.open_upload(upload_id, offset)) as upload:
+            async for chunk in request.stream():
+                await run_in_threadpool(upload.write, chunk)
+    except UploadNotFoundError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    except UploadConflictError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    return {"upload_id": upload_id, "offset": upload.size}
+
+
+@router.put("/artifacts/uploads/{upload_id}")
+def finish_upload(
+    upload_id: str,
+    digest: str = Query(..., description="sha256 of the whole blob"),
+) -> dict:
+    """Verify a complete upload against its digest and store it as a blob."""
+    _blob_path(digest)
+    try:
+        digest, size = blob_store.finish_upload(upload_id, digest)
+    except UploadNotFoundError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    except UploadConflictError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    except DigestMismatchError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return {"digest": digest, "size": size}
+
+
+@router.post("/jobs/{job_id}/artifacts", response_model=list[ArtifactRead])
+def register(
+    job_id: int, uploads: list[ArtifactUpload], dbsession: DbSession
+) -> list[ArtifactRead]:
+    """Register the artifacts of a job whose blobs have been uploaded."""
+    job = get_job_by_id(dbsession, job_id)
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Job with id {job_id} not found",
+        )
+    digests = {u.digest for u in uploads}
+    _require_blobs(digests)
+    artifacts = register_artifacts(dbsession, job, uploads)
+    # the collector may have deleted a blob after the touch, referencing it
+    # waited for its transaction, so the files are checked again. The 400
+    # rolls the registration back and the runner uploads them again
+    _require_blobs(digests)
+    return artifacts
+
+
+@router.get("/jobs/{job_id}/artifacts", response_model=list[ArtifactRead])
+def get_artifacts(job_id: int, dbsession: DbSession) -> list[ArtifactRead]:
+    """Retrieve the artifacts registered for a job."""
+    if get_job_by_id(dbsession, job_id) is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Job with id {job_id} not found",
+        )
+    return get_job_artifacts(dbsession, job_id)
+
+
+@router.put("/jobs/{job_id}/bundle", response_model=JobRead)
+def put_bundle(job_id: int, upload: JobBundle, dbsession: DbSession) -> JobRead:
+    """Register an uploaded blob as the job's compressed artifact bundle."""
+    _require_blobs({upload.digest})
+    job = set_job_bundle(dbsession, job_id, upload.digest, upload.size)
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Job with id {job_id} not found",
+        )
+    # as in register, the collector may have deleted the blob meanwhile
+    _require_blobs({upload.digest})
+    return job
+
+
+@router.get("/jobs/{job_id}/bundle")
+def get_bundle(job_id: int, request: Request, dbsession: DbSession) -> Response:
+    """Download all of a job's artifacts as one .tar.zst file."""
+    digest = _bundle_digest(dbsession, job_id)
+    return _serve_blob(request, digest, f"job-{job_id}.tar.zst")
+
+
+@router.get("/jobs/{job_id}/bundle/index")
+def get_bundle_index(job_id: int, dbsession: DbSession) -> list[dict]:
+    """List the members of a job's bundle."""
+    digest = _bundle_digest(dbsession, job_id)
+    return [
+        {"name": m.name, "size": m.size, "mode": m.mode, "digest": m.digest}
+        for m in _bundle_index(digest)
+    ]
+
+
+@router.get("/jobs/{job_id}/bundle/members/{name:path}")
+def get_bundle_member(
+    job_id: int, name: str, request: Request, dbsession: DbSession
+) -> Response:
+    """
+    Download a single member of a job's bundle.
+
+    Only the member's own zstd frame is read and decompressed.
+    """
+    digest = _bundle_digest(dbsession, job_id)
+    member = bundle.find_member(_bundle_index(digest), name)
+    if member is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"No {name} in the bundle of job {job_id}",
+        )
+    etag = f'"{member.digest}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": IMMUTABLE,
+        "Content-Disposition": _content_disposition(name.rsplit("/", 1)[-1]),
+    }
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    if not bundle.available():
+        raise HTTPException(
+            status_code=status.HTTP_501_NOT_IMPLEMENTED,
+            detail="Extracting bundle members needs zstandard",
+        )
+    headers["Content-Length"] = str(member.size)
+    return StreamingResponse(
+        bundle.read_member(blob_store.path(digest), member),
+        headers=headers,
+        media_type="application/octet-stream",
+    )
+
+
+def _bundle_digest(dbsession: DbSession, job_id: int) -> str:
+    job = get_job_by_id(dbsession, job_id)
+    if job is None or job.bundle_digest is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Job with id {job_id} has no bundle",
+        )
+    return job.bundle_digest
+
+
+@lru_cache(maxsize=128)
+def _bundle_index(digest: str) -> list[bundle.Member]:
+    # a digest always names the same bundle, so its index never goes stale
+    try:
+        return bundle.read_index(blob_store.path(digest))
+    except FileNotFoundError:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail=f"Blob {digest} not found"
+        )
+    except bundle.BundleError as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e)
+        )
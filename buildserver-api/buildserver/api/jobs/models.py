@@ -4,12 +4,14 @@ from datetime import datetime
 from enum import Enum as PyEnum
 from typing import Optional
 
-from pydantic import BaseModel
-from sqlalchemy import DateTime, String, Enum
+from pydantic import BaseModel, Field
+from sqlalchemy import BigInteger, DateTime, Enum, ForeignKey, Index, String, func
 from sqlalchemy.orm import Mapped, mapped_column
 
 from buildserver.database.core import Base
 
+DEFAULT_BUILD_CONFIG = "default"
+
 
 class JobStatus(str, PyEnum):
     """Represents the current state of a job in the build pipeline."""
@@ -19,6 +21,11 @@ class JobStatus(str, PyEnum):
     QUEUED = "QUEUED"
     RUNNING = "RUNNING"
     CREATED = "CREATED"
+    SUPERSEDED = "SUPERSEDED"  # replaced by a newer commit before it ran
+
+
+# states a job ends in, its latest of these is a repository's current state
+FINISHED = (JobStatus.SUCCEEDED, JobStatus.FAILED)
 
 
 class JobStatusUpdate(BaseModel):
@@ -28,10 +35,16 @@ class JobStatusUpdate(BaseModel):
 
 
 class ArtifactRead(BaseModel):
+    artifact_id: Optional[int] = None
+    job_id: Optional[int] = None
     git_repository_url: str
     commit_hash: str
     artifact_file_name: str
     artifact_path: str
+    digest: Optional[str] = None
+    size: Optional[int] = None
+    created_at: Optional[datetime] = None
+    last_accessed_at: Optional[datetime] = None
 
 
 class ArtifactCreate(BaseModel):
@@ -39,6 +52,41 @@ class ArtifactCreate(BaseModel):
     artifact_file_name: str
     artifact_path: str
     commit_hash: str
+    # sha256 of the contents in the blob store
+    digest: Optional[str] = None
+    size: Optional[int] = None
+    job_id: Optional[int] = None
+
+
+class ArtifactUpload(BaseModel):
+    """An artifact a runner uploaded, registered once its job has finished."""
+
+    artifact_file_name: str
+    artifact_path: str  # relative to the build directory
+    digest: str = Field(pattern=r"^[0-9a-f]{64}$")
+    size: int = Field(ge=0)
+
+
+class Blob(Base):
+    """
+    Database model for a blob in the content-addressed store
+
+    ref_count is the number of artifacts pointing at the blob. Blobs whose
+    count dropped to 0 more than BLOB_GC_GRACE seconds ago are deleted by the
+    garbage collector.
+    """
+
+    __tablename__ = "blob"
+    digest: Mapped[str] = mapped_column(String(64), primary_key=True)
+    size: Mapped[int] = mapped_column(BigInteger, nullable=True)
+    ref_count: Mapped[int] = mapped_column(default=0, server_default="0")
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.now)
+    released_at: Mapped[datetime] = mapped_column(DateTime, nullable=True)
+
+    __table_args__ = (
+        # the collector only ever looks at unreferenced blobs
+        Index("ix_blob_unreferenced", "released_at", postgresql_where=(ref_count <= 0)),
+    )
 
 
 class Artifact(Base):
@@ -48,6 +96,27 @@ class Artifact(Base):
     artifact_path: Mapped[str] = mapped_column(String(255))
     git_repository_url: Mapped[str] = mapped_column(String(255))
     commit_hash: Mapped[str] = mapped_column(String(40))  # max length of a sha-1 hash
+    digest: Mapped[str] = mapped_column(
+        String(64), ForeignKey("blob.digest"), nullable=True, index=True
+    )
+    size: Mapped[int] = mapped_column(BigInteger, nullable=True)
+    job_id: Mapped[int] = mapped_column(
+        ForeignKey("job.job_id"), nullable=True, index=True
+    )
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime, default=datetime.now, server_default=func.now()
+    )
+    # last download, or creation, refreshed at most every
+    # ARTIFACT_ACCESS_RESOLUTION seconds. Evictions go by this, oldest first.
+    last_accessed_at: Mapped[datetime] = mapped_column(
+        DateTime, default=datetime.now, server_default=func.now()
+    )
+
+    __table_args__ = (
+        Index("ix_artifact_lru", "last_accessed_at", "artifact_id"),
+        # one artifact per path and job, so registering them again is a no-op
+        Index("uq_artifact_job_path", "job_id", "artifact_path", unique=True),
+    )
 
 
 class JobRead(BaseModel):
@@ -58,12 +127,25 @@ class JobRead(BaseModel):
     commit_hash: Optional[str]
     job_status: JobStatus
     created_at: datetime
+    build_config: str = DEFAULT_BUILD_CONFIG
+    # sha256 of the job's artifact bundle, if its runner uploaded one
+    bundle_digest: Optional[str] = None
+
+
+class JobBundle(BaseModel):
+    """Request body registering an uploaded blob as a job's artifact bundle."""
+
+    digest: str = Field(pattern=r"^[0-9a-f]{64}$")
+    size: int = Field(ge=0)
 
 
 class JobCreate(BaseModel):
     """Request model for submitting a new job."""
 
     git_repository_url: str
+    build_config: str = DEFAULT_BUILD_CONFIG
+    # build even if this commit and config already built successfully
+    force: bool = False
 
 
 class Job(Base):
@@ -79,3 +161,72 @@ class Job(Base):
     )  # add this after successful build
     job_status: Mapped[str] = mapped_column(Enum(JobStatus, name="jobstatus"))
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.now)
+    build_config: Mapped[str] = mapped_column(
+        String(255), default=DEFAULT_BUILD_CONFIG, server_default=DEFAULT_BUILD_CONFIG
+    )
+    bundle_digest: Mapped[str] = mapped_column(
+        String(64), ForeignKey("blob.digest"), nullable=True
+    )
+
+    __table_args__ = (
+        # GET /jobs pages, newest first, optionally by status or repository
+        Index("ix_job_created", "created_at", "job_id"),
+        Index("ix_job_status_created", "job_status", "created_at", "job_id"),
+        Index(
+            "ix_job_repository_created", "git_repository_url", "created_at", "job_id"
+        ),
+        # build result cache lookups, only successful builds are ever hits
+        Index(
+            "ix_job_result_cache",
+            "git_repository_url",
+            "commit_hash",
+            "build_config",
+            postgresql_where=(job_status == JobStatus.SUCCEEDED),
+        ),
+        # the jobs a registration may coalesce with or supersede
+        Index(
+            "ix_job_queued",
+            "git_repository_url",
+            "build_config",
+            "created_at",
+            postgresql_where=(job_status == JobStatus.QUEUED),
+        ),
+        # a repository's finished jobs newest first, for rebuilding its row in
+        # repository_latest_job
+        Index(
+            "ix_job_finished",
+            "git_repository_url",
+            created_at.desc(),
+            postgresql_where=job_status.in_(FINISHED),
+        ),
+    )
+
+
+class RepositoryLatestJob(Base):
+    """
+    The most recent finished job of each repository
+
+    A read model of job maintained by update_job_status whenever a job
+    finishes, so listing the latest job per repository reads one row per
+    repository instead of sorting every job.
+    """
+
+    __tablename__ = "repository_latest_job"
+    git_repository_url: Mapped[str] = mapped_column(String(255), primary_key=True)
+    job_id: Mapped[int] = mapped_column(ForeignKey("job.job_id"))
+    created_at: Mapped[datetime] = mapped_column(DateTime)  # of the job
+
+
+class RepositoryLatestSuccess(Base):
+    """
+    The most recent successful job of each repository
+
+    Maintained like RepositoryLatestJob. Retention reads the commits built
+    here, whose artifacts are never evicted, without sorting every job.
+    """
+
+    __tablename__ = "repository_latest_success"
+    git_repository_url: Mapped[str] = mapped_column(String(255), primary_key=True)
+    job_id: Mapped[int] = mapped_column(ForeignKey("job.job_id"))
+    commit_hash: Mapped[str] = mapped_column(String(40), nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime)  # of the job
@@ -1,19 +1,26 @@
 """Job API endpoints"""
 
+import base64
 import logging
+from datetime import datetime
 
-from fastapi import APIRouter, HTTPException, Query, status
+from fastapi import APIRouter, HTTPException, Query, Request, Response, status
 from fastapi.exceptions import RequestValidationError
 
-from buildserver.api.jobs.models import JobCreate, JobRead, JobStatusUpdate
-from buildserver.database.core import DbSession
-from buildserver.services.builds import (
-    register_job,
+from buildserver.api.jobs.models import (
+    JobCreate,
+    JobRead,
+    JobStatus,
+    JobStatusUpdate,
+)
+from buildserver.database.core import AsyncDbSession, DbSession
+from buildserver.services.async_builds import (
     get_job_by_id,
-    get_all_jobs,
+    list_jobs,
     get_all_unique_jobs,
     update_job_status,
 )
+from buildserver.services.builds import register_job, JobSupersededError
 from buildserver.config import LOG_LEVEL
 
 logger = logging.getLogger(__name__)
@@ -21,6 +28,8 @@ logger.setLevel(LOG_LEVEL)
 
 router = APIRouter(prefix="/jobs")
 
+MAX_PAGE_SIZE = 100
+
 
 def validate(repo_url: str):
     if repo_url == "":
@@ -44,25 +53,66 @@ def register(repo: JobCreate, dbsession: DbSession):
 
 @router.get("", response_model=list[JobRead])
 async def get_jobs(
-    dbsession: DbSession,
+    dbsession: AsyncDbSession,
+    request: Request,
+    response: Response,
     latest: bool = Query(
         False, description="Return only the latest job per repository"
     ),
+    limit: int = Query(10, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str | None = Query(None, description="X-Next-Cursor of the previous page"),
+    job_status: list[JobStatus] | None = Query(None, alias="status"),
+    repo: str | None = Query(None, description="Repository URL"),
+    created_after: datetime | None = None,
+    created_before: datetime | None = None,
 ) -> list[JobRead]:
-    """Retrieve all job records."""
+    """
+    Retrieve jobs, newest first, one page at a time.
+
+    When there are more jobs, the X-Next-Cursor header holds the cursor of
+    the next page and a Link header its URL.
+    """
+    if latest:
+        return await get_all_unique_jobs(dbsession)
+    jobs, next_key = await list_jobs(
+        dbsession,
+        limit,
+        after=_decode_cursor(cursor) if cursor else None,
+        statuses=job_status,
+        repo_url=repo,
+        created_after=created_after,
+        created_before=created_before,
+    )
+    if next_key is not None:
+        next_cursor = _encode_cursor(next_key)
+        next_url = request.url.include_query_params(cursor=next_cursor)
+        response.headers["X-Next-Cursor"] = next_cursor
+        response.headers["Link"] = f'<{next_url}>; rel="next"'
+    return jobs
+
+
+def _encode_cursor(key: tuple[datetime, int]) -> str:
+    created_at, job_id = key
+    raw = f"{created_at.isoformat()}|{job_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> tuple[datetime, int]:
     try:
-        if latest:
-            return get_all_unique_jobs(dbsession)
-        jobs = list(job._mapping for job in get_all_jobs(dbsession))
-    except Exception as e:
-        logger.error(f"Failed to get jobs: {e}")
-    return jobs[:10]  # make sure to sort by date descending
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, job_id = raw.decode().split("|")
+        return datetime.fromisoformat(created_at), int(job_id)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=[{"msg": f"Invalid cursor: {cursor!r}"}],
+        )
 
 
 @router.get("/{job_id}", response_model=JobRead)
-def get_job(job_id: int, dbsession: DbSession) -> JobRead:
+async def get_job(job_id: int, dbsession: AsyncDbSession) -> JobRead:
     """Retrieve a single job by ID."""
-    job = get_job_by_id(dbsession, job_id)
+    job = await get_job_by_id(dbsession, job_id)
     if job is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -75,10 +125,13 @@ def get_job(job_id: int, dbsession: DbSession) -> JobRead:
 async def update_job(
     job_id: int,
     status_update: JobStatusUpdate,
-    dbsession: DbSession,
+    dbsession: AsyncDbSession,
 ) -> JobRead:
     """Update the status of an existing job."""
-    job = update_job_status(dbsession, job_id, status_update.job_status)
+    try:
+        job = await update_job_status(dbsession, job_id, status_update.job_status)
+    except JobSupersededError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
     if job is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -0,0 +1,133 @@
+"""Build log API endpoints"""
+
+import asyncio
+import logging
+
+from fastapi import APIRouter, Body, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+
+from buildserver.api.jobs.models import JobStatus
+from buildserver.config import LOG_LEVEL, LOG_STORE_ROOT, LOG_FOLLOW_POLL_INTERVAL
+from buildserver.database.core import AsyncSessionLocal, DbSession
+from buildserver.logs.logstore import LogStore, LogOffsetError
+from buildserver.services import async_builds
+from buildserver.services.builds import get_job_by_id
+
+logger = logging.getLogger(__name__)
+logger.setLevel(LOG_LEVEL)
+
+router = APIRouter(prefix="/jobs")
+
+log_store = LogStore(LOG_STORE_ROOT)
+
+FOLLOW_CHUNK_BYTES = 256 * 1024
+FINISHED = (JobStatus.SUCCEEDED, JobStatus.FAILED)
+
+
+def _ensure_job(dbsession: DbSession, job_id: int) -> None:
+    if get_job_by_id(dbsession, job_id) is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Job with id {job_id} not found",
+        )
+
+
+@router.post("/{job_id}/logs")
+def append_log(
+    job_id: int,
+    dbsession: DbSession,
+    data: bytes = Body(..., media_type="application/octet-stream"),
+    offset: int | None = Query(
+        None,
+        ge=0,
+        description="Position of the body in the log, for idempotent retries",
+    ),
+) -> dict:
+    """Append a batch of raw build output to a job's log."""
+    _ensure_job(dbsession, job_id)
+    try:
+        size = log_store.append(job_id, data, offset)
+    except LogOffsetError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    return {"size": size}
+
+
+@router.get("/{job_id}/logs")
+def get_log(
+    job_id: int,
+    dbsession: DbSession,
+    start: int | None = Query(None, ge=0, description="First byte to return"),
+    end: int | None = Query(None, ge=0, description="Byte to stop before"),
+    start_line: int | None = Query(None, ge=0, description="First line to return"),
+    end_line: int | None = Query(None, ge=0, description="Line to stop before"),
+    tail: int | None = Query(None, ge=0, description="Return only the last N lines"),
+) -> StreamingResponse:
+    """
+    Retrieve a job's build log, or part of it.
+
+    Select at most one of a byte range (start/end), a line range
+    (start_line/end_line) or tail. Without any of them the whole log is
+    returned. The body is streamed a segment at a time, so memory use doesn't
+    grow with the size of the log.
+    """
+    _ensure_job(dbsession, job_id)
+    modes = [
+        start is not None or end is not None,
+        start_line is not None or end_line is not None,
+        tail is not None,
+    ]
+    if sum(modes) > 1:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=[{"msg": "Use only one of a byte range, a line range or tail"}],
+        )
+    if tail is not None:
+        begin, stop = log_store.tail_offset(job_id, tail), None
+    elif modes[1]:
+        begin = log_store.line_offset(job_id, start_line or 0)
+        stop = None if end_line is None else log_store.line_offset(job_id, end_line)
+    else:
+        begin, stop = start or 0, end
+    size = log_store.size(job_id)
+    # the body ends where the log did when X-Log-Size was read
+    stop = size if stop is None else min(stop, size)
+    return StreamingResponse(
+        log_store.iter_bytes(job_id, begin, stop),
+        media_type="text/plain; charset=utf-8",
+        headers={"X-Log-Size": str(size)},
+    )
+
+
+@router.get("/{job_id}/logs/follow")
+def follow_log(
+    job_id: int,
+    dbsession: DbSession,
+    start: int = Query(0, ge=0, description="Byte to start streaming from"),
+) -> StreamingResponse:
+    """Stream a job's log as it grows until the job finishes."""
+    _ensure_job(dbsession, job_id)
+    return StreamingResponse(
+        _follow(job_id, start), media_type="text/plain; charset=utf-8"
+    )
+
+
+async def _follow(job_id: int, position: int):
+    # file reads and decompression in the threadpool, every follower shares
+    # the event loop
+    while True:
+        size = await run_in_threadpool(log_store.size, job_id)
+        if position < size:
+            end = min(size, position + FOLLOW_CHUNK_BYTES)
+            yield await run_in_threadpool(log_store.read_bytes, job_id, position, end)
+            position = end
+            continue
+        # polled from the event loop, so through the async session
+        async with AsyncSessionLocal() as session:
+            job = await async_builds.get_job_by_id(session, job_id)
+        if job is None or job.job_status in FINISHED:
+            # the runner ships its last batch before reporting the final status
+            if await run_in_threadpool(log_store.size, job_id) == position:
+                return
+            continue
+        await asyncio.sleep(LOG_FOLLOW_POLL_INTERVAL)
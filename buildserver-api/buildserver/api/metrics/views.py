@@ -0,0 +1,47 @@
+"""Operational metrics in the Prometheus text format"""
+
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from buildserver.database.core import async_engine, engine
+from buildserver.database.pool import pool_stats
+
+router = APIRouter()
+
+# name suffix, type and help of each pool statistic
+POOL_METRICS = {
+    "size": ("gauge", "Connections the pool keeps open"),
+    "checked_out": ("gauge", "Connections currently in use"),
+    "checked_in": ("gauge", "Idle connections in the pool"),
+    "overflow": ("gauge", "Connections open beyond the pool size"),
+    "checkouts": ("counter", "Connections handed out"),
+    "wait_seconds": ("counter", "Time spent waiting for a connection"),
+    "max_wait_seconds": ("gauge", "Longest wait for a connection"),
+    "overflows": ("counter", "Connections opened beyond the pool size"),
+    "timeouts": ("counter", "Checkouts that timed out on an exhausted pool"),
+}
+
+
+def render_pool_metrics() -> str:
+    """Statistics of the sync and async database pools, one series per pool."""
+    stats = {
+        "sync": pool_stats(engine.pool),
+        "async": pool_stats(async_engine.pool),
+    }
+    lines = []
+    for name, (kind, description) in POOL_METRICS.items():
+        metric = f"buildserver_db_pool_{name}"
+        if kind == "counter":
+            metric += "_total"
+        lines.append(f"# HELP {metric} {description}")
+        lines.append(f"# TYPE {metric} {kind}")
+        for pool, values in stats.items():
+            if name in values:
+                lines.append(f'{metric}{{pool="{pool}"}} {values[name]}')
+    return "\n".join(lines) + "\n"
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def get_metrics() -> str:
+    """Database pool metrics for Prometheus to scrape."""
+    return render_pool_metrics()
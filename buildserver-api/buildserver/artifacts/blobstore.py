@@ -0,0 +1,388 @@
+"""
+Content-addressed blob storage
+
+Artifact contents are stored once per distinct SHA-256 digest under
+BLOB_STORE_ROOT/<aa>/<bb>/<digest>, where aa and bb are the first two pairs of
+hex digits, so no directory grows past a few hundred entries. A binary that
+doesn't change between commits is therefore kept on disk once, however many
+builds produced it. Which blobs are still in use is tracked in the database,
+see buildserver.services.blobs.
+
+Blobs can also be uploaded in pieces. An upload is a file under
+BLOB_STORE_ROOT/uploads/ that request bodies are streamed into and hashed as
+they arrive; finishing it checks the digest and renames it into place, so the
+contents are never held in memory and never copied twice.
+"""
+
+import errno
+import fcntl
+import hashlib
+import logging
+import os
+import re
+import shutil
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator
+
+from buildserver.config import LOG_LEVEL
+
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+logger.setLevel(LOG_LEVEL)
+
+FICLONE = 0x40049409  # linux/fs.h, clone a whole file on btrfs/xfs/...
+DIGEST = re.compile(r"[0-9a-f]{64}")
+UPLOAD_ID = re.compile(r"[0-9a-f]{32}")
+UPLOADS = "uploads"
+
+
+class InvalidDigestError(Exception):
+    """Raised when a digest is not a lowercase hex SHA-256."""
+
+    pass
+
+
+class UploadNotFoundError(Exception):
+    """Raised when an upload id is unknown, finished or expired."""
+
+    pass
+
+
+class UploadConflictError(Exception):
+    """Raised when an upload would leave a gap or is already being written."""
+
+    pass
+
+
+class DigestMismatchError(Exception):
+    """Raised when an upload's contents don't hash to the digest claimed."""
+
+    pass
+
+
+class Upload:
+    """An in-progress upload, appended to in order and hashed as it arrives."""
+
+    def __init__(self, f, hasher, skip: int):
+        self._file = f
+        self._hasher = hasher
+        self._skip = skip
+        self.size = f.tell()
+
+    def write(self, data: bytes) -> None:
+        if self._skip:
+            # a retried request resending bytes the upload already has
+            dropped = min(self._skip, len(data))
+            data = data[dropped:]
+            self._skip -= dropped
+        if data:
+            self._file.write(data)
+            self._hasher.update(data)
+            self.size += len(data)
+
+
+class BlobStore:
+    """Immutable files keyed by the SHA-256 of their content."""
+
+    def __init__(self, root: Path | str):
+        self.root = Path(root)
+        # hash state of uploads this process wrote to, keyed by id, with the
+        # size it covers. Another process appending invalidates it, in which
+        # case the upload is hashed again from disk.
+        self._hashers: dict[str, tuple[int, "hashlib._Hash"]] = {}
+
+    def path(self, digest: str) -> Path:
+        """
+        Where the blob with digest is stored, whether or not it exists.
+
+        Raises:
+            InvalidDigestError: If digest is not a SHA-256 hex digest.
+        """
+        if not DIGEST.fullmatch(digest):
+            raise InvalidDigestError(f"Not a sha256 hex digest: {digest!r}")
+        return self.root / digest[:2] / digest[2:4] / digest
+
+    def exists(self, digest: str) -> bool:
+        return self.path(digest).is_file()
+
+    def touch(self, digest: str) -> bool:
+        """
+        Mark a blob as about to be referenced, keeping the garbage collector
+        away from it for a grace period.
+
+        Returns:
+            Whether the blob exists.
+        """
+        try:
+            os.utime(self.path(digest))
+        except FileNotFoundError:
+            return False
+        return True
+
+    def put(self, src: Path, allow_link: bool = False) -> tuple[str, bool]:
+        """
+        Add the contents of src to the store.
+
+        src is hashed first and nothing is written if a blob with that digest
+        already exists. Its modification time is refreshed instead, which
+        tells the garbage collector the blob is about to be referenced.
+
+        Args:
+            src: File to store.
+            allow_link: src won't be modified afterwards, so it may be hard
+                linked into the store instead of copied.
+
+        Returns:
+            The digest and whether a new blob was written.
+        """
+        digest = file_digest(src)
+        dst = self.path(digest)
+        if self.touch(digest):
+            logger.debug("Blob %s already stored, skipping %s", digest, src)
+            return digest, False
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        # readers must never see a partial blob, so write beside it and
+        # rename into place
+        tmp = dst.with_name(f".{digest}.{uuid.uuid4().hex}.tmp")
+        try:
+            copy_artifact(Path(src), tmp, allow_link=allow_link)
+            os.replace(tmp, dst)
+            os.utime(dst)  # a linked src keeps its own mtime
+        finally:
+            tmp.unlink(missing_ok=True)
+        logger.debug("Stored %s as blob %s", src, digest)
+        return digest, True
+
+    def delete(self, digest: str) -> bool:
+        """Remove a blob. Returns False if it didn't exist."""
+        try:
+            self.path(digest).unlink()
+        except FileNotFoundError:
+            return False
+        return True
+
+    def digests(self, older_than: float | None = None) -> Iterator[str]:
+        """
+        Digests of every stored blob.
+
+        Args:
+            older_than: Only yield blobs last modified before this timestamp.
+        """
+        for root, dirs, files in os.walk(self.root):
+            if root == str(self.root) and UPLOADS in dirs:
+                dirs.remove(UPLOADS)
+            for name in files:
+                if not DIGEST.fullmatch(name):
+                    continue  # an in-flight .tmp file
+                if older_than is not None:
+                    try:
+                        mtime = os.stat(os.path.join(root, name)).st_mtime
+                    except FileNotFoundError:
+                        continue
+                    if mtime >= older_than:
+                        continue
+                yield name
+
+    def modified_since(self, digest: str, timestamp: float) -> bool:
+        """Whether the blob was stored or put again after timestamp."""
+        try:
+            return self.path(digest).stat().st_mtime >= timestamp
+        except FileNotFoundError:
+            return False
+
+    def start_upload(self) -> str:
+        """Begin an upload. Returns its id."""
+        upload_id = uuid.uuid4().hex
+        (self.root / UPLOADS).mkdir(parents=True, exist_ok=True)
+        self._upload_path(upload_id).touch(exist_ok=False)
+        return upload_id
+
+    def upload_size(self, upload_id: str) -> int:
+        """
+        Bytes received so far, where an interrupted upload resumes from.
+
+        Raises:
+            UploadNotFoundError: If there is no such upload.
+        """
+        try:
+            return self._upload_path(upload_id).stat().st_size
+        except FileNotFoundError:
+            raise UploadNotFoundError(f"No upload {upload_id}") from None
+
+    @contextmanager
+    def open_upload(self, upload_id: str, offset: int) -> Iterator[Upload]:
+        """
+        Append to an upload.
+
+        Args:
+            upload_id: The upload to append to.
+            offset: Position in the blob of the first byte that will be
+                written. Bytes the upload already has are skipped, so
+                retried requests are idempotent.
+
+        Raises:
+            UploadNotFoundError: If there is no such upload.
+            UploadConflictError: If offset is past the end of the upload, or
+                another request is writing to it.
+        """
+        with self._locked_upload(upload_id, "ab") as f:
+            size = f.tell()
+            if offset > size:
+                raise UploadConflictError(
+                    f"offset {offset} is past the end of the upload ({size})"
+                )
+            upload = Upload(f, self._upload_hasher(upload_id, size), size - offset)
+            try:
+                yield upload
+            finally:
+                f.flush()
+                self._hashers[upload_id] = (upload.size, upload._hasher)
+
+    def finish_upload(self, upload_id: str, digest: str) -> tuple[str, int]:
+        """
+        Verify an upload and move it into the store as a blob.
+
+        Returns:
+            The digest and size of the blob.
+
+        Raises:
+            UploadNotFoundError: If there is no such upload.
+            UploadConflictError: If another request is writing to it.
+            DigestMismatchError: If the contents don't match digest. The
+                upload is discarded.
+        """
+        dst = self.path(digest)
+        with self._locked_upload(upload_id, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            actual = self._upload_hasher(upload_id, size).hexdigest()
+            self._hashers.pop(upload_id, None)
+            src = self._upload_path(upload_id)
+            if actual != digest:
+                src.unlink()
+                raise DigestMismatchError(
+                    f"Upload {upload_id} has digest {actual}, not {digest}"
+                )
+            if self.touch(digest):
+                src.unlink()
+            else:
+                dst.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(src, dst)
+        logger.debug("Upload %s stored as blob %s", upload_id, digest)
+        return digest, size
+
+    def expire_uploads(self, older_than: float) -> int:
+        """Discard uploads last written to before a timestamp. Returns how many."""
+        expired = 0
+        try:
+            entries = list(os.scandir(self.root / UPLOADS))
+        except FileNotFoundError:
+            return 0
+        for entry in entries:
+            try:
+                if entry.stat().st_mtime >= older_than:
+                    continue
+                os.unlink(entry.path)
+            except FileNotFoundError:
+                continue
+            self._hashers.pop(entry.name, None)
+            expired += 1
+        return expired
+
+    def _upload_path(self, upload_id: str) -> Path:
+        if not UPLOAD_ID.fullmatch(upload_id):
+            raise UploadNotFoundError(f"No upload {upload_id}")
+        return self.root / UPLOADS / upload_id
+
+    @contextmanager
+    def _locked_upload(self, upload_id: str, mode: str) -> Iterator:
+        try:
+            f = open(self._upload_path(upload_id), mode)
+        except FileNotFoundError:
+            raise UploadNotFoundError(f"No upload {upload_id}") from None
+        with f:
+            try:
+                # never wait, the caller is usually on the event loop
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                raise UploadConflictError(
+                    f"Upload {upload_id} is being written by another request"
+                ) from None
+            # it may have been finished, i.e. renamed into a blob, between
+            # the open and the lock
+            try:
+                same = os.path.samefile(f.name, f.fileno())
+            except FileNotFoundError:
+                same = False
+            if not same:
+                raise UploadNotFoundError(f"No upload {upload_id}")
+            yield f
+
+    def _upload_hasher(self, upload_id: str, size: int) -> "hashlib._Hash":
+        cached = self._hashers.get(upload_id)
+        if cached is not None and cached[0] == size:
+            return cached[1]
+        with open(self._upload_path(upload_id), "rb") as f:
+            return hashlib.file_digest(f, "sha256")
+
+
+def file_digest(path: Path) -> str:
+    """Hex SHA-256 of a file's contents."""
+    with open(path, "rb") as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+
+def copy_artifact(src: Path, dst: Path, allow_link: bool = False) -> str:
+    """
+    Copy src to dst, preferring methods that don't move the data.
+
+    In order: a hard link, if allow_link is set because src won't be
+    modified afterwards, a reflink (copy-on-write clone), an in-kernel
+    copy_file_range, and finally a regular read/write copy. Each falls
+    through to the next when the filesystem or the two paths' devices don't
+    support it.
+
+    Returns:
+        The method used: "reflink", "link", "copy_file_range" or "copy".
+    """
+    dst.unlink(missing_ok=True)
+    if allow_link:
+        try:
+            os.link(src, dst)
+            return "link"
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP):
+                raise
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        method = _clone_or_copy(fsrc.fileno(), fdst.fileno())
+    shutil.copymode(src, dst)
+    return method
+
+
+def _clone_or_copy(src_fd: int, dst_fd: int) -> str:
+    try:
+        fcntl.ioctl(dst_fd, FICLONE, src_fd)
+        return "reflink"
+    except OSError:
+        pass
+    size = os.fstat(src_fd).st_size
+    try:
+        copied = 0
+        while copied < size:
+            n = os.copy_file_range(src_fd, dst_fd, size - copied)
+            if n == 0:
+                break
+            copied += n
+        return "copy_file_range"
+    except (AttributeError, OSError):
+        # not Linux, or a filesystem pair the kernel can't copy between
+        os.lseek(src_fd, 0, os.SEEK_SET)
+        os.lseek(dst_fd, 0, os.SEEK_SET)
+        os.ftruncate(dst_fd, 0)
+    with (
+        os.fdopen(os.dup(src_fd), "rb") as fsrc,
+        os.fdopen(os.dup(dst_fd), "wb") as fdst,
+    ):
+        shutil.copyfileobj(fsrc, fdst)
+    return "copy"
@@ -0,0 +1,121 @@
+"""
+Reading compressed artifact bundles
+
+A bundle is a .tar.zst file written by the runner, see runner.bundle. Every
+tar member is its own zstd frame, and two trailing skippable frames hold a
+JSON index of the members and a footer with the index's offset. A single
+member is extracted by seeking to its frame and decompressing just that, so
+the cost doesn't depend on the size of the bundle. Reading the index needs no
+decompression at all.
+
+Extracting members needs the optional zstandard package.
+"""
+
+import json
+import logging
+import struct
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterator
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from buildserver.config import LOG_LEVEL
+
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+logger.setLevel(LOG_LEVEL)
+
+INDEX_MAGIC = 0x184D2A5E
+FOOTER_MAGIC = 0x184D2A5F
+FOOTER_TAG = b"bsbndl01"
+SKIPPABLE_HEADER = struct.Struct("<II")  # magic, payload size
+FOOTER = struct.Struct("<IIQ8s")  # magic, payload size, index offset, tag
+READ_BYTES = 256 * 1024
+
+
+class BundleError(Exception):
+    """Raised when a file is not a readable bundle."""
+
+    pass
+
+
+@dataclass
+class Member:
+    name: str
+    size: int
+    mode: int
+    digest: str  # sha256 of the member's contents
+    offset: int  # of its zstd frame in the bundle
+    length: int  # of its zstd frame
+    header: int  # length of its tar header inside the frame
+
+
+def available() -> bool:
+    return zstandard is not None
+
+
+def read_index(path: Path) -> list[Member]:
+    """
+    The members of a bundle, in archive order.
+
+    Raises:
+        BundleError: If path has no valid bundle footer or index.
+    """
+    with open(path, "rb") as f:
+        size = f.seek(0, 2)
+        if size < FOOTER.size:
+            raise BundleError(f"{path} is too small to be a bundle")
+        f.seek(size - FOOTER.size)
+        magic, _, index_offset, tag = FOOTER.unpack(f.read(FOOTER.size))
+        if magic != FOOTER_MAGIC or tag != FOOTER_TAG:
+            raise BundleError(f"{path} has no bundle footer")
+        f.seek(index_offset)
+        header = f.read(SKIPPABLE_HEADER.size)
+        if len(header) != SKIPPABLE_HEADER.size:
+            raise BundleError(f"{path} has a truncated index")
+        magic, length = SKIPPABLE_HEADER.unpack(header)
+        if magic != INDEX_MAGIC:
+            raise BundleError(f"{path} has no bundle index")
+        try:
+            return [Member(**m) for m in json.loads(f.read(length))]
+        except (ValueError, TypeError) as e:
+            raise BundleError(f"{path} has a corrupt index: {e}") from e
+
+
+def find_member(index: list[Member], name: str) -> Member | None:
+    for member in index:
+        if member.name == name:
+            return member
+    return None
+
+
+def read_member(path: Path, member: Member) -> Iterator[bytes]:
+    """
+    Stream one member's contents, decompressing only its own frame.
+
+    Raises:
+        BundleError: If zstandard is not installed.
+    """
+    if zstandard is None:
+        raise BundleError("Extracting bundle members needs zstandard")
+    with open(path, "rb") as f:
+        f.seek(member.offset)
+        reader = zstandard.ZstdDecompressor().stream_reader(f, closefd=False)
+        skip = member.header
+        remaining = member.header + member.size
+        while remaining:
+            chunk = reader.read(min(READ_BYTES, remaining))
+            if not chunk:
+                raise BundleError(f"Member {member.name} of {path} is truncated")
+            remaining -= len(chunk)
+            if skip:
+                # the member's tar header
+                dropped = min(skip, len(chunk))
+                chunk = chunk[dropped:]
+                skip -= dropped
+            if chunk:
+                yield chunk
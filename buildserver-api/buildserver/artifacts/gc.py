@@ -0,0 +1,42 @@
+"""
+Artifact retention and blob garbage collector
+
+Periodically deletes the artifacts retention rules no longer keep, see
+buildserver.services.retention, then the blobs from the artifact store that
+no artifact references anymore, see buildserver.services.blobs.collect_garbage.
+"""
+
+import logging
+import time
+
+from sqlalchemy.exc import SQLAlchemyError
+
+from buildserver.artifacts.artifactstore import blob_store
+from buildserver.config import LOG_LEVEL, BLOB_GC_INTERVAL
+from buildserver.database.core import create_session
+from buildserver.services.blobs import collect_garbage
+from buildserver.services.retention import apply_retention
+
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+logger.setLevel(LOG_LEVEL)
+
+
+def run():
+    """Apply retention and collect unreferenced blobs every BLOB_GC_INTERVAL seconds."""
+    logger.info("Started blob garbage collector")
+    while True:
+        time.sleep(BLOB_GC_INTERVAL)
+        session = create_session()
+        try:
+            # committed on its own, the collector then only sees evictions
+            # that are final
+            apply_retention(session)
+            session.commit()
+            collect_garbage(session, blob_store)
+            session.commit()
+        except (OSError, SQLAlchemyError) as e:
+            session.rollback()
+            logger.error("Blob garbage collection failed: %s", e)
+        finally:
+            session.close()
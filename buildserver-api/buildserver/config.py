@@ -1,6 +1,8 @@
 """Configuration values loaded from environment variables"""
 
 import logging
+import os
+import tempfile
 
 from starlette.config import Config as StarletteConfig
 from starlette.datastructures import Secret
@@ -18,6 +20,25 @@ DATABASE_URI = (
     f"postgresql+psycopg2://{DATABASE_USER}:{DATABASE_PASSWORD}"
     f"@{DATABASE_HOSTNAME}:{DATABASE_PORT}/{DATABASE_NAME}"
 )
+# Same database through asyncpg, for endpoints that run on the event loop
+ASYNC_DATABASE_URI = (
+    f"postgresql+asyncpg://{DATABASE_USER}:{DATABASE_PASSWORD}"
+    f"@{DATABASE_HOSTNAME}:{DATABASE_PORT}/{DATABASE_NAME}"
+)
+# Connection pool of each engine, sync and async. Connections beyond the pool
+# size are opened up to the overflow limit, then checkouts wait up to the
+# timeout in seconds. A pool size of 0 opens a connection per checkout, for
+# when an external pooler such as PgBouncer does the pooling
+DATABASE_POOL_SIZE = config("DATABASE_POOL_SIZE", default=5, cast=int)
+DATABASE_MAX_OVERFLOW = config("DATABASE_MAX_OVERFLOW", default=10, cast=int)
+DATABASE_POOL_TIMEOUT = config("DATABASE_POOL_TIMEOUT", default=30.0, cast=float)
+# Seconds after which a connection is replaced, -1 keeps connections forever
+DATABASE_POOL_RECYCLE = config("DATABASE_POOL_RECYCLE", default=30 * 60, cast=int)
+# Test connections on checkout, replacing those the server has closed
+DATABASE_POOL_PRE_PING = config("DATABASE_POOL_PRE_PING", default=True, cast=bool)
+# Set when connecting through PgBouncer in transaction pooling mode: asyncpg
+# doesn't cache prepared statements, which wouldn't outlive the transaction
+DATABASE_PGBOUNCER = config("DATABASE_PGBOUNCER", default=False, cast=bool)
 
 SLEEP_FOR = config("SLEEP_FOR", default=60 * 15, cast=int)
 TIMEOUT = config("TIMEOUT", default=60, cast=int)
@@ -28,3 +49,34 @@ RABBITMQ_USER = config("RABBITMQ_USER", default="guest")
 RABBITMQ_PASSWORD = config("RABBITMQ_PASSWORD", default="guest", cast=Secret)
 
 ARTIFACT_REPOSITORY_ROOT = config("ARTIFACT_REPOSITORY_ROOT", default="")
+# Artifact contents, stored once per distinct sha256
+BLOB_STORE_ROOT = config(
+    "BLOB_STORE_ROOT", default=os.path.join(ARTIFACT_REPOSITORY_ROOT, "blobs")
+)
+# Unreferenced blobs are kept this many seconds before they are deleted, so an
+# artifact being registered for an existing blob can't lose it to the collector
+BLOB_GC_GRACE = config("BLOB_GC_GRACE", default=60 * 60, cast=int)
+BLOB_GC_INTERVAL = config("BLOB_GC_INTERVAL", default=60 * 15, cast=int)
+# Retention, enforced before every collection. 0 disables a rule.
+# Artifacts and bundles of all but the N most recently built commits of a
+# repository are deleted
+ARTIFACT_KEEP_COMMITS = config("ARTIFACT_KEEP_COMMITS", default=0, cast=int)
+# Bytes of artifacts a repository may keep, and bytes of blobs the whole store
+# may hold. Over quota, the least recently downloaded artifacts are deleted
+# first, never those of a repository's latest successful build
+ARTIFACT_REPOSITORY_QUOTA = config("ARTIFACT_REPOSITORY_QUOTA", default=0, cast=int)
+ARTIFACT_STORE_QUOTA = config("ARTIFACT_STORE_QUOTA", default=0, cast=int)
+# Downloads refresh an artifact's access time at most this often, in seconds
+ARTIFACT_ACCESS_RESOLUTION = config(
+    "ARTIFACT_ACCESS_RESOLUTION", default=60 * 60, cast=int
+)
+# Internal nginx location aliased to BLOB_STORE_ROOT, e.g. /_blobs/. When set,
+# downloads are handed to nginx with X-Accel-Redirect instead of being served
+# by the API
+BLOB_ACCEL_REDIRECT = config("BLOB_ACCEL_REDIRECT", default="")
+
+LOG_STORE_ROOT = config(
+    "LOG_STORE_ROOT",
+    default=os.path.join(tempfile.gettempdir(), "buildserver-log-store"),
+)
+LOG_FOLLOW_POLL_INTERVAL = config("LOG_FOLLOW_POLL_INTERVAL", default=1.0, cast=float)
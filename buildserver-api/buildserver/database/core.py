@@ -1,15 +1,71 @@
 """Database engine, session, and base model configuration"""
 
 from typing import Annotated
-from sqlalchemy import create_engine
+from uuid import uuid4
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import DeclarativeBase, sessionmaker, scoped_session, Session
 from fastapi import Depends
-from buildserver.config import DATABASE_URI
+from buildserver.config import (
+    DATABASE_URI,
+    ASYNC_DATABASE_URI,
+    DATABASE_POOL_SIZE,
+    DATABASE_MAX_OVERFLOW,
+    DATABASE_POOL_TIMEOUT,
+    DATABASE_POOL_RECYCLE,
+    DATABASE_POOL_PRE_PING,
+    DATABASE_PGBOUNCER,
+)
+from buildserver.database.pool import (
+    MeteredAsyncQueuePool,
+    MeteredNullPool,
+    MeteredQueuePool,
+)
+
+
+def _pool_options(poolclass: type) -> dict:
+    """Keyword arguments for create_engine from the DATABASE_POOL_* settings."""
+    options = {
+        "pool_recycle": DATABASE_POOL_RECYCLE,
+        "pool_pre_ping": DATABASE_POOL_PRE_PING,
+    }
+    if DATABASE_POOL_SIZE <= 0:
+        return options | {"poolclass": MeteredNullPool}
+    return options | {
+        "poolclass": poolclass,
+        "pool_size": DATABASE_POOL_SIZE,
+        "max_overflow": DATABASE_MAX_OVERFLOW,
+        "pool_timeout": DATABASE_POOL_TIMEOUT,
+    }
+
 
-engine = create_engine(DATABASE_URI)
+def _async_connect_args() -> dict:
+    if not DATABASE_PGBOUNCER:
+        return {}
+    # PgBouncer hands each transaction to any server connection, where
+    # statements prepared by another client may exist under the same name or
+    # not at all: don't cache them, and name them uniquely
+    return {
+        "statement_cache_size": 0,
+        "prepared_statement_cache_size": 0,
+        "prepared_statement_name_func": lambda: f"__asyncpg_{uuid4()}__",
+    }
+
+
+engine = create_engine(DATABASE_URI, **_pool_options(MeteredQueuePool))
 session_factory = sessionmaker(bind=engine)
 SessionLocal = scoped_session(session_factory)
 
+# for async def endpoints: queries await the database instead of blocking the
+# event loop, and don't take a threadpool worker either
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URI,
+    connect_args=_async_connect_args(),
+    **_pool_options(MeteredAsyncQueuePool),
+)
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, expire_on_commit=False)
+
 
 def get_session():
     with SessionLocal() as session:
@@ -30,12 +86,110 @@ def create_session() -> scoped_session[Session]:
 DbSession = Annotated[scoped_session, Depends(get_session)]
 
 
+async def get_async_session():
+    async with AsyncSessionLocal() as session:
+        try:
+            yield session
+            await session.commit()
+        except Exception as e:
+            await session.rollback()
+            raise e
+
+
+AsyncDbSession = Annotated[AsyncSession, Depends(get_async_session)]
+
+
 class Base(DeclarativeBase):
     pass
 
 
 def init_db():
-    """Create all database tables."""
-    from buildserver.api.jobs.models import Job, Artifact  # noqa: F401
+    """Create all database tables and bring existing ones up to date."""
+    from buildserver.api.jobs.models import (  # noqa: F401
+        Job,
+        Artifact,
+        Blob,
+        RepositoryLatestJob,
+        RepositoryLatestSuccess,
+    )
 
     Base.metadata.create_all(bind=engine)
+    # enum values can't be added inside a transaction block before Postgres 12
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text("ALTER TYPE jobstatus ADD VALUE IF NOT EXISTS 'SUPERSEDED'"))
+    with engine.begin() as conn:
+        # create_all only creates missing tables, add columns and indexes
+        # introduced since an existing database was created
+        conn.execute(
+            text(
+                "ALTER TABLE job ADD COLUMN IF NOT EXISTS "
+                "build_config VARCHAR(255) NOT NULL DEFAULT 'default'"
+            )
+        )
+        conn.execute(
+            text(
+                "ALTER TABLE artifact ADD COLUMN IF NOT EXISTS "
+                "digest VARCHAR(64) REFERENCES blob (digest)"
+            )
+        )
+        conn.execute(
+            text(
+                "ALTER TABLE job ADD COLUMN IF NOT EXISTS "
+                "bundle_digest VARCHAR(64) REFERENCES blob (digest)"
+            )
+        )
+        conn.execute(
+            text(
+                "ALTER TABLE artifact ADD COLUMN IF NOT EXISTS "
+                "job_id INTEGER REFERENCES job (job_id)"
+            )
+        )
+        conn.execute(text("ALTER TABLE artifact ADD COLUMN IF NOT EXISTS size BIGINT"))
+        for column in ("created_at", "last_accessed_at"):
+            conn.execute(
+                text(
+                    f"ALTER TABLE artifact ADD COLUMN IF NOT EXISTS {column} "
+                    "TIMESTAMP WITHOUT TIME ZONE DEFAULT now()"
+                )
+            )
+        # retried registrations used to record an artifact more than once,
+        # drop the copies and their blob references before the unique index
+        conn.execute(
+            text(
+                "WITH copies AS ("
+                "DELETE FROM artifact a USING artifact b "
+                "WHERE a.job_id = b.job_id AND a.artifact_path = b.artifact_path "
+                "AND a.artifact_id > b.artifact_id RETURNING a.digest) "
+                "UPDATE blob SET ref_count = blob.ref_count - released.n, "
+                "released_at = now() "
+                "FROM (SELECT digest, count(*) AS n FROM copies "
+                "WHERE digest IS NOT NULL GROUP BY digest) AS released "
+                "WHERE blob.digest = released.digest"
+            )
+        )
+        for table in (Job, Artifact, Blob):
+            for index in table.__table__.indexes:
+                index.create(bind=conn, checkfirst=True)
+        # fill the read models for jobs that finished before they existed
+        conn.execute(
+            text(
+                "INSERT INTO repository_latest_job "
+                "(git_repository_url, job_id, created_at) "
+                "SELECT DISTINCT ON (git_repository_url) "
+                "git_repository_url, job_id, created_at FROM job "
+                "WHERE job_status IN ('SUCCEEDED', 'FAILED') "
+                "ORDER BY git_repository_url, created_at DESC "
+                "ON CONFLICT (git_repository_url) DO NOTHING"
+            )
+        )
+        conn.execute(
+            text(
+                "INSERT INTO repository_latest_success "
+                "(git_repository_url, job_id, commit_hash, created_at) "
+                "SELECT DISTINCT ON (git_repository_url) "
+                "git_repository_url, job_id, commit_hash, created_at FROM job "
+                "WHERE job_status = 'SUCCEEDED' "
+                "ORDER BY git_repository_url, created_at DESC "
+                "ON CONFLICT (git_repository_url) DO NOTHING"
+            )
+        )
@@ -0,0 +1,115 @@
+"""
+Connection pools that keep count
+
+The sync and async engines use these pool classes instead of SQLAlchemy's
+defaults. They behave the same and additionally record how many checkouts
+there were, how long they waited for a connection, how often the pool had to
+open an overflow connection and how often a checkout timed out because the
+pool was exhausted. Together with the pool's live size and checked-out count
+these are exported by GET /metrics.
+"""
+
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+
+from sqlalchemy import exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool, QueuePool
+
+from buildserver.config import LOG_LEVEL
+
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+logger.setLevel(LOG_LEVEL)
+
+
+@dataclass
+class PoolMetrics:
+    """Counters of one pool, kept across dispose() and recreate()."""
+
+    checkouts: int = 0
+    wait_seconds: float = 0.0
+    max_wait_seconds: float = 0.0
+    overflows: int = 0
+    timeouts: int = 0
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def record_checkout(self, waited: float) -> None:
+        with self._lock:
+            self.checkouts += 1
+            self.wait_seconds += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+
+    def record_overflow(self) -> None:
+        with self._lock:
+            self.overflows += 1
+
+    def record_timeout(self) -> None:
+        with self._lock:
+            self.timeouts += 1
+
+
+class _MeteredPool:
+    """Mixin for a Pool class that fills in a PoolMetrics."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics()
+
+    def connect(self):
+        start = time.monotonic()
+        try:
+            connection = super().connect()
+        except exc.TimeoutError:
+            self.metrics.record_timeout()
+            logger.warning("Database pool exhausted: %s", self.status())
+            raise
+        self.metrics.record_checkout(time.monotonic() - start)
+        return connection
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+    def _inc_overflow(self) -> bool:
+        # QueuePool's hook for opening a connection beyond the pool size
+        # (while _overflow is still negative it is filling the pool itself)
+        opened = super()._inc_overflow()
+        if opened and self._overflow > 0:
+            self.metrics.record_overflow()
+        return opened
+
+
+class MeteredQueuePool(_MeteredPool, QueuePool):
+    pass
+
+
+class MeteredAsyncQueuePool(_MeteredPool, AsyncAdaptedQueuePool):
+    pass
+
+
+class MeteredNullPool(_MeteredPool, NullPool):
+    pass
+
+
+def pool_stats(pool) -> dict[str, float]:
+    """Live gauges and counters of a pool created from one of these classes."""
+    stats = {"checked_out": pool.checkedout() if hasattr(pool, "checkedout") else 0}
+    if isinstance(pool, QueuePool):
+        stats.update(
+            size=pool.size(),
+            checked_in=pool.checkedin(),
+            overflow=max(pool.overflow(), 0),
+        )
+    metrics = getattr(pool, "metrics", None)
+    if metrics is not None:
+        stats.update(
+            checkouts=metrics.checkouts,
+            wait_seconds=metrics.wait_seconds,
+            max_wait_seconds=metrics.max_wait_seconds,
+            overflows=metrics.overflows,
+            timeouts=metrics.timeouts,
+        )
+    return stats
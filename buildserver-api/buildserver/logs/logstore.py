@@ -0,0 +1,291 @@
+"""
+Build log storage
+
+Each job's log lives in LOG_STORE_ROOT/<job_id>/ as two append-only files:
+
+- log.z: independently zlib-compressed segments of at most SEGMENT_BYTES
+- log.idx: one fixed-size record per segment with its raw and compressed
+  offsets, lengths and the number of lines that precede it
+
+Byte ranges, line ranges and tails are served by bisecting the index and
+decompressing only the segments that overlap the request, so reading the end
+of a very large log touches a few hundred KiB no matter how big it is. Long
+ranges can be streamed with iter_bytes, one decompressed segment at a time.
+"""
+
+import bisect
+import fcntl
+import logging
+import os
+import struct
+import zlib
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterator
+
+from buildserver.config import LOG_LEVEL
+
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+logger.setLevel(LOG_LEVEL)
+
+SEGMENT_BYTES = 1024 * 1024
+# raw_offset, comp_offset, raw_len, comp_len, lines_before, newlines
+RECORD = struct.Struct("<QQIIQI")
+
+
+class LogOffsetError(Exception):
+    """Raised when an append would leave a gap in the log."""
+
+    pass
+
+
+@dataclass
+class Segment:
+    raw_offset: int
+    comp_offset: int
+    raw_len: int
+    comp_len: int
+    lines_before: int
+    newlines: int
+
+    @property
+    def raw_end(self) -> int:
+        return self.raw_offset + self.raw_len
+
+    @property
+    def comp_end(self) -> int:
+        return self.comp_offset + self.comp_len
+
+
+class _Index:
+    """Random access to a log.idx file without loading it."""
+
+    def __init__(self, fd: int):
+        self._fd = fd
+        self._len = os.fstat(fd).st_size // RECORD.size
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __getitem__(self, i: int) -> Segment:
+        if i < 0:
+            i += self._len
+        if not 0 <= i < self._len:
+            raise IndexError(i)
+        return Segment(*RECORD.unpack(os.pread(self._fd, RECORD.size, i * RECORD.size)))
+
+    def last(self) -> Segment | None:
+        return self[-1] if self._len else None
+
+
+class _Keyed:
+    """Sequence view that bisect can search by a Segment attribute."""
+
+    def __init__(self, index: _Index, attr: str):
+        self._index = index
+        self._attr = attr
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __getitem__(self, i: int) -> int:
+        return getattr(self._index[i], self._attr)
+
+
+class LogStore:
+    """Compressed, indexed, append-only build logs keyed by job_id."""
+
+    def __init__(self, root: Path | str):
+        self.root = Path(root)
+
+    def append(self, job_id: int, data: bytes, offset: int | None = None) -> int:
+        """
+        Append data to a job's log.
+
+        Args:
+            job_id: The job the output belongs to.
+            data: Raw log bytes.
+            offset: Position of data in the log as the sender sees it. Bytes
+                the store already has are skipped, so retried uploads are
+                idempotent.
+
+        Returns:
+            The size of the log after the append.
+
+        Raises:
+            LogOffsetError: If offset is past the end of the stored log.
+        """
+        log_dir = self.root / str(job_id)
+        log_dir.mkdir(parents=True, exist_ok=True)
+        with _locked(log_dir):
+            with (
+                open(log_dir / "log.idx", "ab+") as idx,
+                open(log_dir / "log.z", "ab+") as log,
+            ):
+                index = _Index(idx.fileno())
+                last = index.last()
+                size = last.raw_end if last else 0
+                if offset is not None:
+                    if offset > size:
+                        raise LogOffsetError(
+                            f"offset {offset} is past the end of the log ({size})"
+                        )
+                    data = data[size - offset :]
+                if not data:
+                    return size
+                # drop anything a crashed append wrote past the last record
+                idx.truncate(len(index) * RECORD.size)
+                comp_offset = last.comp_end if last else 0
+                log.truncate(comp_offset)
+                lines = last.lines_before + last.newlines if last else 0
+                for start in range(0, len(data), SEGMENT_BYTES):
+                    raw = data[start : start + SEGMENT_BYTES]
+                    comp = zlib.compress(raw)
+                    log.write(comp)
+                    segment = Segment(
+                        size, comp_offset, len(raw), len(comp), lines, raw.count(b"\n")
+                    )
+                    idx.write(RECORD.pack(*vars(segment).values()))
+                    size += len(raw)
+                    comp_offset += len(comp)
+                    lines += segment.newlines
+                log.flush()
+                idx.flush()
+                return size
+
+    def size(self, job_id: int) -> int:
+        """Size in bytes of the uncompressed log, 0 if there is none."""
+        with self._open(job_id) as (index, _):
+            last = index.last()
+            return last.raw_end if last else 0
+
+    def read_bytes(self, job_id: int, start: int = 0, end: int | None = None) -> bytes:
+        """Return bytes [start, end) of the uncompressed log."""
+        with self._open(job_id) as (index, log_fd):
+            return self._read_range(index, log_fd, start, end)
+
+    def iter_bytes(
+        self, job_id: int, start: int = 0, end: int | None = None
+    ) -> Iterator[bytes]:
+        """
+        Yield bytes [start, end) of the uncompressed log, a segment at a time.
+
+        Without end, iteration stops at the end of the log as it was when
+        iteration started.
+        """
+        with self._open(job_id) as (index, log_fd):
+            yield from self._iter_range(index, log_fd, start, end)
+
+    def read_lines(self, job_id: int, start: int = 0, end: int | None = None) -> bytes:
+        """Return lines [start, end) of the log, counting from 0."""
+        with self._open(job_id) as (index, log_fd):
+            begin = self._line_offset(index, log_fd, start)
+            stop = None if end is None else self._line_offset(index, log_fd, end)
+            return self._read_range(index, log_fd, begin, stop)
+
+    def line_offset(self, job_id: int, line: int) -> int:
+        """Byte offset at which line `line` starts, counting from 0."""
+        with self._open(job_id) as (index, log_fd):
+            return self._line_offset(index, log_fd, line)
+
+    def tail(self, job_id: int, lines: int) -> bytes:
+        """Return the last `lines` lines of the log."""
+        with self._open(job_id) as (index, log_fd):
+            begin = self._tail_offset(index, log_fd, lines)
+            return self._read_range(index, log_fd, begin, None)
+
+    def tail_offset(self, job_id: int, lines: int) -> int:
+        """Byte offset at which the last `lines` lines of the log start."""
+        with self._open(job_id) as (index, log_fd):
+            return self._tail_offset(index, log_fd, lines)
+
+    @contextmanager
+    def _open(self, job_id: int) -> Iterator[tuple[_Index, int]]:
+        log_dir = self.root / str(job_id)
+        try:
+            idx_fd = os.open(log_dir / "log.idx", os.O_RDONLY)
+        except FileNotFoundError:
+            idx_fd = os.open(os.devnull, os.O_RDONLY)
+        try:
+            index = _Index(idx_fd)
+            log_fd = os.open(log_dir / "log.z", os.O_RDONLY) if len(index) else -1
+            try:
+                yield index, log_fd
+            finally:
+                if log_fd >= 0:
+                    os.close(log_fd)
+        finally:
+            os.close(idx_fd)
+
+    @staticmethod
+    def _read_segment(log_fd: int, segment: Segment) -> bytes:
+        comp = os.pread(log_fd, segment.comp_len, segment.comp_offset)
+        return zlib.decompress(comp)
+
+    def _read_range(
+        self, index: _Index, log_fd: int, start: int, end: int | None
+    ) -> bytes:
+        return b"".join(self._iter_range(index, log_fd, start, end))
+
+    def _iter_range(
+        self, index: _Index, log_fd: int, start: int, end: int | None
+    ) -> Iterator[bytes]:
+        last = index.last()
+        if last is None:
+            return
+        end = last.raw_end if end is None else min(end, last.raw_end)
+        if start >= end:
+            return
+        first = bisect.bisect_right(_Keyed(index, "raw_offset"), start) - 1
+        for i in range(first, len(index)):
+            segment = index[i]
+            if segment.raw_offset >= end:
+                break
+            raw = self._read_segment(log_fd, segment)
+            lo = max(start - segment.raw_offset, 0)
+            hi = min(end - segment.raw_offset, segment.raw_len)
+            yield raw[lo:hi]
+
+    def _tail_offset(self, index: _Index, log_fd: int, lines: int) -> int:
+        last = index.last()
+        if last is None:
+            return 0
+        if lines <= 0:
+            return last.raw_end
+        total = last.lines_before + last.newlines
+        if not self._read_segment(log_fd, last).endswith(b"\n"):
+            total += 1  # unterminated final line
+        return self._line_offset(index, log_fd, max(0, total - lines))
+
+    def _line_offset(self, index: _Index, log_fd: int, line: int) -> int:
+        """Byte offset at which line `line` starts."""
+        last = index.last()
+        if line <= 0 or last is None:
+            return 0
+        # the segment holding the line's preceding newline is the last one
+        # with fewer than `line` newlines before it
+        i = bisect.bisect_left(_Keyed(index, "lines_before"), line) - 1
+        while i < len(index):
+            segment = index[i]
+            wanted = line - segment.lines_before
+            if wanted <= segment.newlines:
+                raw = self._read_segment(log_fd, segment)
+                pos = -1
+                for _ in range(wanted):
+                    pos = raw.index(b"\n", pos + 1)
+                return segment.raw_offset + pos + 1
+            i += 1
+        return last.raw_end
+
+
+@contextmanager
+def _locked(log_dir: Path) -> Iterator[None]:
+    """Serialize appends to a log across threads and API processes."""
+    with open(log_dir / "lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
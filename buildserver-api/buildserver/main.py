@@ -6,7 +6,11 @@ import uvicorn
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
+from buildserver.api.artifacts.views import router as artifact_router
 from buildserver.api.jobs.views import router as build_router
+from buildserver.api.logs.views import router as log_router
+from buildserver.api.metrics.views import router as metrics_router
+from buildserver.artifacts.gc import run as run_blob_gc
 from buildserver.rebuilder import run as run_rebuilder
 
 from buildserver.database.core import init_db
@@ -19,14 +23,19 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "Link"],
 )
 app.include_router(build_router)
+app.include_router(log_router)
+app.include_router(artifact_router)
+app.include_router(metrics_router)
 
 
 def main():  # noqa: C0116
     init_db()
     executor = ProcessPoolExecutor()
     executor.submit(run_rebuilder)
+    executor.submit(run_blob_gc)
     uvicorn.run(app, host="0.0.0.0", port=8000)
 
 
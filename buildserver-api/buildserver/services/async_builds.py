@@ -0,0 +1,92 @@
+"""
+Job service layer for async def endpoints
+
+The same operations as buildserver.services.builds, running the same
+statements through an AsyncSession so the event loop keeps serving other
+requests while the database answers. Used where requests are frequent and
+cheap, such as the status updates every runner sends for every job.
+"""
+
+import logging
+from datetime import datetime
+
+from buildserver.api.jobs.models import JobRead, JobStatus
+from buildserver.config import LOG_LEVEL
+from buildserver.database.core import AsyncDbSession
+from buildserver.services.builds import (
+    LATEST_JOB_MODELS,
+    JobSupersededError,
+    _is_latest_stmt,
+    _job_by_id_stmt,
+    _list_jobs_stmt,
+    _page,
+    _record_latest_stmt,
+    _refresh_latest_stmts,
+    _unique_jobs_stmt,
+    _update_status_stmt,
+)
+
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+logger.setLevel(LOG_LEVEL)
+
+
+async def get_job_by_id(dbsession: AsyncDbSession, job_id: int) -> JobRead | None:
+    """Retrieve a single job by ID."""
+    record = (await dbsession.execute(_job_by_id_stmt(job_id))).one_or_none()
+    if record is None:
+        return None
+    return JobRead(**record._mapping)
+
+
+async def list_jobs(
+    dbsession: AsyncDbSession,
+    limit: int,
+    after: tuple[datetime, int] | None = None,
+    statuses: list[JobStatus] | None = None,
+    repo_url: str | None = None,
+    created_after: datetime | None = None,
+    created_before: datetime | None = None,
+) -> tuple[list[JobRead], tuple[datetime, int] | None]:
+    """One page of jobs, newest first, see services.builds.list_jobs."""
+    stmt = _list_jobs_stmt(
+        limit, after, statuses, repo_url, created_after, created_before
+    )
+    return _page((await dbsession.execute(stmt)).fetchall(), limit)
+
+
+async def get_all_unique_jobs(dbsession: AsyncDbSession) -> list[JobRead]:
+    """Retrieve the most recent finished job for each repository."""
+    jobs = (await dbsession.execute(_unique_jobs_stmt())).fetchall()
+    return [JobRead(**job._mapping) for job in jobs]
+
+
+async def update_job_status(
+    dbsession: AsyncDbSession, job_id: int, new_status: JobStatus
+) -> JobRead | None:
+    """
+    Update the status of an existing job, see services.builds.update_job_status.
+
+    Returns:
+        The updated job, or None if the job was not found.
+
+    Raises:
+        JobSupersededError: If the job was superseded.
+    """
+    stmt = _update_status_stmt(job_id, new_status)
+    record = (await dbsession.execute(stmt)).one_or_none()
+    if record is None:
+        if await get_job_by_id(dbsession, job_id) is not None:
+            raise JobSupersededError(f"Job {job_id} was superseded")
+        return None
+    job = JobRead(**record._mapping)
+    for model, statuses in LATEST_JOB_MODELS.items():
+        if job.job_status in statuses:
+            await dbsession.execute(_record_latest_stmt(job, model))
+        elif (
+            await dbsession.execute(_is_latest_stmt(job_id, model))
+        ).one_or_none() is not None:
+            # a job being run again no longer counts as the latest
+            for stmt in _refresh_latest_stmts(job.git_repository_url, model):
+                await dbsession.execute(stmt)
+    return job
@@ -0,0 +1,176 @@
+"""Blob reference counting and garbage collection"""
+
+import itertools
+import logging
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from typing import Iterable
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.dialects.postgresql import insert
+
+from buildserver.api.jobs.models import Blob
+from buildserver.artifacts.blobstore import BlobStore
+from buildserver.config import LOG_LEVEL, BLOB_GC_GRACE
+from buildserver.database.core import DbSession
+
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+logger.setLevel(LOG_LEVEL)
+
+LOOKUP_BATCH = 1000
+
+
+def reference_blob(dbsession: DbSession, digest: str, size: int | None) -> None:
+    """Count one more artifact pointing at a blob, recording it if it's new."""
+    reference_blobs(dbsession, [(digest, size)])
+
+
+def reference_blobs(
+    dbsession: DbSession, blobs: Iterable[tuple[str, int | None]]
+) -> None:
+    """
+    Count one more reference per (digest, size) pair, in a single statement.
+
+    A digest that appears several times gets one reference per appearance.
+    """
+    counts = Counter()
+    sizes = {}
+    for digest, size in blobs:
+        counts[digest] += 1
+        sizes[digest] = size
+    if not counts:
+        return
+    # sorted so concurrent registrations lock rows in the same order
+    stmt = insert(Blob).values(
+        [
+            {"digest": digest, "size": sizes[digest], "ref_count": counts[digest]}
+            for digest in sorted(counts)
+        ]
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[Blob.digest],
+        set_={
+            "ref_count": Blob.ref_count + stmt.excluded.ref_count,
+            "released_at": None,
+        },
+    )
+    dbsession.execute(stmt)
+
+
+def record_blobs(dbsession: DbSession, blobs: Iterable[tuple[str, int | None]]) -> None:
+    """
+    Make sure each (digest, size) pair has a record, so artifacts can point
+    at it before they reference it.
+
+    New records start unreferenced and released, so the collector removes the
+    blob if nothing ends up referencing it.
+    """
+    sizes = dict(blobs)
+    if not sizes:
+        return
+    now = datetime.now()
+    stmt = insert(Blob).values(
+        [
+            {
+                "digest": digest,
+                "size": sizes[digest],
+                "ref_count": 0,
+                "released_at": now,
+            }
+            for digest in sorted(sizes)
+        ]
+    )
+    dbsession.execute(stmt.on_conflict_do_nothing(index_elements=[Blob.digest]))
+
+
+def release_blob(dbsession: DbSession, digest: str) -> None:
+    """Count one artifact fewer pointing at a blob."""
+    release_blobs(dbsession, [digest])
+
+
+def release_blobs(dbsession: DbSession, digests: Iterable[str]) -> None:
+    """
+    Drop one reference per digest, one statement per distinct count.
+
+    A digest that appears several times loses one reference per appearance.
+    """
+    by_count = defaultdict(list)
+    for digest, count in Counter(digests).items():
+        by_count[count].append(digest)
+    now = datetime.now()
+    for count, batch in sorted(by_count.items()):
+        stmt = (
+            update(Blob)
+            .where(Blob.digest.in_(sorted(batch)))
+            .values(ref_count=Blob.ref_count - count, released_at=now)
+        )
+        dbsession.execute(stmt)
+
+
+def collect_garbage(
+    dbsession: DbSession, store: BlobStore, grace: int = BLOB_GC_GRACE
+) -> int:
+    """
+    Delete blobs no artifact points at anymore.
+
+    A blob is collected once its reference count has been 0 for grace
+    seconds and it hasn't been put again in that time, since a put means an
+    artifact is about to reference it. Files in the store with no database
+    record at all, left behind when registering their artifact failed, are
+    collected after the same grace period, as are uploads nothing has been
+    written to for that long.
+
+    Rows are locked while their files are removed, so a concurrent
+    reference_blob waits for the collection to commit and then records the
+    blob afresh, for a file that may be gone: callers check the file still
+    exists after referencing it, and roll back if it doesn't. Should the
+    collection roll back instead, the rows outlive their files, which is
+    harmless for blobs nothing references: the next put writes them again.
+
+    Args:
+        dbsession: Active database session, committed by the caller.
+        store: Where the blob contents live.
+        grace: Seconds an unreferenced blob is kept.
+
+    Returns:
+        The number of blobs deleted.
+    """
+    cutoff = datetime.now() - timedelta(seconds=grace)
+    stmt = (
+        select(Blob.digest)
+        .where(Blob.ref_count <= 0, Blob.released_at < cutoff)
+        .with_for_update(skip_locked=True)
+    )
+    expired = [
+        digest
+        for digest in dbsession.execute(stmt).scalars()
+        if not store.modified_since(digest, cutoff.timestamp())
+    ]
+    if expired:
+        dbsession.execute(delete(Blob).where(Blob.digest.in_(expired)))
+    orphaned = _untracked(dbsession, store.digests(older_than=cutoff.timestamp()))
+    # orphans aren't locked by anything, one touched since the listing is
+    # about to be referenced
+    orphaned = [d for d in orphaned if not store.modified_since(d, cutoff.timestamp())]
+    abandoned = store.expire_uploads(cutoff.timestamp())
+    for digest in itertools.chain(expired, orphaned):
+        store.delete(digest)
+    if expired or orphaned or abandoned:
+        logger.info(
+            "Deleted %d unreferenced and %d orphaned blobs, %d abandoned uploads",
+            len(expired),
+            len(orphaned),
+            abandoned,
+        )
+    return len(expired) + len(orphaned)
+
+
+def _untracked(dbsession: DbSession, digests: Iterable[str]) -> list[str]:
+    """The digests that have no Blob record."""
+    untracked = []
+    for batch in itertools.batched(digests, LOOKUP_BATCH):
+        stmt = select(Blob.digest).where(Blob.digest.in_(batch))
+        known = set(dbsession.execute(stmt).scalars())
+        untracked.extend(digest for digest in batch if digest not in known)
+    return untracked
@@ -1,18 +1,30 @@
 """Job service layer for database operations"""
 
 import logging
+from datetime import datetime
 
-from sqlalchemy import insert, or_, select, update
+from sqlalchemy import delete, func, insert, select, tuple_, update
+from sqlalchemy.dialects import postgresql
 
 from buildserver.config import LOG_LEVEL
 from buildserver.database.core import DbSession
-from buildserver.api.jobs.models import JobStatus
+from buildserver.api.jobs.models import FINISHED, JobStatus
 from buildserver.api.jobs.models import (
     Artifact,
     ArtifactCreate,
+    ArtifactRead,
+    ArtifactUpload,
     Job,
     JobCreate,
     JobRead,
+    RepositoryLatestJob,
+    RepositoryLatestSuccess,
+)
+from buildserver.services.blobs import (
+    record_blobs,
+    reference_blob,
+    reference_blobs,
+    release_blob,
 )
 from buildserver.utils import get_remote_hash
 from buildserver.rmq.rmq import RabbitMQProducer
@@ -22,10 +34,31 @@ logger = logging.getLogger(__name__)
 logger.setLevel(LOG_LEVEL)
 
 
+class JobSupersededError(Exception):
+    """Raised when updating a job that a newer registration superseded."""
+
+    pass
+
+
+# read models of each repository's latest job in some states, kept up to date
+# by update_job_status
+LATEST_JOB_MODELS = {
+    RepositoryLatestJob: FINISHED,
+    RepositoryLatestSuccess: (JobStatus.SUCCEEDED,),
+}
+
+# Statements are built by the _*_stmt functions below and executed by both
+# these functions and their async counterparts in services.async_builds, so
+# both access paths run exactly the same SQL.
+
+
+def _job_by_id_stmt(job_id: int):
+    return select(*Job.__table__.columns).where(Job.job_id == job_id)
+
+
 def get_job_by_id(dbsession: DbSession, job_id: int) -> JobRead | None:
     """Retrieve a single job by ID."""
-    stmt = select(*Job.__table__.columns).where(Job.job_id == job_id)
-    record = dbsession.execute(stmt).one_or_none()
+    record = dbsession.execute(_job_by_id_stmt(job_id)).one_or_none()
     if record is None:
         return None
     return JobRead(**record._mapping)
@@ -41,6 +74,72 @@ def get_all_jobs(dbsession: DbSession):
     return records
 
 
+def list_jobs(
+    dbsession: DbSession,
+    limit: int,
+    after: tuple[datetime, int] | None = None,
+    statuses: list[JobStatus] | None = None,
+    repo_url: str | None = None,
+    created_after: datetime | None = None,
+    created_before: datetime | None = None,
+) -> tuple[list[JobRead], tuple[datetime, int] | None]:
+    """
+    One page of jobs, newest first, filtered in the database.
+
+    Pages are keyed on (created_at, job_id) rather than an offset, so every
+    page is a range scan of the created_at indexes that starts where the
+    previous one ended, however deep into the table it is.
+
+    Args:
+        dbsession: Active database session.
+        limit: Maximum number of jobs on the page.
+        after: Key of the last job of the previous page, None for the first.
+        statuses: Only jobs in one of these states.
+        repo_url: Only jobs of this repository.
+        created_after: Only jobs created at or after this time.
+        created_before: Only jobs created before this time.
+
+    Returns:
+        The jobs and the key to pass as after for the next page, which is
+        None on the last page.
+    """
+    stmt = _list_jobs_stmt(
+        limit, after, statuses, repo_url, created_after, created_before
+    )
+    return _page(dbsession.execute(stmt).fetchall(), limit)
+
+
+def _list_jobs_stmt(
+    limit: int,
+    after: tuple[datetime, int] | None,
+    statuses: list[JobStatus] | None,
+    repo_url: str | None,
+    created_after: datetime | None,
+    created_before: datetime | None,
+):
+    stmt = select(*Job.__table__.columns)
+    if after is not None:
+        stmt = stmt.where(tuple_(Job.created_at, Job.job_id) < after)
+    if statuses:
+        stmt = stmt.where(Job.job_status.in_(statuses))
+    if repo_url is not None:
+        stmt = stmt.where(Job.git_repository_url == repo_url)
+    if created_after is not None:
+        stmt = stmt.where(Job.created_at >= created_after)
+    if created_before is not None:
+        stmt = stmt.where(Job.created_at < created_before)
+    # one extra row tells whether there is a next page
+    return stmt.order_by(Job.created_at.desc(), Job.job_id.desc()).limit(limit + 1)
+
+
+def _page(records, limit: int) -> tuple[list[JobRead], tuple[datetime, int] | None]:
+    jobs = [JobRead(**r._mapping) for r in records]
+    if len(jobs) <= limit:
+        return jobs, None
+    jobs = jobs[:limit]
+    return jobs, (jobs[-1].created_at, jobs[-1].job_id)
+
+
 def create_job(job: JobCreate, dbsession: DbSession, commit_hash: str | None = None):
     """Insert a new job record into the database."""
     stmt = (
@@ -49,6 +148,7 @@ def create_job(job: JobCreate, dbsession: DbSession, commit_hash: str | None = N
             git_repository_url=job.git_repository_url,
             job_status=JobStatus.QUEUED,
             commit_hash=commit_hash,
+            build_config=job.build_config,
         )
         .returning(
             Job.git_repository_url,
@@ -56,6 +156,7 @@ def create_job(job: JobCreate, dbsession: DbSession, commit_hash: str | None = N
             Job.job_status,
             Job.commit_hash,
             Job.created_at,
+            Job.build_config,
         )
     )
     try:
@@ -65,9 +166,118 @@ def create_job(job: JobCreate, dbsession: DbSession, commit_hash: str | None = N
     return record
 
 
+def get_cached_job(
+    dbsession: DbSession, repo_url: str, commit_hash: str, build_config: str
+) -> JobRead | None:
+    """
+    Find a successful build of a commit with the same build config.
+
+    Served by the partial ix_job_result_cache index, so a lookup is a single
+    index probe no matter how many jobs a repository has.
+
+    Returns:
+        The most recent matching SUCCEEDED job, or None.
+    """
+    stmt = (
+        select(*Job.__table__.columns)
+        .where(
+            Job.git_repository_url == repo_url,
+            Job.commit_hash == commit_hash,
+            Job.build_config == build_config,
+            Job.job_status == JobStatus.SUCCEEDED,
+        )
+        .order_by(Job.created_at.desc())
+        .limit(1)
+    )
+    record = dbsession.execute(stmt).one_or_none()
+    if record is None:
+        return None
+    return JobRead(**record._mapping)
+
+
+def lock_repository(dbsession: DbSession, repo_url: str) -> None:
+    """
+    Serialize registrations for a repository until the transaction ends.
+
+    Takes a transaction-scoped Postgres advisory lock keyed by the URL, so
+    concurrent registrations can't both decide to queue a build.
+    """
+    dbsession.execute(select(func.pg_advisory_xact_lock(func.hashtext(repo_url))))
+
+
+def get_queued_jobs(
+    dbsession: DbSession, repo_url: str, build_config: str
+) -> list[JobRead]:
+    """Retrieve the QUEUED jobs for a repository and build config, newest first."""
+    stmt = (
+        select(*Job.__table__.columns)
+        .where(
+            Job.git_repository_url == repo_url,
+            Job.build_config == build_config,
+            Job.job_status == JobStatus.QUEUED,
+        )
+        .order_by(Job.created_at.desc())
+    )
+    return [JobRead(**r._mapping) for r in dbsession.execute(stmt).fetchall()]
+
+
+def supersede_jobs(dbsession: DbSession, job_ids: list[int]) -> None:
+    """Mark jobs SUPERSEDED if they are still QUEUED."""
+    stmt = (
+        update(Job)
+        .where(Job.job_id.in_(job_ids), Job.job_status == JobStatus.QUEUED)
+        .values(job_status=JobStatus.SUPERSEDED)
+    )
+    dbsession.execute(stmt)
+
+
 def register_job(repo: JobCreate, dbsession: DbSession) -> JobRead:
-    """Create a new job and publish it to the build queue."""
+    """
+    Create a new job and publish it to the build queue.
+
+    If the repository's current commit already built successfully with the
+    same build config, the existing job is returned instead and nothing is
+    queued. Its artifacts are keyed by repository and commit, so they are
+    shared as well. Set force on the request to build anyway.
+
+    Registrations are coalesced while a job is waiting in the queue: one for
+    a commit that is already queued returns that job, and one for a newer
+    commit supersedes the queued jobs, which runners then skip.
+    """
     commit_hash = get_remote_hash(repo.git_repository_url)
+    if not repo.force:
+        cached = get_cached_job(
+            dbsession, repo.git_repository_url, commit_hash, repo.build_config
+        )
+        if cached is not None:
+            logger.info(
+                "%s at %s already built by job %s, skipping build",
+                repo.git_repository_url,
+                commit_hash,
+                cached.job_id,
+            )
+            return cached
+
+    lock_repository(dbsession, repo.git_repository_url)
+    queued = get_queued_jobs(dbsession, repo.git_repository_url, repo.build_config)
+    for job in queued:
+        if job.commit_hash == commit_hash:
+            logger.info(
+                "%s at %s already queued as job %s",
+                repo.git_repository_url,
+                commit_hash,
+                job.job_id,
+            )
+            return job
+    if queued:
+        logger.info(
+            "Job(s) %s superseded by %s at %s",
+            [job.job_id for job in queued],
+            repo.git_repository_url,
+            commit_hash,
+        )
+        supersede_jobs(dbsession, [job.job_id for job in queued])
+
     job = JobRead(**dict(create_job(repo, dbsession, commit_hash)._mapping))
     publisher = RabbitMQProducer()
     publisher.publish("build_jobs", job.model_dump_json().encode())
@@ -75,7 +285,14 @@ def register_job(repo: JobCreate, dbsession: DbSession) -> JobRead:
 
 
 def create_artifact(artifact: ArtifactCreate, dbsession: DbSession):
-    """Insert a new artifact record into the database."""
+    """
+    Insert a new artifact record into the database.
+
+    An artifact with a digest takes a reference on its blob, so the blob is
+    kept until every artifact with the same contents has been deleted.
+    """
+    if artifact.digest is not None:
+        reference_blob(dbsession, artifact.digest, artifact.size)
     stmt = (
         insert(Artifact)
         .values(
@@ -83,12 +300,16 @@ def create_artifact(artifact: ArtifactCreate, dbsession: DbSession):
             git_repository_url=artifact.git_repository_url,
             commit_hash=artifact.commit_hash,
             artifact_path=artifact.artifact_path,
+            digest=artifact.digest,
+            size=artifact.size,
+            job_id=artifact.job_id,
         )
         .returning(
             Artifact.artifact_id,
             Artifact.artifact_file_name,
             Artifact.commit_hash,
             Artifact.git_repository_url,
+            Artifact.digest,
         )
     )
     try:
@@ -98,6 +319,127 @@ def create_artifact(artifact: ArtifactCreate, dbsession: DbSession):
     return record
 
 
+def register_artifacts(
+    dbsession: DbSession, job: JobRead, uploads: list[ArtifactUpload]
+) -> list[ArtifactRead]:
+    """
+    Record the artifacts a runner uploaded for a job, in one round trip.
+
+    Their blobs must already be in the blob store. Registering is idempotent:
+    a path the job already has an artifact for is left as it is, and only
+    the artifacts actually inserted take a reference on their blob, so a
+    retried request or a rebuilt redelivery counts each blob once.
+
+    Returns:
+        The job's artifacts at the uploaded paths.
+    """
+    if not uploads:
+        return []
+    record_blobs(dbsession, [(u.digest, u.size) for u in uploads])
+    stmt = (
+        postgresql.insert(Artifact)
+        .values(
+            [
+                {
+                    "artifact_file_name": u.artifact_file_name,
+                    "artifact_path": u.artifact_path,
+                    "git_repository_url": job.git_repository_url,
+                    "commit_hash": job.commit_hash,
+                    "digest": u.digest,
+                    "size": u.size,
+                    "job_id": job.job_id,
+                }
+                for u in uploads
+            ]
+        )
+        .on_conflict_do_nothing(
+            index_elements=[Artifact.job_id, Artifact.artifact_path]
+        )
+        .returning(Artifact.digest, Artifact.size)
+    )
+    inserted = dbsession.execute(stmt).fetchall()
+    reference_blobs(dbsession, [(r.digest, r.size) for r in inserted])
+    stmt = (
+        select(*Artifact.__table__.columns)
+        .where(
+            Artifact.job_id == job.job_id,
+            Artifact.artifact_path.in_({u.artifact_path for u in uploads}),
+        )
+        .order_by(Artifact.artifact_path)
+    )
+    return [ArtifactRead(**r._mapping) for r in dbsession.execute(stmt).fetchall()]
+
+
+def set_job_bundle(
+    dbsession: DbSession, job_id: int, digest: str, size: int
+) -> JobRead | None:
+    """
+    Record an uploaded blob as a job's artifact bundle.
+
+    The job takes a reference on the bundle's blob and releases the one on a
+    bundle it had before.
+
+    Returns:
+        The updated job, or None if the job was not found.
+    """
+    stmt = select(Job.bundle_digest).where(Job.job_id == job_id).with_for_update()
+    record = dbsession.execute(stmt).one_or_none()
+    if record is None:
+        return None
+    reference_blob(dbsession, digest, size)
+    stmt = (
+        update(Job)
+        .where(Job.job_id == job_id)
+        .values(bundle_digest=digest)
+        .returning(*Job.__table__.columns)
+    )
+    job = JobRead(**dbsession.execute(stmt).one()._mapping)
+    if record.bundle_digest is not None:
+        release_blob(dbsession, record.bundle_digest)
+    return job
+
+
+def get_artifact_by_id(dbsession: DbSession, artifact_id: int) -> ArtifactRead | None:
+    """Retrieve a single artifact by ID."""
+    stmt = select(*Artifact.__table__.columns).where(
+        Artifact.artifact_id == artifact_id
+    )
+    record = dbsession.execute(stmt).one_or_none()
+    if record is None:
+        return None
+    return ArtifactRead(**record._mapping)
+
+
+def get_job_artifacts(dbsession: DbSession, job_id: int) -> list[ArtifactRead]:
+    """Retrieve the artifacts registered for a job."""
+    stmt = (
+        select(*Artifact.__table__.columns)
+        .where(Artifact.job_id == job_id)
+        .order_by(Artifact.artifact_path)
+    )
+    return [ArtifactRead(**r._mapping) for r in dbsession.execute(stmt).fetchall()]
+
+
+def delete_artifact(dbsession: DbSession, artifact_id: int) -> bool:
+    """
+    Delete an artifact record and release its blob.
+
+    Returns:
+        False if the artifact was not found.
+    """
+    stmt = (
+        delete(Artifact)
+        .where(Artifact.artifact_id == artifact_id)
+        .returning(Artifact.digest)
+    )
+    record = dbsession.execute(stmt).one_or_none()
+    if record is None:
+        return False
+    if record.digest is not None:
+        release_blob(dbsession, record.digest)
+    return True
+
+
 def update_job_status(
     dbsession: DbSession, job_id: int, new_status: JobStatus
 ) -> JobRead | None:
@@ -111,17 +453,92 @@ def update_job_status(
 
     Returns:
         The updated job as a JobRead model, or None if the job was not found.
+
+    Raises:
+        JobSupersededError: If the job was superseded. SUPERSEDED is final, a
+            runner that dequeues such a job learns it should skip it here.
     """
-    stmt = (
+    stmt = _update_status_stmt(job_id, new_status)
+    record = dbsession.execute(stmt).one_or_none()
+    if record is None:
+        if get_job_by_id(dbsession, job_id) is not None:
+            raise JobSupersededError(f"Job {job_id} was superseded")
+        return None
+    job = JobRead(**record._mapping)
+    for model, statuses in LATEST_JOB_MODELS.items():
+        if job.job_status in statuses:
+            record_latest_job(dbsession, job, model)
+        elif (
+            dbsession.execute(_is_latest_stmt(job_id, model)).one_or_none() is not None
+        ):
+            # a job being run again no longer counts as the latest
+            refresh_latest_job(dbsession, job.git_repository_url, model)
+    return job
+
+
+def _update_status_stmt(job_id: int, new_status: JobStatus):
+    return (
         update(Job)
-        .where(Job.job_id == job_id)
+        .where(Job.job_id == job_id, Job.job_status != JobStatus.SUPERSEDED)
         .values(job_status=new_status)
         .returning(*Job.__table__.columns)
     )
-    record = dbsession.execute(stmt).one_or_none()
-    if record is None:
-        return None
-    return JobRead(**record._mapping)
+
+
+def _is_latest_stmt(job_id: int, model: type = RepositoryLatestJob):
+    return select(model.git_repository_url).where(model.job_id == job_id)
+
+
+def record_latest_job(
+    dbsession: DbSession, job: JobRead, model: type = RepositoryLatestJob
+) -> None:
+    """
+    Make a job its repository's latest in a read model of LATEST_JOB_MODELS,
+    unless a newer job already got there.
+    """
+    dbsession.execute(_record_latest_stmt(job, model))
+
+
+def _record_latest_stmt(job: JobRead, model: type = RepositoryLatestJob):
+    # the read models' columns are named after the job's
+    columns = [c.name for c in model.__table__.columns]
+    stmt = postgresql.insert(model).values({c: getattr(job, c) for c in columns})
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[model.git_repository_url],
+        set_={c: stmt.excluded[c] for c in columns if c != "git_repository_url"},
+        # jobs can finish out of order, the newest one wins
+        where=model.created_at <= stmt.excluded.created_at,
+    )
+    return stmt
+
+
+def refresh_latest_job(
+    dbsession: DbSession, repo_url: str, model: type = RepositoryLatestJob
+) -> None:
+    """Recompute a repository's row in a read model from the job table."""
+    for stmt in _refresh_latest_stmts(repo_url, model):
+        dbsession.execute(stmt)
+
+
+def _refresh_latest_stmts(repo_url: str, model: type = RepositoryLatestJob) -> list:
+    remove = delete(model).where(model.git_repository_url == repo_url)
+    columns = [c.name for c in model.__table__.columns]
+    latest = (
+        select(*(Job.__table__.c[c] for c in columns))
+        .where(
+            Job.git_repository_url == repo_url,
+            Job.job_status.in_(LATEST_JOB_MODELS[model]),
+        )
+        .order_by(Job.created_at.desc())
+        .limit(1)
+    )
+    add = postgresql.insert(model).from_select(columns, latest)
+    # a concurrent refresh may have inserted the row since the delete
+    add = add.on_conflict_do_update(
+        index_elements=[model.git_repository_url],
+        set_={c: add.excluded[c] for c in columns if c != "git_repository_url"},
+    )
+    return [remove, add]
 
 
 def get_all_unique_jobs(dbsession: DbSession) -> list[JobRead]:
@@ -131,20 +548,20 @@ def get_all_unique_jobs(dbsession: DbSession) -> list[JobRead]:
     A job is considered unique if its git_repository_url differs from others.
     Only includes jobs with SUCCEEDED or FAILED status.
 
+    Reads repository_latest_job, one row per repository, instead of sorting
+    the job table.
+
     TODO: service functions return data inconsistently — some return raw rows
     (get_all_jobs), some return JobRead models (get_all_unique_jobs, get_job_by_id).
     Standardize on one approach.
     """
-    stmt = (
+    jobs = dbsession.execute(_unique_jobs_stmt()).fetchall()
+    return [JobRead(**job._mapping) for job in jobs]
+
+
+def _unique_jobs_stmt():
+    return (
         select(*Job.__table__.columns)
-        .distinct(Job.git_repository_url)
-        .order_by(Job.git_repository_url, Job.created_at.desc())
-        .where(
-            or_(
-                Job.job_status == JobStatus.SUCCEEDED,
-                Job.job_status == JobStatus.FAILED,
-            )
-        )
+        .join(RepositoryLatestJob, RepositoryLatestJob.job_id == Job.job_id)
+        .order_by(Job.git_repository_url)
     )
-    jobs = dbsession.execute(stmt).fetchall()
-    return [JobRead(**job._mapping) for job in jobs]
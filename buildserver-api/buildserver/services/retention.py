@@ -0,0 +1,293 @@
+"""
+Artifact retention
+
+Rules that delete artifact records so the blob store stays within bounds:
+keeping only a repository's most recent commits, a quota per repository and a
+quota for the whole store. Quotas evict the least recently downloaded
+artifacts first, but never those of a repository's latest successful build.
+Deleting an artifact releases its blob, and the blob garbage collector removes
+the file once nothing references it, see buildserver.services.blobs.
+"""
+
+import itertools
+import logging
+from datetime import datetime, timedelta
+from typing import Iterable
+
+from sqlalchemy import and_, case, delete, func, select, tuple_, update
+from sqlalchemy.sql import Subquery
+
+from buildserver.api.jobs.models import (
+    Artifact,
+    Blob,
+    Job,
+    JobStatus,
+    RepositoryLatestSuccess,
+)
+from buildserver.config import (
+    LOG_LEVEL,
+    ARTIFACT_KEEP_COMMITS,
+    ARTIFACT_REPOSITORY_QUOTA,
+    ARTIFACT_STORE_QUOTA,
+    ARTIFACT_ACCESS_RESOLUTION,
+)
+from buildserver.database.core import DbSession
+from buildserver.services.blobs import release_blobs
+
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+logger.setLevel(LOG_LEVEL)
+
+EVICT_BATCH = 1000
+
+
+def record_artifact_access(dbsession: DbSession, artifact_id: int) -> None:
+    """Note that an artifact was downloaded, for LRU eviction."""
+    _record_access(dbsession, Artifact.artifact_id == artifact_id)
+
+
+def record_blob_access(dbsession: DbSession, digest: str) -> None:
+    """Note that the artifacts with a blob's contents were downloaded."""
+    _record_access(dbsession, Artifact.digest == digest)
+
+
+def _record_access(dbsession: DbSession, whereclause) -> None:
+    # only write once per resolution, a popular artifact would otherwise
+    # cost an update on every download
+    now = datetime.now()
+    stale = now - timedelta(seconds=ARTIFACT_ACCESS_RESOLUTION)
+    stmt = (
+        update(Artifact)
+        .where(whereclause, Artifact.last_accessed_at < stale)
+        .values(last_accessed_at=now)
+    )
+    dbsession.execute(stmt)
+
+
+def apply_retention(
+    dbsession: DbSession,
+    keep_commits: int = ARTIFACT_KEEP_COMMITS,
+    repository_quota: int = ARTIFACT_REPOSITORY_QUOTA,
+    store_quota: int = ARTIFACT_STORE_QUOTA,
+) -> int:
+    """
+    Enforce every retention rule, in order of how cheap they are.
+
+    Args:
+        dbsession: Active database session, committed by the caller.
+        keep_commits: Commits kept per repository, 0 keeps all.
+        repository_quota: Bytes of artifacts per repository, 0 is unlimited.
+        store_quota: Bytes of referenced blobs in the store, 0 is unlimited.
+
+    Returns:
+        The number of artifacts deleted.
+    """
+    evicted = 0
+    if keep_commits > 0:
+        evicted += keep_last_commits(dbsession, keep_commits)
+    if repository_quota > 0:
+        evicted += enforce_repository_quota(dbsession, repository_quota)
+    if store_quota > 0:
+        evicted += enforce_store_quota(dbsession, store_quota)
+    return evicted
+
+
+def keep_last_commits(dbsession: DbSession, keep: int) -> int:
+    """
+    Delete the artifacts and bundles of all but each repository's keep most
+    recently built commits.
+
+    Returns:
+        The number of artifacts deleted.
+    """
+    commits = (
+        select(
+            Job.git_repository_url,
+            Job.commit_hash,
+            func.max(Job.created_at).label("built_at"),
+        )
+        .where(Job.job_status == JobStatus.SUCCEEDED, Job.commit_hash.is_not(None))
+        .group_by(Job.git_repository_url, Job.commit_hash)
+        .subquery()
+    )
+    ranked = select(
+        commits.c.git_repository_url,
+        commits.c.commit_hash,
+        func.row_number()
+        .over(
+            partition_by=commits.c.git_repository_url,
+            order_by=commits.c.built_at.desc(),
+        )
+        .label("rank"),
+    ).subquery()
+    stale = select(ranked.c.git_repository_url, ranked.c.commit_hash).where(
+        ranked.c.rank > keep
+    )
+
+    stmt = select(Job.job_id, Job.bundle_digest).where(
+        Job.bundle_digest.is_not(None),
+        tuple_(Job.git_repository_url, Job.commit_hash).in_(stale),
+    )
+    bundles = dbsession.execute(stmt.with_for_update(skip_locked=True)).fetchall()
+    if bundles:
+        stmt = (
+            update(Job)
+            .where(Job.job_id.in_([b.job_id for b in bundles]))
+            .values(bundle_digest=None)
+        )
+        dbsession.execute(stmt)
+        release_blobs(dbsession, [b.bundle_digest for b in bundles])
+
+    stmt = select(Artifact.artifact_id).where(
+        tuple_(Artifact.git_repository_url, Artifact.commit_hash).in_(stale)
+    )
+    evicted = _evict(dbsession, dbsession.execute(stmt).scalars().all())
+    if evicted or bundles:
+        logger.info(
+            "Deleted %d artifacts and %d bundles of commits older than the last %d",
+            evicted,
+            len(bundles),
+            keep,
+        )
+    return evicted
+
+
+def enforce_repository_quota(dbsession: DbSession, quota: int) -> int:
+    """
+    Delete each repository's least recently downloaded artifacts until the
+    sizes of the rest add up to at most quota bytes.
+
+    Artifacts with the same contents count once per artifact here, the
+    quota bounds what a repository asks of the store, not what it costs.
+
+    Returns:
+        The number of artifacts deleted.
+    """
+    latest = _latest_commits()
+    is_latest = latest.c.commit_hash.is_not(None)
+    # a window sum in keep order: the latest build's artifacts are counted
+    # first so they use up the quota before anything that may be evicted
+    kept_before = func.sum(Artifact.size).over(
+        partition_by=Artifact.git_repository_url,
+        order_by=(
+            case((is_latest, 0), else_=1),
+            Artifact.last_accessed_at.desc(),
+            Artifact.artifact_id.desc(),
+        ),
+    )
+    ranked = (
+        select(
+            Artifact.artifact_id,
+            is_latest.label("latest"),
+            kept_before.label("kept_before"),
+        )
+        .outerjoin(latest, _is_commit_of(latest))
+        .where(Artifact.size.is_not(None))
+        .subquery()
+    )
+    stmt = select(ranked.c.artifact_id).where(
+        ranked.c.kept_before > quota, ~ranked.c.latest
+    )
+    evicted = _evict(dbsession, dbsession.execute(stmt).scalars().all())
+    if evicted:
+        logger.info(
+            "Deleted %d artifacts of repositories over their %d byte quota",
+            evicted,
+            quota,
+        )
+    return evicted
+
+
+def enforce_store_quota(dbsession: DbSession, quota: int) -> int:
+    """
+    Delete the least recently downloaded artifacts until the referenced blobs
+    take at most quota bytes.
+
+    A blob only stops counting once every artifact and bundle referencing it
+    is gone, so artifacts are walked oldest access first, tallying the
+    references each eviction would drop. Artifacts whose blob is also
+    referenced by a latest build or a bundle are skipped, evicting them
+    would free nothing.
+
+    Returns:
+        The number of artifacts deleted.
+    """
+    stmt = select(func.coalesce(func.sum(Blob.size), 0)).where(Blob.ref_count > 0)
+    usage = dbsession.execute(stmt).scalar_one()
+    if usage <= quota:
+        return 0
+    latest = _latest_commits()
+    candidates = (
+        select(
+            Artifact.artifact_id,
+            Artifact.digest,
+            Artifact.last_accessed_at,
+            func.count().over(partition_by=Artifact.digest).label("evictable"),
+        )
+        .outerjoin(latest, _is_commit_of(latest))
+        .where(latest.c.commit_hash.is_(None), Artifact.digest.is_not(None))
+        .subquery()
+    )
+    stmt = (
+        select(candidates.c.artifact_id, candidates.c.digest, Blob.size, Blob.ref_count)
+        .join(Blob, Blob.digest == candidates.c.digest)
+        # the other references are latest builds' artifacts and bundles
+        .where(Blob.ref_count <= candidates.c.evictable)
+        .order_by(candidates.c.last_accessed_at, candidates.c.artifact_id)
+        .execution_options(yield_per=EVICT_BATCH)
+    )
+    refs: dict[str, int] = {}
+    victims = []
+    with dbsession.execute(stmt) as rows:
+        for row in rows:
+            if usage <= quota:
+                break
+            victims.append(row.artifact_id)
+            refs[row.digest] = refs.get(row.digest, row.ref_count) - 1
+            if refs[row.digest] == 0:
+                usage -= row.size or 0
+    evicted = _evict(dbsession, victims)
+    if usage > quota:
+        logger.warning(
+            "Artifact store is still %d bytes over its %d byte quota, the rest "
+            "belongs to latest builds and bundles",
+            usage - quota,
+            quota,
+        )
+    if evicted:
+        logger.info(
+            "Deleted %d least recently used artifacts, store over its %d byte quota",
+            evicted,
+            quota,
+        )
+    return evicted
+
+
+def _latest_commits() -> Subquery:
+    """Each repository's most recently built commit."""
+    return select(
+        RepositoryLatestSuccess.git_repository_url,
+        RepositoryLatestSuccess.commit_hash,
+    ).subquery()
+
+
+def _is_commit_of(commits: Subquery):
+    return and_(
+        commits.c.git_repository_url == Artifact.git_repository_url,
+        commits.c.commit_hash == Artifact.commit_hash,
+    )
+
+
+def _evict(dbsession: DbSession, artifact_ids: Iterable[int]) -> int:
+    """Delete artifact records and release their blobs. Returns how many."""
+    evicted = 0
+    for batch in itertools.batched(artifact_ids, EVICT_BATCH):
+        stmt = (
+            delete(Artifact)
+            .where(Artifact.artifact_id.in_(batch))
+            .returning(Artifact.digest)
+        )
+        digests = dbsession.execute(stmt).scalars().all()
+        release_blobs(dbsession, [d for d in digests if d is not None])
+        evicted += len(digests)
+    return evicted
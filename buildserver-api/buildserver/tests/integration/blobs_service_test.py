@@ -0,0 +1,128 @@
+"""Integration tests for blob reference counting and garbage collection"""
+
+from sqlalchemy import select
+
+from buildserver.api.jobs.models import (
+    ArtifactCreate,
+    ArtifactUpload,
+    Blob,
+    JobCreate,
+    JobRead,
+)
+from buildserver.artifacts.blobstore import BlobStore
+from buildserver.services.blobs import collect_garbage
+from buildserver.services.builds import (
+    create_artifact,
+    create_job,
+    delete_artifact,
+    get_job_artifacts,
+    register_artifacts,
+)
+
+
+def _artifact(digest: str, commit_hash: str) -> ArtifactCreate:
+    return ArtifactCreate(
+        git_repository_url="git@github.com:user/repo.git",
+        artifact_file_name="main",
+        artifact_path="main",
+        commit_hash=commit_hash,
+        digest=digest,
+        size=6,
+    )
+
+
+def _ref_count(dbsession, digest: str) -> int | None:
+    stmt = select(Blob.ref_count).where(Blob.digest == digest)
+    return dbsession.execute(stmt).scalar_one_or_none()
+
+
+class TestBlobReferences:
+
+    def test_artifacts_with_same_content_share_a_blob(self, dbsession, tmp_path):
+        src = tmp_path / "main"
+        src.write_bytes(b"binary")
+        digest, _ = BlobStore(tmp_path / "blobs").put(src)
+
+        first = create_artifact(_artifact(digest, "a" * 40), dbsession)
+        create_artifact(_artifact(digest, "b" * 40), dbsession)
+        assert _ref_count(dbsession, digest) == 2
+
+        assert delete_artifact(dbsession, first.artifact_id)
+        assert _ref_count(dbsession, digest) == 1
+
+    def test_collects_unreferenced_blobs_after_grace(self, dbsession, tmp_path):
+        store = BlobStore(tmp_path / "blobs")
+        src = tmp_path / "main"
+        src.write_bytes(b"binary")
+        digest, _ = store.put(src)
+        artifact = create_artifact(_artifact(digest, "a" * 40), dbsession)
+
+        assert collect_garbage(dbsession, store, grace=0) == 0
+        delete_artifact(dbsession, artifact.artifact_id)
+        assert collect_garbage(dbsession, store, grace=3600) == 0
+        assert store.exists(digest)
+
+        assert collect_garbage(dbsession, store, grace=0) == 1
+        assert not store.exists(digest)
+        assert _ref_count(dbsession, digest) is None
+
+    def test_collects_orphaned_files(self, dbsession, tmp_path):
+        store = BlobStore(tmp_path / "blobs")
+        src = tmp_path / "main"
+        src.write_bytes(b"binary")
+        digest, _ = store.put(src)
+
+        assert collect_garbage(dbsession, store, grace=0) == 1
+        assert not store.exists(digest)
+
+
+class TestRegisterArtifacts:
+
+    def test_registers_artifacts_for_job(self, dbsession):
+        job = JobRead(
+            **create_job(
+                JobCreate(git_repository_url="git@github.com:user/repo.git"),
+                dbsession,
+                "a" * 40,
+            )._mapping
+        )
+        digest = "f" * 64
+        uploads = [
+            ArtifactUpload(
+                artifact_file_name=name,
+                artifact_path=f"bin/{name}",
+                digest=digest,
+                size=6,
+            )
+            for name in ("main", "copy")
+        ]
+
+        created = register_artifacts(dbsession, job, uploads)
+
+        assert [a.job_id for a in created] == [job.job_id, job.job_id]
+        assert _ref_count(dbsession, digest) == 2
+        listed = get_job_artifacts(dbsession, job.job_id)
+        assert [a.artifact_path for a in listed] == ["bin/copy", "bin/main"]
+        assert all(a.commit_hash == "a" * 40 for a in listed)
+
+    def test_registering_again_is_a_no_op(self, dbsession):
+        job = JobRead(
+            **create_job(
+                JobCreate(git_repository_url="git@github.com:user/repo.git"),
+                dbsession,
+                "b" * 40,
+            )._mapping
+        )
+        upload = ArtifactUpload(
+            artifact_file_name="main",
+            artifact_path="bin/main",
+            digest="e" * 64,
+            size=6,
+        )
+
+        first = register_artifacts(dbsession, job, [upload])
+        retried = register_artifacts(dbsession, job, [upload])
+
+        assert [a.artifact_id for a in retried] == [a.artifact_id for a in first]
+        assert len(get_job_artifacts(dbsession, job.job_id)) == 1
+        assert _ref_count(dbsession, "e" * 64) == 1
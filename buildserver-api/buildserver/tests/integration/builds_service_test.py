@@ -4,8 +4,13 @@ from buildserver.api.jobs.models import JobCreate
 from buildserver.api.jobs.models import JobStatus
 from buildserver.services.builds import (
     create_job,
+    get_cached_job,
     get_job_by_id,
+    get_queued_jobs,
+    supersede_jobs,
     get_all_jobs,
+    get_all_unique_jobs,
+    list_jobs,
     update_job_status,
 )
 
@@ -63,6 +68,41 @@ class TestGetAllJobs:
         assert len(result) == 2
 
 
+class TestListJobs:
+
+    def _create(self, dbsession, repo: str, count: int) -> list[int]:
+        job_create = JobCreate(git_repository_url=repo)
+        return [create_job(job_create, dbsession).job_id for _ in range(count)]
+
+    def test_pages_newest_first(self, dbsession):
+        job_ids = self._create(dbsession, "git@github.com:user/repo.git", 5)
+
+        first, after = list_jobs(dbsession, 2)
+        second, after = list_jobs(dbsession, 2, after=after)
+        third, after = list_jobs(dbsession, 2, after=after)
+
+        pages = [[job.job_id for job in page] for page in (first, second, third)]
+        assert pages == [job_ids[:2:-1], job_ids[2:0:-1], job_ids[:1]]
+        assert after is None
+
+    def test_filters_by_repository_and_status(self, dbsession):
+        self._create(dbsession, "git@github.com:user/repo1.git", 2)
+        (job_id,) = self._create(dbsession, "git@github.com:user/repo2.git", 1)
+        update_job_status(dbsession, job_id, JobStatus.FAILED)
+
+        jobs, _ = list_jobs(
+            dbsession,
+            10,
+            statuses=[JobStatus.FAILED],
+            repo_url="git@github.com:user/repo2.git",
+        )
+        assert [job.job_id for job in jobs] == [job_id]
+        jobs, _ = list_jobs(
+            dbsession, 10, statuses=[JobStatus.FAILED, JobStatus.QUEUED]
+        )
+        assert len(jobs) == 3
+
+
 class TestUpdateJobStatus:
 
     def test_updates_status(self, dbsession):
@@ -79,3 +119,97 @@ class TestUpdateJobStatus:
         result = update_job_status(dbsession, 999, JobStatus.RUNNING)
 
         assert result is None
+
+
+class TestGetAllUniqueJobs:
+
+    def _finished(self, dbsession, repo: str, status: JobStatus) -> int:
+        job = create_job(JobCreate(git_repository_url=repo), dbsession)
+        update_job_status(dbsession, job.job_id, status)
+        return job.job_id
+
+    def test_latest_finished_job_per_repository(self, dbsession):
+        self._finished(dbsession, "git@github.com:user/repo1.git", JobStatus.FAILED)
+        latest1 = self._finished(
+            dbsession, "git@github.com:user/repo1.git", JobStatus.SUCCEEDED
+        )
+        latest2 = self._finished(
+            dbsession, "git@github.com:user/repo2.git", JobStatus.FAILED
+        )
+        create_job(
+            JobCreate(git_repository_url="git@github.com:user/repo2.git"), dbsession
+        )
+
+        jobs = get_all_unique_jobs(dbsession)
+
+        assert [job.job_id for job in jobs] == [latest1, latest2]
+
+    def test_older_job_finishing_late_does_not_win(self, dbsession):
+        repo = "git@github.com:user/repo.git"
+        older = create_job(JobCreate(git_repository_url=repo), dbsession).job_id
+        newer = self._finished(dbsession, repo, JobStatus.SUCCEEDED)
+        update_job_status(dbsession, older, JobStatus.FAILED)
+
+        assert [job.job_id for job in get_all_unique_jobs(dbsession)] == [newer]
+
+    def test_rerun_falls_back_to_previous_finished_job(self, dbsession):
+        repo = "git@github.com:user/repo.git"
+        previous = self._finished(dbsession, repo, JobStatus.FAILED)
+        rerun = self._finished(dbsession, repo, JobStatus.SUCCEEDED)
+        update_job_status(dbsession, rerun, JobStatus.RUNNING)
+
+        assert [job.job_id for job in get_all_unique_jobs(dbsession)] == [previous]
+
+
+class TestGetCachedJob:
+
+    def test_returns_succeeded_job_for_same_commit_and_config(self, dbsession):
+        job_create = JobCreate(git_repository_url="git@github.com:user/repo.git")
+        created = create_job(job_create, dbsession, "a" * 40)
+        update_job_status(dbsession, created.job_id, JobStatus.SUCCEEDED)
+        dbsession.commit()
+
+        result = get_cached_job(
+            dbsession, "git@github.com:user/repo.git", "a" * 40, "default"
+        )
+
+        assert result is not None
+        assert result.job_id == created.job_id
+
+    def test_ignores_other_configs_and_unfinished_jobs(self, dbsession):
+        job_create = JobCreate(git_repository_url="git@github.com:user/repo.git")
+        succeeded = create_job(job_create, dbsession, "a" * 40)
+        update_job_status(dbsession, succeeded.job_id, JobStatus.SUCCEEDED)
+        create_job(job_create, dbsession, "b" * 40)
+        dbsession.commit()
+
+        assert (
+            get_cached_job(dbsession, "git@github.com:user/repo.git", "a" * 40, "debug")
+            is None
+        )
+        assert (
+            get_cached_job(
+                dbsession, "git@github.com:user/repo.git", "b" * 40, "default"
+            )
+            is None
+        )
+
+
+class TestSupersedeJobs:
+
+    def test_supersedes_only_queued_jobs(self, dbsession):
+        job_create = JobCreate(git_repository_url="git@github.com:user/repo.git")
+        queued = create_job(job_create, dbsession, "a" * 40)
+        running = create_job(job_create, dbsession, "b" * 40)
+        update_job_status(dbsession, running.job_id, JobStatus.RUNNING)
+        dbsession.commit()
+
+        supersede_jobs(dbsession, [queued.job_id, running.job_id])
+
+        assert get_job_by_id(dbsession, queued.job_id).job_status == (
+            JobStatus.SUPERSEDED
+        )
+        assert get_job_by_id(dbsession, running.job_id).job_status == JobStatus.RUNNING
+        assert (
+            get_queued_jobs(dbsession, "git@github.com:user/repo.git", "default") == []
+        )
@@ -0,0 +1,134 @@
+"""Integration tests for artifact retention"""
+
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, update
+
+from buildserver.api.jobs.models import (
+    Artifact,
+    ArtifactUpload,
+    Blob,
+    Job,
+    JobCreate,
+    JobRead,
+    JobStatus,
+)
+from buildserver.services.builds import (
+    create_job,
+    register_artifacts,
+    set_job_bundle,
+    update_job_status,
+)
+from buildserver.services.retention import (
+    enforce_repository_quota,
+    enforce_store_quota,
+    keep_last_commits,
+    record_artifact_access,
+)
+
+REPO = "git@github.com:user/repo.git"
+
+
+def _build(dbsession, commit: str, digests: list[str], age: int = 0) -> JobRead:
+    """A successful job for commit with one 10 byte artifact per digest."""
+    job = JobRead(
+        **create_job(JobCreate(git_repository_url=REPO), dbsession, commit)._mapping
+    )
+    built_at = datetime.now() - timedelta(hours=age)
+    dbsession.execute(
+        update(Job).where(Job.job_id == job.job_id).values(created_at=built_at)
+    )
+    update_job_status(dbsession, job.job_id, JobStatus.SUCCEEDED)
+    register_artifacts(
+        dbsession,
+        job,
+        [
+            ArtifactUpload(
+                artifact_file_name=f"bin{i}",
+                artifact_path=f"bin{i}",
+                digest=digest,
+                size=10,
+            )
+            for i, digest in enumerate(digests)
+        ],
+    )
+    dbsession.execute(
+        update(Artifact)
+        .where(Artifact.job_id == job.job_id)
+        .values(last_accessed_at=built_at)
+    )
+    return job
+
+
+def _commits(dbsession) -> list[str]:
+    stmt = select(Artifact.commit_hash).distinct().order_by(Artifact.commit_hash)
+    return list(dbsession.execute(stmt).scalars())
+
+
+def _ref_count(dbsession, digest: str) -> int:
+    stmt = select(Blob.ref_count).where(Blob.digest == digest)
+    return dbsession.execute(stmt).scalar_one()
+
+
+class TestKeepLastCommits:
+
+    def test_deletes_artifacts_of_older_commits(self, dbsession):
+        _build(dbsession, "a" * 40, ["1" * 64], age=3)
+        _build(dbsession, "b" * 40, ["1" * 64], age=2)
+        _build(dbsession, "c" * 40, ["2" * 64], age=1)
+
+        assert keep_last_commits(dbsession, 2) == 1
+        assert _commits(dbsession) == ["b" * 40, "c" * 40]
+        assert _ref_count(dbsession, "1" * 64) == 1
+
+    def test_releases_bundles_of_older_commits(self, dbsession):
+        old = _build(dbsession, "a" * 40, [], age=2)
+        _build(dbsession, "b" * 40, [], age=1)
+        set_job_bundle(dbsession, old.job_id, "3" * 64, 100)
+
+        keep_last_commits(dbsession, 1)
+
+        stmt = select(Job.bundle_digest).where(Job.job_id == old.job_id)
+        assert dbsession.execute(stmt).scalar_one() is None
+        assert _ref_count(dbsession, "3" * 64) == 0
+
+
+class TestQuotas:
+
+    def test_repository_quota_evicts_least_recently_used(self, dbsession):
+        old = _build(dbsession, "a" * 40, ["1" * 64, "2" * 64], age=3)
+        _build(dbsession, "b" * 40, ["3" * 64], age=2)
+        _build(dbsession, "c" * 40, ["4" * 64, "5" * 64], age=1)
+        # a download makes the oldest build's first artifact the most recent
+        stmt = select(Artifact.artifact_id).where(Artifact.job_id == old.job_id)
+        record_artifact_access(dbsession, min(dbsession.execute(stmt).scalars()))
+
+        assert enforce_repository_quota(dbsession, 30) == 2
+        assert _commits(dbsession) == ["a" * 40, "c" * 40]
+
+    def test_never_evicts_latest_build(self, dbsession):
+        _build(dbsession, "a" * 40, ["1" * 64, "2" * 64, "3" * 64])
+
+        assert enforce_repository_quota(dbsession, 10) == 0
+        assert enforce_store_quota(dbsession, 10) == 0
+
+    def test_store_quota_counts_shared_blobs_once(self, dbsession):
+        _build(dbsession, "a" * 40, ["1" * 64, "2" * 64], age=3)
+        _build(dbsession, "b" * 40, ["1" * 64], age=2)
+        _build(dbsession, "c" * 40, ["3" * 64], age=1)
+
+        # 30 bytes of blobs. Evicting commit a's artifacts frees only blob 2,
+        # blob 1 is still referenced by commit b.
+        assert enforce_store_quota(dbsession, 20) == 2
+        assert _commits(dbsession) == ["b" * 40, "c" * 40]
+        assert _ref_count(dbsession, "2" * 64) == 0
+
+    def test_store_quota_skips_blobs_of_latest_builds(self, dbsession):
+        _build(dbsession, "a" * 40, ["1" * 64, "2" * 64], age=2)
+        _build(dbsession, "b" * 40, ["1" * 64, "3" * 64], age=1)
+
+        # blob 1 is kept by the latest build, evicting commit a's copy of it
+        # would free nothing
+        assert enforce_store_quota(dbsession, 10) == 1
+        assert _ref_count(dbsession, "1" * 64) == 2
+        assert _ref_count(dbsession, "2" * 64) == 0
@@ -0,0 +1,303 @@
+import asyncio
+import hashlib
+from contextlib import contextmanager
+from datetime import datetime
+from unittest.mock import MagicMock, patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+from buildserver.api.jobs.models import ArtifactRead, JobRead, JobStatus
+from buildserver.artifacts.blobstore import BlobStore
+from buildserver.database.core import get_session
+
+CONTENT = b"\x7fELF binary" * 1000
+DIGEST = hashlib.sha256(CONTENT).hexdigest()
+JOB = JobRead(
+    job_id=1,
+    git_repository_url="git@github.com:user/repo.git",
+    commit_hash="a" * 40,
+    job_status=JobStatus.RUNNING,
+    created_at=datetime(2024, 1, 1),
+)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return BlobStore(tmp_path)
+
+
+@pytest.fixture
+def client(store):
+    from buildserver.main import app
+
+    app.dependency_overrides[get_session] = lambda: MagicMock()
+    with (
+        patch("buildserver.api.artifacts.views.blob_store", store),
+        patch("buildserver.api.artifacts.views.get_job_by_id") as get_job,
+    ):
+        get_job.return_value = JOB
+        yield TestClient(app)
+    app.dependency_overrides.clear()
+
+
+def _upload(client, chunks: list[bytes]) -> dict:
+    upload_id = client.post("/artifacts/uploads").json()["upload_id"]
+    offset = 0
+    for chunk in chunks:
+        resp = client.patch(
+            f"/artifacts/uploads/{upload_id}",
+            params={"offset": offset},
+            content=chunk,
+        )
+        offset = resp.json()["offset"]
+    return client.put(f"/artifacts/uploads/{upload_id}", params={"digest": DIGEST})
+
+
+class TestUploadEndpoints:
+
+    def test_chunked_upload_creates_blob(self, client, store):
+        assert client.head(f"/artifacts/blobs/{DIGEST}").status_code == 404
+
+        resp = _upload(client, [CONTENT[:4096], CONTENT[4096:]])
+
+        assert resp.json() == {"digest": DIGEST, "size": len(CONTENT)}
+        assert store.path(DIGEST).read_bytes() == CONTENT
+        resp = client.head(f"/artifacts/blobs/{DIGEST}")
+        assert resp.status_code == 200
+        assert resp.headers["Content-Length"] == str(len(CONTENT))
+
+    def test_resume_from_reported_offset(self, client):
+        upload_id = client.post("/artifacts/uploads").json()["upload_id"]
+        client.patch(
+            f"/artifacts/uploads/{upload_id}",
+            params={"offset": 0},
+            content=CONTENT[:100],
+        )
+
+        offset = client.get(f"/artifacts/uploads/{upload_id}").json()["offset"]
+        assert offset == 100
+        resp = client.patch(
+            f"/artifacts/uploads/{upload_id}",
+            params={"offset": 200},
+            content=CONTENT[200:],
+        )
+        assert resp.status_code == 409
+
+    def test_opens_upload_off_the_event_loop(self, client, store):
+        on_loop = []
+        open_upload = store.open_upload
+
+        @contextmanager
+        def spy(upload_id, offset):
+            try:
+                asyncio.get_running_loop()
+                on_loop.append(True)
+            except RuntimeError:
+                on_loop.append(False)
+            with open_upload(upload_id, offset) as upload:
+                yield upload
+
+        with patch.object(store, "open_upload", spy):
+            resp = _upload(client, [CONTENT[:4096], CONTENT[4096:]])
+
+        assert resp.status_code == 200
+        assert on_loop == [False, False]
+
+    def test_digest_mismatch(self, client):
+        resp = _upload(client, [CONTENT[1:]])
+
+        assert resp.status_code == 400
+
+    def test_invalid_digest(self, client):
+        assert client.head("/artifacts/blobs/not-a-digest").status_code == 400
+
+
+class TestRegisterArtifacts:
+
+    UPLOAD = {
+        "artifact_file_name": "main",
+        "artifact_path": "bin/main",
+        "digest": DIGEST,
+        "size": len(CONTENT),
+    }
+
+    def test_rejects_blobs_not_uploaded(self, client):
+        resp = client.post("/jobs/1/artifacts", json=[self.UPLOAD])
+
+        assert resp.status_code == 400
+        assert resp.json()["detail"][0]["digests"] == [DIGEST]
+
+    @patch("buildserver.api.artifacts.views.register_artifacts")
+    def test_registers_in_bulk(self, mock_register, client):
+        _upload(client, [CONTENT])
+        mock_register.return_value = [
+            ArtifactRead(
+                artifact_id=1,
+                job_id=1,
+                git_repository_url=JOB.git_repository_url,
+                commit_hash=JOB.commit_hash,
+                **self.UPLOAD,
+            )
+        ]
+
+        resp = client.post("/jobs/1/artifacts", json=[self.UPLOAD, self.UPLOAD])
+
+        assert resp.status_code == 200
+        _, job, uploads = mock_register.call_args.args
+        assert job == JOB
+        assert len(uploads) == 2
+
+    @patch("buildserver.api.artifacts.views.register_artifacts")
+    def test_rejects_blob_collected_while_registering(
+        self, mock_register, client, store
+    ):
+        _upload(client, [CONTENT])
+        mock_register.side_effect = lambda *args: store.delete(DIGEST) and []
+
+        resp = client.post("/jobs/1/artifacts", json=[self.UPLOAD])
+
+        assert resp.status_code == 400
+        assert resp.json()["detail"][0]["digests"] == [DIGEST]
+
+
+class TestDownload:
+
+    @pytest.fixture
+    def blob(self, store, tmp_path):
+        src = tmp_path / "main"
+        src.write_bytes(CONTENT)
+        store.put(src)
+        return store.path(DIGEST)
+
+    def test_serves_blob_with_strong_etag(self, client, blob):
+        resp = client.get(f"/artifacts/blobs/{DIGEST}")
+
+        assert resp.content == CONTENT
+        assert resp.headers["ETag"] == f'"{DIGEST}"'
+        assert "immutable" in resp.headers["Cache-Control"]
+        assert resp.headers["Accept-Ranges"] == "bytes"
+
+    def test_range(self, client, blob):
+        resp = client.get(f"/artifacts/blobs/{DIGEST}", headers={"Range": "bytes=4-7"})
+
+        assert resp.status_code == 206
+        assert resp.content == CONTENT[4:8]
+        assert resp.headers["Content-Range"] == f"bytes 4-7/{len(CONTENT)}"
+
+    def test_if_range_with_other_etag_sends_whole_blob(self, client, blob):
+        resp = client.get(
+            f"/artifacts/blobs/{DIGEST}",
+            headers={"Range": "bytes=4-7", "If-Range": '"other"'},
+        )
+
+        assert resp.status_code == 200
+        assert resp.content == CONTENT
+
+    def test_not_modified(self, client, blob):
+        resp = client.get(
+            f"/artifacts/blobs/{DIGEST}",
+            headers={"If-None-Match": f'"other", W/"{DIGEST}"'},
+        )
+
+        assert resp.status_code == 304
+        assert resp.content == b""
+
+    def test_missing_blob(self, client):
+        assert client.get(f"/artifacts/blobs/{DIGEST}").status_code == 404
+
+    def test_hands_off_to_nginx(self, client, blob):
+        with patch("buildserver.api.artifacts.views.BLOB_ACCEL_REDIRECT", "/_blobs/"):
+            resp = client.get(f"/artifacts/blobs/{DIGEST}")
+
+        assert resp.content == b""
+        assert resp.headers["X-Accel-Redirect"] == (
+            f"/_blobs/{DIGEST[:2]}/{DIGEST[2:4]}/{DIGEST}"
+        )
+        assert resp.headers["ETag"] == f'"{DIGEST}"'
+
+    @patch("buildserver.api.artifacts.views.get_artifact_by_id")
+    def test_artifact_by_id(self, mock_get_artifact, client, blob):
+        mock_get_artifact.return_value = ArtifactRead(
+            artifact_id=1,
+            git_repository_url=JOB.git_repository_url,
+            commit_hash=JOB.commit_hash,
+            artifact_file_name="main",
+            artifact_path="bin/main",
+            digest=DIGEST,
+            size=len(CONTENT),
+        )
+
+        resp = client.get("/artifacts/1")
+
+        assert resp.content == CONTENT
+        assert resp.headers["Content-Disposition"] == 'attachment; filename="main"'
+
+    @patch("buildserver.api.artifacts.views.record_blob_access")
+    def test_download_records_access(self, mock_record, client, blob):
+        client.get(f"/artifacts/blobs/{DIGEST}")
+
+        assert mock_record.call_args.args[1] == DIGEST
+
+    @patch("buildserver.api.artifacts.views.record_blob_access")
+    def test_missing_blob_records_nothing(self, mock_record, client):
+        client.get(f"/artifacts/blobs/{DIGEST}")
+
+        mock_record.assert_not_called()
+
+
+class TestBundleEndpoints:
+
+    @pytest.fixture
+    def bundled(self, client, store, tmp_path):
+        from buildserver.api.artifacts import views
+        from buildserver.tests.unit.bundle_test import MEMBERS, write_bundle
+
+        pytest.importorskip("zstandard")
+        src = tmp_path / "bundle.tar.zst"
+        write_bundle(src, MEMBERS)
+        digest, _ = store.put(src)
+        views._bundle_index.cache_clear()
+        with patch("buildserver.api.artifacts.views.get_job_by_id") as get_job:
+            get_job.return_value = JOB.model_copy(update={"bundle_digest": digest})
+            yield MEMBERS
+        views._bundle_index.cache_clear()
+
+    def test_downloads_whole_bundle(self, client, bundled):
+        resp = client.get("/jobs/1/bundle")
+
+        assert resp.status_code == 200
+        assert resp.headers["Content-Disposition"] == (
+            'attachment; filename="job-1.tar.zst"'
+        )
+
+    def test_lists_index(self, client, bundled):
+        resp = client.get("/jobs/1/bundle/index")
+
+        assert [m["name"] for m in resp.json()] == list(bundled)
+
+    def test_extracts_member(self, client, bundled):
+        resp = client.get("/jobs/1/bundle/members/src/util.o")
+
+        assert resp.content == bundled["src/util.o"]
+        assert resp.headers["ETag"] == (
+            f'"{hashlib.sha256(bundled["src/util.o"]).hexdigest()}"'
+        )
+
+    def test_missing_member(self, client, bundled):
+        assert client.get("/jobs/1/bundle/members/nope").status_code == 404
+
+    def test_job_without_bundle(self, client):
+        assert client.get("/jobs/1/bundle").status_code == 404
+
+    @patch("buildserver.api.artifacts.views.set_job_bundle")
+    def test_registers_uploaded_bundle(self, mock_set_bundle, client):
+        _upload(client, [CONTENT])
+        mock_set_bundle.return_value = JOB.model_copy(update={"bundle_digest": DIGEST})
+
+        resp = client.put(
+            "/jobs/1/bundle", json={"digest": DIGEST, "size": len(CONTENT)}
+        )
+
+        assert resp.json()["bundle_digest"] == DIGEST
+        mock_set_bundle.assert_called_once()
@@ -0,0 +1,55 @@
+from datetime import datetime
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from buildserver.api.jobs.models import JobRead, JobStatus
+from buildserver.services.async_builds import update_job_status
+from buildserver.services.builds import JobSupersededError
+
+JOB = JobRead(
+    job_id=1,
+    git_repository_url="git@github.com:user/repo.git",
+    commit_hash="a" * 40,
+    job_status=JobStatus.SUCCEEDED,
+    created_at=datetime(2024, 1, 1),
+)
+
+
+def _session(*records) -> AsyncMock:
+    """An AsyncSession whose executes return records, one per call."""
+    dbsession = AsyncMock()
+    dbsession.execute.side_effect = [
+        MagicMock(**{"one_or_none.return_value": record}) for record in records
+    ]
+    return dbsession
+
+
+class TestUpdateJobStatus:
+
+    @pytest.mark.asyncio
+    async def test_finished_job_becomes_latest(self):
+        dbsession = _session(MagicMock(_mapping=JOB.model_dump()), None, None)
+
+        job = await update_job_status(dbsession, 1, JobStatus.SUCCEEDED)
+
+        assert job == JOB
+        upserts = [c.args[0] for c in dbsession.execute.call_args_list[1:]]
+        assert [u.table.name for u in upserts] == [
+            "repository_latest_job",
+            "repository_latest_success",
+        ]
+
+    @pytest.mark.asyncio
+    async def test_raises_for_superseded_job(self):
+        superseded = {**JOB.model_dump(), "job_status": JobStatus.SUPERSEDED}
+        dbsession = _session(None, MagicMock(_mapping=superseded))
+
+        with pytest.raises(JobSupersededError):
+            await update_job_status(dbsession, 1, JobStatus.RUNNING)
+
+    @pytest.mark.asyncio
+    async def test_returns_none_for_missing_job(self):
+        dbsession = _session(None, None)
+
+        assert await update_job_status(dbsession, 1, JobStatus.RUNNING) is None
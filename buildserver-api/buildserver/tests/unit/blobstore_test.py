@@ -0,0 +1,185 @@
+import errno
+import hashlib
+import os
+import stat
+import time
+from unittest.mock import patch
+
+import pytest
+
+from buildserver.artifacts.blobstore import (
+    BlobStore,
+    DigestMismatchError,
+    InvalidDigestError,
+    UploadConflictError,
+    UploadNotFoundError,
+    copy_artifact,
+)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return BlobStore(tmp_path / "blobs")
+
+
+class TestBlobStore:
+
+    def test_shards_by_digest_prefix(self, store):
+        digest = "ab" + "cd" + "0" * 60
+
+        assert store.path(digest) == store.root / "ab" / "cd" / digest
+
+    @pytest.mark.parametrize("digest", ["", "A" * 64, "a" * 63, "../" + "a" * 61])
+    def test_rejects_invalid_digests(self, store, digest):
+        with pytest.raises(InvalidDigestError):
+            store.path(digest)
+
+    def test_put_stores_content_under_its_digest(self, store, tmp_path):
+        src = tmp_path / "main"
+        src.write_bytes(b"binary")
+
+        digest, stored = store.put(src)
+
+        assert digest == hashlib.sha256(b"binary").hexdigest()
+        assert stored
+        assert store.path(digest).read_bytes() == b"binary"
+
+    def test_put_skips_existing_content(self, store, tmp_path):
+        first = tmp_path / "first"
+        second = tmp_path / "second"
+        first.write_bytes(b"binary")
+        second.write_bytes(b"binary")
+        digest, _ = store.put(first)
+        old = time.time() - 3600
+        os.utime(store.path(digest), (old, old))
+
+        with patch("buildserver.artifacts.blobstore.copy_artifact") as mock_copy:
+            assert store.put(second) == (digest, False)
+
+        mock_copy.assert_not_called()
+        assert store.modified_since(digest, old + 1)
+
+    def test_digests_filters_by_age(self, store, tmp_path):
+        src = tmp_path / "main"
+        src.write_bytes(b"binary")
+        digest, _ = store.put(src)
+
+        assert list(store.digests()) == [digest]
+        assert list(store.digests(older_than=time.time() - 60)) == []
+
+    def test_delete(self, store, tmp_path):
+        src = tmp_path / "main"
+        src.write_bytes(b"binary")
+        digest, _ = store.put(src)
+
+        assert store.delete(digest)
+        assert not store.exists(digest)
+        assert not store.delete(digest)
+
+
+class TestUploads:
+
+    def test_resumes_and_verifies(self, store):
+        upload_id = store.start_upload()
+        with store.open_upload(upload_id, 0) as upload:
+            upload.write(b"hello ")
+        assert store.upload_size(upload_id) == 6
+
+        # a fresh store has no cached hash state and rehashes from disk
+        resumed = BlobStore(store.root)
+        with resumed.open_upload(upload_id, 6) as upload:
+            upload.write(b"world")
+
+        digest = hashlib.sha256(b"hello world").hexdigest()
+        assert resumed.finish_upload(upload_id, digest) == (digest, 11)
+        assert store.path(digest).read_bytes() == b"hello world"
+        with pytest.raises(UploadNotFoundError):
+            store.upload_size(upload_id)
+
+    def test_retried_bytes_are_skipped(self, store):
+        upload_id = store.start_upload()
+        with store.open_upload(upload_id, 0) as upload:
+            upload.write(b"hello ")
+        with store.open_upload(upload_id, 0) as upload:
+            upload.write(b"hello world")
+
+        digest = hashlib.sha256(b"hello world").hexdigest()
+        assert store.finish_upload(upload_id, digest) == (digest, 11)
+
+    def test_rejects_gaps(self, store):
+        upload_id = store.start_upload()
+
+        with pytest.raises(UploadConflictError):
+            with store.open_upload(upload_id, 1):
+                pass
+
+    def test_rejects_concurrent_writers(self, store):
+        upload_id = store.start_upload()
+
+        with store.open_upload(upload_id, 0):
+            with pytest.raises(UploadConflictError):
+                with store.open_upload(upload_id, 0):
+                    pass
+
+    def test_digest_mismatch_discards_upload(self, store):
+        upload_id = store.start_upload()
+        with store.open_upload(upload_id, 0) as upload:
+            upload.write(b"corrupt")
+
+        with pytest.raises(DigestMismatchError):
+            store.finish_upload(upload_id, "0" * 64)
+        with pytest.raises(UploadNotFoundError):
+            store.upload_size(upload_id)
+
+    def test_unknown_upload(self, store):
+        with pytest.raises(UploadNotFoundError):
+            store.upload_size("../../etc/passwd")
+
+    def test_expire_uploads(self, store):
+        upload_id = store.start_upload()
+
+        assert store.expire_uploads(time.time() - 60) == 0
+        assert store.expire_uploads(time.time() + 60) == 1
+        with pytest.raises(UploadNotFoundError):
+            store.upload_size(upload_id)
+
+
+class TestCopyArtifact:
+
+    def test_links_when_allowed(self, tmp_path):
+        src = tmp_path / "src"
+        src.write_bytes(b"data")
+
+        assert copy_artifact(src, tmp_path / "dst", allow_link=True) == "link"
+        assert os.path.samefile(src, tmp_path / "dst")
+
+    def test_copies_without_sharing_inode(self, tmp_path):
+        src = tmp_path / "src"
+        src.write_bytes(b"data" * 10000)
+        src.chmod(0o750)
+        dst = tmp_path / "dst"
+
+        method = copy_artifact(src, dst)
+
+        assert method in ("reflink", "copy_file_range", "copy")
+        assert not os.path.samefile(src, dst)
+        assert dst.read_bytes() == src.read_bytes()
+        assert stat.S_IMODE(dst.stat().st_mode) == 0o750
+
+    def test_falls_back_across_devices(self, tmp_path):
+        src = tmp_path / "src"
+        src.write_bytes(b"data")
+        dst = tmp_path / "dst"
+        cross_device = OSError(errno.EXDEV, "cross-device link")
+
+        with (
+            patch("buildserver.artifacts.blobstore.os.link", side_effect=cross_device),
+            patch("buildserver.artifacts.blobstore.fcntl.ioctl", side_effect=OSError),
+            patch(
+                "buildserver.artifacts.blobstore.os.copy_file_range",
+                side_effect=cross_device,
+            ),
+        ):
+            assert copy_artifact(src, dst, allow_link=True) == "copy"
+
+        assert dst.read_bytes() == b"data"
@@ -0,0 +1,88 @@
+import hashlib
+import io
+import json
+import tarfile
+
+import pytest
+
+from buildserver.artifacts import bundle
+from buildserver.artifacts.bundle import (
+    BundleError,
+    find_member,
+    read_index,
+    read_member,
+)
+
+zstandard = pytest.importorskip("zstandard")
+
+MEMBERS = {"main": b"\x7fELF binary" * 100, "src/util.o": b"object" * 5000}
+
+
+def write_bundle(path, members: dict[str, bytes]) -> None:
+    """The layout runner.bundle writes, one zstd frame per tar member."""
+    compressor = zstandard.ZstdCompressor()
+    out = io.BytesIO()
+    index = []
+    for name, data in members.items():
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        header = info.tobuf(format=tarfile.PAX_FORMAT)
+        padding = b"\0" * (-len(data) % tarfile.BLOCKSIZE)
+        frame = compressor.compress(header + data + padding)
+        index.append(
+            {
+                "name": name,
+                "size": len(data),
+                "mode": 0o644,
+                "digest": hashlib.sha256(data).hexdigest(),
+                "offset": out.tell(),
+                "length": len(frame),
+                "header": len(header),
+            }
+        )
+        out.write(frame)
+    out.write(compressor.compress(b"\0" * (2 * tarfile.BLOCKSIZE)))
+    index_offset = out.tell()
+    payload = json.dumps(index).encode()
+    out.write(bundle.SKIPPABLE_HEADER.pack(bundle.INDEX_MAGIC, len(payload)) + payload)
+    out.write(
+        bundle.FOOTER.pack(bundle.FOOTER_MAGIC, 16, index_offset, bundle.FOOTER_TAG)
+    )
+    path.write_bytes(out.getvalue())
+
+
+@pytest.fixture
+def bundle_path(tmp_path):
+    path = tmp_path / "bundle.tar.zst"
+    write_bundle(path, MEMBERS)
+    return path
+
+
+class TestBundle:
+
+    def test_is_a_plain_tar_zst(self, bundle_path):
+        with zstandard.ZstdDecompressor().stream_reader(
+            open(bundle_path, "rb"), read_across_frames=True
+        ) as reader:
+            raw = reader.read()
+        with tarfile.open(fileobj=io.BytesIO(raw)) as tar:
+            assert tar.extractfile("src/util.o").read() == MEMBERS["src/util.o"]
+
+    def test_reads_index(self, bundle_path):
+        index = read_index(bundle_path)
+
+        assert [m.name for m in index] == ["main", "src/util.o"]
+        assert index[1].digest == hashlib.sha256(MEMBERS["src/util.o"]).hexdigest()
+
+    def test_extracts_one_member(self, bundle_path, monkeypatch):
+        monkeypatch.setattr(bundle, "READ_BYTES", 1000)
+        member = find_member(read_index(bundle_path), "src/util.o")
+
+        assert b"".join(read_member(bundle_path, member)) == MEMBERS["src/util.o"]
+
+    def test_rejects_other_files(self, tmp_path):
+        path = tmp_path / "main"
+        path.write_bytes(b"\x7fELF binary" * 100)
+
+        with pytest.raises(BundleError):
+            read_index(path)
@@ -1,9 +1,237 @@
 from datetime import datetime
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, call, patch
 
-from buildserver.api.jobs.models import JobStatus
-from buildserver.services.builds import update_job_status
+import pytest
+from sqlalchemy.dialects import postgresql
+
+from buildserver.api.jobs.models import (
+    JobCreate,
+    JobRead,
+    JobStatus,
+    RepositoryLatestJob,
+    RepositoryLatestSuccess,
+)
+from buildserver.services.builds import (
+    JobSupersededError,
+    _refresh_latest_stmts,
+    register_job,
+    update_job_status,
+)
 
 
 class TestUpdateJobStatus:
     pass
+
+
+class TestRegisterJob:
+
+    CACHED = JobRead(
+        job_id=1,
+        git_repository_url="git@github.com:user/repo.git",
+        commit_hash="a" * 40,
+        job_status=JobStatus.SUCCEEDED,
+        created_at=datetime(2024, 1, 1),
+    )
+
+    @patch("buildserver.services.builds.RabbitMQProducer")
+    @patch("buildserver.services.builds.get_cached_job")
+    @patch("buildserver.services.builds.get_remote_hash")
+    def test_returns_cached_job_without_queueing(
+        self, mock_get_remote_hash, mock_get_cached_job, mock_producer
+    ):
+        mock_get_remote_hash.return_value = "a" * 40
+        mock_get_cached_job.return_value = self.CACHED
+        dbsession = MagicMock()
+
+        result = register_job(
+            JobCreate(git_repository_url="git@github.com:user/repo.git"), dbsession
+        )
+
+        assert result == self.CACHED
+        mock_get_cached_job.assert_called_once_with(
+            dbsession, "git@github.com:user/repo.git", "a" * 40, "default"
+        )
+        dbsession.execute.assert_not_called()
+        mock_producer.assert_not_called()
+
+    @patch("buildserver.services.builds.RabbitMQProducer")
+    @patch("buildserver.services.builds.create_job")
+    @patch("buildserver.services.builds.get_cached_job")
+    @patch("buildserver.services.builds.get_remote_hash")
+    def test_force_skips_cache(
+        self, mock_get_remote_hash, mock_get_cached_job, mock_create_job, mock_producer
+    ):
+        mock_get_remote_hash.return_value = "a" * 40
+        mock_create_job.return_value = MagicMock(
+            _mapping={**self.CACHED.model_dump(), "job_status": JobStatus.QUEUED}
+        )
+
+        result = register_job(
+            JobCreate(git_repository_url="git@github.com:user/repo.git", force=True),
+            MagicMock(),
+        )
+
+        assert result.job_status == JobStatus.QUEUED
+        mock_get_cached_job.assert_not_called()
+        mock_producer.return_value.publish.assert_called_once()
+
+
+@patch("buildserver.services.builds.RabbitMQProducer")
+@patch("buildserver.services.builds.create_job")
+@patch("buildserver.services.builds.supersede_jobs")
+@patch("buildserver.services.builds.get_queued_jobs")
+@patch("buildserver.services.builds.lock_repository")
+@patch("buildserver.services.builds.get_cached_job", return_value=None)
+@patch("buildserver.services.builds.get_remote_hash", return_value="b" * 40)
+class TestCoalescing:
+
+    REPO = "git@github.com:user/repo.git"
+
+    def _queued(self, job_id: int, commit_hash: str) -> JobRead:
+        return JobRead(
+            job_id=job_id,
+            git_repository_url=self.REPO,
+            commit_hash=commit_hash,
+            job_status=JobStatus.QUEUED,
+            created_at=datetime(2024, 1, 1),
+        )
+
+    def test_attaches_to_queued_job_for_same_commit(
+        self,
+        _hash,
+        _cache,
+        _lock,
+        mock_queued,
+        mock_supersede,
+        mock_create,
+        mock_producer,
+    ):
+        mock_queued.return_value = [self._queued(2, "b" * 40)]
+
+        result = register_job(JobCreate(git_repository_url=self.REPO), MagicMock())
+
+        assert result.job_id == 2
+        mock_supersede.assert_not_called()
+        mock_create.assert_not_called()
+        mock_producer.assert_not_called()
+
+    def test_newer_commit_supersedes_queued_jobs(
+        self,
+        _hash,
+        _cache,
+        _lock,
+        mock_queued,
+        mock_supersede,
+        mock_create,
+        mock_producer,
+    ):
+        mock_queued.return_value = [
+            self._queued(2, "a" * 40),
+            self._queued(1, "9" * 40),
+        ]
+        mock_create.return_value = MagicMock(
+            _mapping=self._queued(3, "b" * 40).model_dump()
+        )
+        dbsession = MagicMock()
+
+        result = register_job(JobCreate(git_repository_url=self.REPO), dbsession)
+
+        assert result.job_id == 3
+        mock_supersede.assert_called_once_with(dbsession, [2, 1])
+        mock_producer.return_value.publish.assert_called_once()
+
+    def test_locks_repository_before_reading_queue(
+        self,
+        _hash,
+        _cache,
+        mock_lock,
+        mock_queued,
+        mock_supersede,
+        mock_create,
+        mock_producer,
+    ):
+        calls = []
+        mock_lock.side_effect = lambda *a: calls.append("lock")
+        mock_queued.side_effect = lambda *a: calls.append("queued") or []
+        mock_create.return_value = MagicMock(
+            _mapping=self._queued(3, "b" * 40).model_dump()
+        )
+
+        register_job(JobCreate(git_repository_url=self.REPO), MagicMock())
+
+        assert calls == ["lock", "queued"]
+
+
+class TestUpdateSupersededJob:
+
+    @patch("buildserver.services.builds.get_job_by_id")
+    def test_raises_for_superseded_job(self, mock_get_job_by_id):
+        dbsession = MagicMock()
+        dbsession.execute.return_value.one_or_none.return_value = None
+        mock_get_job_by_id.return_value = MagicMock(job_status=JobStatus.SUPERSEDED)
+
+        with pytest.raises(JobSupersededError):
+            update_job_status(dbsession, 1, JobStatus.RUNNING)
+
+    @patch("buildserver.services.builds.get_job_by_id", return_value=None)
+    def test_returns_none_for_missing_job(self, _):
+        dbsession = MagicMock()
+        dbsession.execute.return_value.one_or_none.return_value = None
+
+        assert update_job_status(dbsession, 1, JobStatus.RUNNING) is None
+
+
+class TestLatestJobReadModel:
+
+    JOB = TestRegisterJob.CACHED
+
+    def _session(self, *results):
+        dbsession = MagicMock()
+        dbsession.execute.return_value.one_or_none.side_effect = results
+        return dbsession
+
+    @patch("buildserver.services.builds.refresh_latest_job")
+    @patch("buildserver.services.builds.record_latest_job")
+    def test_finished_job_becomes_latest(self, mock_record, mock_refresh):
+        dbsession = self._session(MagicMock(_mapping=self.JOB.model_dump()))
+
+        update_job_status(dbsession, 1, JobStatus.SUCCEEDED)
+
+        assert mock_record.call_args_list == [
+            call(dbsession, self.JOB, RepositoryLatestJob),
+            call(dbsession, self.JOB, RepositoryLatestSuccess),
+        ]
+        mock_refresh.assert_not_called()
+
+    @patch("buildserver.services.builds.refresh_latest_job")
+    @patch("buildserver.services.builds.record_latest_job")
+    def test_failed_job_replaces_latest_success(self, mock_record, mock_refresh):
+        failed = {**self.JOB.model_dump(), "job_status": JobStatus.FAILED}
+        dbsession = self._session(MagicMock(_mapping=failed), MagicMock())
+
+        update_job_status(dbsession, 1, JobStatus.FAILED)
+
+        assert mock_record.call_args.args[2] is RepositoryLatestJob
+        mock_refresh.assert_called_once_with(
+            dbsession, self.JOB.git_repository_url, RepositoryLatestSuccess
+        )
+
+    @patch("buildserver.services.builds.refresh_latest_job")
+    @patch("buildserver.services.builds.record_latest_job")
+    def test_rerun_of_latest_job_is_recomputed(self, mock_record, mock_refresh):
+        running = {**self.JOB.model_dump(), "job_status": JobStatus.RUNNING}
+        dbsession = self._session(MagicMock(_mapping=running), MagicMock(), None)
+
+        update_job_status(dbsession, 1, JobStatus.RUNNING)
+
+        mock_record.assert_not_called()
+        mock_refresh.assert_called_once_with(
+            dbsession, self.JOB.git_repository_url, RepositoryLatestJob
+        )
+
+    def test_refresh_tolerates_concurrent_refresh(self):
+        # both refreshes may delete nothing, the second insert then updates
+        _, add = _refresh_latest_stmts(self.JOB.git_repository_url)
+
+        sql = str(add.compile(dialect=postgresql.dialect()))
+        assert "ON CONFLICT (git_repository_url) DO UPDATE" in sql
@@ -0,0 +1,81 @@
+from datetime import datetime
+from unittest.mock import MagicMock, patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+from buildserver.api.jobs.models import JobRead, JobStatus
+from buildserver.database.core import get_async_session
+
+JOBS = [
+    JobRead(
+        job_id=job_id,
+        git_repository_url="git@github.com:user/repo.git",
+        commit_hash="a" * 40,
+        job_status=JobStatus.SUCCEEDED,
+        created_at=datetime(2024, 1, job_id, 12, 0, 0, 123456),
+    )
+    for job_id in (3, 2)
+]
+
+
+@pytest.fixture
+def client():
+    from buildserver.main import app
+
+    app.dependency_overrides[get_async_session] = lambda: MagicMock()
+    yield TestClient(app)
+    app.dependency_overrides.clear()
+
+
+@patch("buildserver.api.jobs.views.list_jobs")
+class TestGetJobs:
+
+    def test_last_page_has_no_cursor(self, mock_list_jobs, client):
+        mock_list_jobs.return_value = (JOBS, None)
+
+        resp = client.get("/jobs")
+
+        assert [job["job_id"] for job in resp.json()] == [3, 2]
+        assert "X-Next-Cursor" not in resp.headers
+        assert mock_list_jobs.call_args.args[1] == 10
+        assert mock_list_jobs.call_args.kwargs["after"] is None
+
+    def test_cursor_round_trips(self, mock_list_jobs, client):
+        key = (JOBS[-1].created_at, JOBS[-1].job_id)
+        mock_list_jobs.return_value = (JOBS, key)
+
+        first = client.get("/jobs", params={"limit": 2})
+        cursor = first.headers["X-Next-Cursor"]
+        assert f"cursor={cursor}" in first.headers["Link"]
+        client.get("/jobs", params={"limit": 2, "cursor": cursor})
+
+        assert mock_list_jobs.call_args.kwargs["after"] == key
+
+    def test_filters_are_passed_down(self, mock_list_jobs, client):
+        mock_list_jobs.return_value = ([], None)
+
+        client.get(
+            "/jobs",
+            params=[
+                ("status", "FAILED"),
+                ("status", "SUCCEEDED"),
+                ("repo", "git@github.com:user/repo.git"),
+                ("created_after", "2024-01-01T00:00:00"),
+            ],
+        )
+
+        kwargs = mock_list_jobs.call_args.kwargs
+        assert kwargs["statuses"] == [JobStatus.FAILED, JobStatus.SUCCEEDED]
+        assert kwargs["repo_url"] == "git@github.com:user/repo.git"
+        assert kwargs["created_after"] == datetime(2024, 1, 1)
+        assert kwargs["created_before"] is None
+
+    def test_invalid_cursor(self, mock_list_jobs, client):
+        resp = client.get("/jobs", params={"cursor": "not a cursor"})
+
+        assert resp.status_code == 400
+        mock_list_jobs.assert_not_called()
+
+    def test_limit_is_bounded(self, mock_list_jobs, client):
+        assert client.get("/jobs", params={"limit": 1000}).status_code == 422
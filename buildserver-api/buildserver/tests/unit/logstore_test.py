@@ -0,0 +1,145 @@
+from unittest.mock import patch, MagicMock
+
+import pytest
+from fastapi.testclient import TestClient
+
+from buildserver.api.jobs.models import JobStatus
+from buildserver.database.core import get_session
+from buildserver.logs import logstore
+from buildserver.logs.logstore import LogStore, LogOffsetError
+
+
+@pytest.fixture
+def store(tmp_path):
+    return LogStore(tmp_path)
+
+
+@pytest.fixture
+def small_segments(monkeypatch):
+    monkeypatch.setattr(logstore, "SEGMENT_BYTES", 16)
+
+
+def _lines(n: int) -> bytes:
+    return b"".join(f"line {i}\n".encode() for i in range(n))
+
+
+class TestLogStore:
+
+    def test_round_trips_appends(self, store, small_segments):
+        store.append(1, _lines(5))
+        store.append(1, _lines(3))
+
+        assert store.read_bytes(1) == _lines(5) + _lines(3)
+        assert store.size(1) == len(_lines(5) + _lines(3))
+
+    def test_missing_log_is_empty(self, store):
+        assert store.read_bytes(1) == b""
+        assert store.tail(1, 10) == b""
+        assert store.size(1) == 0
+
+    def test_byte_range_spans_segments(self, store, small_segments):
+        data = _lines(20)
+        store.append(1, data)
+
+        assert store.read_bytes(1, 10, 50) == data[10:50]
+        assert store.read_bytes(1, 50) == data[50:]
+
+    def test_line_range(self, store, small_segments):
+        store.append(1, _lines(20))
+
+        assert store.read_lines(1, 5, 8) == b"line 5\nline 6\nline 7\n"
+        assert store.read_lines(1, 18) == b"line 18\nline 19\n"
+
+    def test_tail(self, store, small_segments):
+        store.append(1, _lines(200))
+
+        assert store.tail(1, 2) == b"line 198\nline 199\n"
+        assert store.tail(1, 500) == _lines(200)
+
+    def test_tail_counts_unterminated_line(self, store):
+        store.append(1, b"a\nb\nc")
+
+        assert store.tail(1, 2) == b"b\nc"
+
+    def test_tail_only_decompresses_the_end(self, store, small_segments):
+        store.append(1, _lines(1000))
+        with patch.object(
+            LogStore, "_read_segment", wraps=LogStore._read_segment
+        ) as read_segment:
+            store.tail(1, 2)
+
+        assert read_segment.call_count <= 4
+
+    def test_iter_bytes_yields_segments(self, store, small_segments):
+        data = _lines(20)
+        store.append(1, data)
+
+        chunks = list(store.iter_bytes(1, 10))
+
+        assert b"".join(chunks) == data[10:]
+        assert max(map(len, chunks)) <= 16
+
+    def test_retried_append_is_idempotent(self, store):
+        store.append(1, b"hello ", offset=0)
+        store.append(1, b"hello ", offset=0)
+        store.append(1, b" world", offset=5)
+
+        assert store.read_bytes(1) == b"hello world"
+
+    def test_append_past_end_raises(self, store):
+        store.append(1, b"hello", offset=0)
+        with pytest.raises(LogOffsetError):
+            store.append(1, b"world", offset=10)
+
+
+class TestLogEndpoints:
+
+    @pytest.fixture
+    def client(self, store):
+        from buildserver.main import app
+
+        app.dependency_overrides[get_session] = lambda: MagicMock()
+        with (
+            patch("buildserver.api.logs.views.log_store", store),
+            patch("buildserver.api.logs.views.get_job_by_id") as get_job,
+        ):
+            get_job.return_value = MagicMock(job_status=JobStatus.SUCCEEDED)
+            yield TestClient(app)
+        app.dependency_overrides.clear()
+
+    def test_append_and_tail(self, client):
+        resp = client.post(
+            "/jobs/1/logs",
+            params={"offset": 0},
+            content=_lines(10),
+            headers={"Content-Type": "application/octet-stream"},
+        )
+        assert resp.json() == {"size": len(_lines(10))}
+
+        resp = client.get("/jobs/1/logs", params={"tail": 1})
+        assert resp.text == "line 9\n"
+        assert resp.headers["X-Log-Size"] == str(len(_lines(10)))
+
+    def test_streams_whole_log_and_line_range(self, client, small_segments):
+        client.post("/jobs/1/logs", content=_lines(50))
+
+        assert client.get("/jobs/1/logs").content == _lines(50)
+        resp = client.get("/jobs/1/logs", params={"start_line": 3, "end_line": 5})
+        assert resp.text == "line 3\nline 4\n"
+        resp = client.get("/jobs/1/logs", params={"start": 4, "end": 10**9})
+        assert resp.content == _lines(50)[4:]
+
+    def test_rejects_mixed_ranges(self, client):
+        resp = client.get("/jobs/1/logs", params={"tail": 1, "start": 0})
+        assert resp.status_code == 400
+
+    def test_follow_finished_job_returns_log(self, client):
+        client.post("/jobs/1/logs", content=_lines(3))
+
+        with (
+            patch("buildserver.api.logs.views.AsyncSessionLocal"),
+            patch("buildserver.api.logs.views.async_builds.get_job_by_id") as get_job,
+        ):
+            get_job.return_value = MagicMock(job_status=JobStatus.SUCCEEDED)
+            resp = client.get("/jobs/1/logs/follow", params={"start": 7})
+        assert resp.text == _lines(3)[7:].decode()
@@ -0,0 +1,87 @@
+import sqlite3
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import exc
+
+from buildserver.api.metrics.views import render_pool_metrics
+from buildserver.database.pool import MeteredNullPool, MeteredQueuePool, pool_stats
+
+
+def _connect():
+    return sqlite3.connect(":memory:", check_same_thread=False)
+
+
+class TestMeteredQueuePool:
+
+    def test_counts_checkouts(self):
+        pool = MeteredQueuePool(_connect, pool_size=2, max_overflow=0)
+
+        conn = pool.connect()
+        conn.close()
+        pool.connect().close()
+
+        stats = pool_stats(pool)
+        assert stats["checkouts"] == 2
+        assert stats["checked_out"] == 0
+        assert stats["checked_in"] == 1
+        assert stats["wait_seconds"] >= stats["max_wait_seconds"] >= 0
+
+    def test_counts_overflows(self):
+        pool = MeteredQueuePool(_connect, pool_size=1, max_overflow=2)
+
+        conns = [pool.connect() for _ in range(3)]
+
+        stats = pool_stats(pool)
+        assert stats["checked_out"] == 3
+        assert stats["overflow"] == 2
+        assert stats["overflows"] == 2
+        for conn in conns:
+            conn.close()
+
+    def test_counts_timeouts(self):
+        pool = MeteredQueuePool(_connect, pool_size=1, max_overflow=0, timeout=0.01)
+        conn = pool.connect()
+
+        with pytest.raises(exc.TimeoutError):
+            pool.connect()
+
+        stats = pool_stats(pool)
+        assert stats["timeouts"] == 1
+        assert stats["checkouts"] == 1
+        conn.close()
+
+    def test_recreate_keeps_metrics(self):
+        pool = MeteredQueuePool(_connect, pool_size=1)
+        pool.connect().close()
+
+        assert pool.recreate().metrics.checkouts == 1
+
+
+def test_null_pool_counts_checkouts():
+    pool = MeteredNullPool(_connect)
+
+    pool.connect().close()
+
+    stats = pool_stats(pool)
+    assert stats["checkouts"] == 1
+    assert "size" not in stats
+
+
+class TestMetricsEndpoint:
+
+    def test_renders_both_pools(self):
+        text = render_pool_metrics()
+
+        assert "# TYPE buildserver_db_pool_checked_out gauge" in text
+        assert 'buildserver_db_pool_checked_out{pool="sync"} 0' in text
+        assert 'buildserver_db_pool_timeouts_total{pool="async"} 0' in text
+
+    def test_get_metrics(self):
+        from buildserver.main import app
+
+        resp = TestClient(app).get("/metrics")
+
+        assert resp.status_code == 200
+        assert resp.headers["content-type"].startswith("text/plain")
+        assert "buildserver_db_pool_size" in resp.text
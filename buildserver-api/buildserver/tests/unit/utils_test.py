@@ -1,11 +1,21 @@
 import logging
+import os
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
 from unittest.mock import patch, MagicMock
 
 import pytest
 
 from buildserver import utils
 
+GIT_ENV = {
+    "GIT_AUTHOR_NAME": "test",
+    "GIT_AUTHOR_EMAIL": "test@test.com",
+    "GIT_COMMITTER_NAME": "test",
+    "GIT_COMMITTER_EMAIL": "test@test.com",
+    "PATH": "/usr/bin:/bin:/usr/sbin:/sbin:/usr/local/bin",
+}
+
 
 class TestGetDirName:
 
@@ -40,20 +50,43 @@ class TestGetCommitHash:
         subprocess.run(
             ["git", "-C", str(repo), "commit", "-m", "init"],
             check=True,
-            env={
-                "GIT_AUTHOR_NAME": "test",
-                "GIT_AUTHOR_EMAIL": "test@test.com",
-                "GIT_COMMITTER_NAME": "test",
-                "GIT_COMMITTER_EMAIL": "test@test.com",
-                "HOME": str(tmp_path),
-                "PATH": "/usr/bin:/bin:/usr/sbin:/sbin:/usr/local/bin",
-            },
+            env={**GIT_ENV, "HOME": str(tmp_path)},
         )
         log = logging.getLogger("test")
         commit_hash = utils.get_commit_hash(repo, log)
         assert len(commit_hash) == 40
         assert all(c in "0123456789abcdef" for c in commit_hash)
 
+    def test_does_not_change_working_directory(self, tmp_path):
+        repos = []
+        for i in range(8):
+            repo = tmp_path / f"repo{i}"
+            repo.mkdir()
+            subprocess.run(["git", "init", "-q", str(repo)], check=True)
+            subprocess.run(
+                ["git", "-C", str(repo), "commit", "-q", "--allow-empty", "-m", str(i)],
+                check=True,
+                env={**GIT_ENV, "HOME": str(tmp_path)},
+            )
+            repos.append(repo)
+        expected = [
+            subprocess.run(
+                ["git", "-C", str(r), "rev-parse", "HEAD"],
+                check=True,
+                capture_output=True,
+                text=True,
+            ).stdout.strip()
+            for r in repos
+        ]
+        cwd = os.getcwd()
+        log = logging.getLogger("test")
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            hashes = list(pool.map(lambda r: utils.get_commit_hash(r, log), repos * 4))
+
+        assert hashes == expected * 4
+        assert os.getcwd() == cwd
+
     def test_invalid_path_raises(self, tmp_path):
         log = logging.getLogger("test")
         with pytest.raises(OSError):
@@ -5,7 +5,6 @@ Various helper functions for use across modules
 from pathlib import Path
 import logging
 import subprocess
-import os
 import shutil
 
 from buildserver.config import LOG_LEVEL
@@ -36,16 +35,21 @@ def get_dir_name(url: str):
 def get_commit_hash(path: Path, logger: logging.Logger) -> str:
     """
     Get commit hash of the checked out branch
+
+    git runs with path as its working directory instead of changing the
+    process's, so concurrent threads can look up different repositories.
+
+    Raises:
+        OSError: If path does not exist
+        subprocess.CalledProcessError: If path is not in a git repository
     """
-    try:
-        os.chdir(path)
-        logger.debug("Path: %s cwd: %s", path, Path.cwd())
-    except OSError as e:
-        logger.error("chdir: %s", e)
-        raise e
+    logger.debug("Getting commit hash of %s", path)
     p = subprocess.run(
-        ["/usr/bin/git", "rev-parse", "HEAD"], check=True, stdout=subprocess.PIPE
-    )  # NOTE: consider using command pattern for all of these subproccess calls
+        ["/usr/bin/git", "rev-parse", "HEAD"],
+        cwd=path,
+        check=True,
+        stdout=subprocess.PIPE,
+    )
     commit_hash = str(p.stdout, encoding="utf-8").strip("\n")
     return commit_hash
 
@@ -2,18 +2,30 @@
 
 import logging
 from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
 import requests
+from pydantic import ValidationError
 
-from runner.builder.builder import run as run_build, BuildError, CloneError
+from runner.api import api_client
+from runner.artifacts import upload_artifacts
+from runner.builder.builder import (
+    run as run_build,
+    BUILD_DIRS,
+    BuildError,
+    CloneError,
+)
+from runner.builder.buildlog import BuildLog
+from runner.builder.reaper import DiskReaper
+from runner.concurrency import ConcurrencyController
 from runner.types import Job, JobStatus
-from runner.config import LOG_LEVEL, APISERVER_HOST
-from runner.rmq.rmq import RabbitMQConsumer
+from runner.config import LOG_LEVEL
+from runner.rmq.rmq import Delivery, RabbitMQConsumer
 
 logging.basicConfig()
 logger = logging.getLogger(__name__)
 logger.setLevel(LOG_LEVEL)
 
-MAX_WORKERS = 4  # TODO: move to config
 BUILD_QUEUE = "build_jobs"
 
 
@@ -36,66 +48,98 @@ class Agent:
 
     def __init__(self):
         self._rmq = RabbitMQConsumer()
-        self._executor = ThreadPoolExecutor(max_workers=MAX_WORKERS)
+        self._concurrency = ConcurrencyController(
+            on_resize=self._rmq.set_prefetch_count
+        )
+        self._executor = ThreadPoolExecutor(max_workers=self._concurrency.max_slots)
+        self._reaper = DiskReaper(BUILD_DIRS)
         self.active_jobs: list[Job] = []
 
     def start(self):
         """Start consuming from the build queue. Blocks the calling thread."""
         logger.info("starting agent...")
+        api_client.start_flusher()
+        self._concurrency.start()
+        self._reaper.start()
         try:
-            self._rmq.start(BUILD_QUEUE, self._on_message, prefetch_count=MAX_WORKERS)
+            self._rmq.start(
+                BUILD_QUEUE,
+                self._on_message,
+                prefetch_count=self._concurrency.slots.limit,
+            )
         except KeyboardInterrupt:
             self.stop()
 
     def stop(self):
         """Stop the agent and close the RabbitMQ connection."""
         logger.info("stopping agent...")
-        self._executor.shutdown(wait=True)
-        self._rmq.stop()
+        self._concurrency.stop()
+        self._reaper.stop()
+        # builds still running ack their messages as they finish, which needs
+        # the connection's ioloop, so the consumer closes after they're done
+        self._rmq.stop(drain=partial(self._executor.shutdown, wait=True))
+        api_client.close()
 
-    def _on_message(self, body: bytes):
+    def _on_message(self, body: bytes, delivery: Delivery):
         """Submit job to worker pool. Returns immediately to keep ioloop responsive."""
-        self._executor.submit(self._handle_job, body)
+        self._executor.submit(self._handle_job, body, delivery)
 
-    def _handle_job(self, body: bytes):
-        """Execute a build job. Runs in a worker thread."""
+    def _handle_job(self, body: bytes, delivery: Delivery):
+        """
+        Execute a build job. Runs in a worker thread.
+
+        The message stays unacked until the build has finished and its status
+        has been reported, so the prefetch count bounds the jobs this runner
+        holds and a crashed runner's jobs go back to the queue.
+        """
         logger.info("received data %s", body)
-        job = Job.model_validate_json(body)
-        # since queue limits amount of messages consumed
-        # should be fine to immediately start executing a job
-        self.active_jobs.append(job)
-        # from here agent needs to update status will just make calls to API for now
-        # NOTE: for first iteration this is fine, ideally want to stream here
-        logger.debug("We made it here...")
         try:
-            requests.patch(
-                f"{APISERVER_HOST}/jobs/{job.job_id}",
-                json={"job_status": JobStatus.RUNNING},
-                timeout=5,
-            )
-        # can't return anything if you can't reach the server
-        # this is fine for now because implementation will be changing soon
-        # but hanging jobs will exist in database -- are they drained from rabbitmq?
-        except requests.exceptions.RequestException as e:
-            logger.error("Failed to make request: %s", e)
+            job = Job.model_validate_json(body)
+        except ValidationError as e:
+            logger.error("Rejecting invalid job: %s", e)
+            delivery.nack(requeue=False)
             return
         try:
-            run_build(job.git_repository_url)
-            status = JobStatus.SUCCEEDED
-            logger.info("Job %s succeeded", job.job_id)
-        except (BuildError, CloneError) as e:
-            status = JobStatus.FAILED
-            logger.error("Job %s failed: %s", job.job_id, e)
-        try:
-            requests.patch(
-                f"{APISERVER_HOST}/jobs/{job.job_id}",
-                json={"job_status": status},
-                timeout=5,
-            )
-        except requests.exceptions.RequestException as e:
-            logger.error("Failed to make request: %s", e)
+            # waits here while the controller has shrunk the slots below the
+            # number of builds already running
+            with self._concurrency.slots:
+                self._run_job(job)
+        except Exception as e:
+            # requeue once in case another runner fares better
+            logger.exception("Job %s raised unexpectedly: %s", job.job_id, e)
+            delivery.nack(requeue=not delivery.redelivered)
             return
-        self.active_jobs.remove(job)
+        delivery.ack()
+
+    def _run_job(self, job: Job):
+        # since queue limits amount of messages consumed
+        # should be fine to immediately start executing a job
+        if not api_client.claim_job(job.job_id):
+            logger.info("Job %s was superseded, skipping", job.job_id)
+            return
+        self.active_jobs.append(job)
+        try:
+            with BuildLog.for_job(job.job_id) as log:
+                try:
+                    run_build(
+                        job.git_repository_url,
+                        job.commit_hash,
+                        log,
+                        after_build=partial(upload_artifacts, job.job_id),
+                    )
+                    status = JobStatus.SUCCEEDED
+                    logger.info("Job %s succeeded", job.job_id)
+                except (BuildError, CloneError) as e:
+                    status = JobStatus.FAILED
+                    logger.error("Job %s failed: %s", job.job_id, e)
+                except requests.exceptions.RequestException as e:
+                    # a build without its artifacts is of no use to anyone
+                    status = JobStatus.FAILED
+                    logger.error("Job %s failed to upload artifacts: %s", job.job_id, e)
+            # updates the API can't take are spooled and replayed in order
+            api_client.update_status(job.job_id, status)
+        finally:
+            self.active_jobs.remove(job)
 
 
 if __name__ == "__main__":
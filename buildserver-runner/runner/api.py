@@ -0,0 +1,399 @@
+"""
+HTTP client for the buildserver API
+
+All requests from a runner process go through one requests.Session, so
+status updates and log uploads reuse pooled keep-alive connections instead of
+opening a new one per call. Transient failures are retried with exponential
+backoff. Status updates that still fail are appended to a local spool file and
+replayed in order by a background thread once the API is reachable again, so
+an outage does not leave jobs stuck in RUNNING. Artifact blobs are uploaded in
+chunks that resume from the offset the API has after a failed request.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from http import HTTPStatus
+from pathlib import Path
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from runner.types import JobStatus
+from runner.config import (
+    LOG_LEVEL,
+    APISERVER_HOST,
+    API_POOL_SIZE,
+    API_RETRIES,
+    API_RETRY_BACKOFF,
+    ARTIFACT_CHUNK_BYTES,
+    STATUS_SPOOL_PATH,
+    STATUS_FLUSH_INTERVAL,
+)
+
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+logger.setLevel(LOG_LEVEL)
+
+TIMEOUT = 5  # seconds, per attempt
+RETRY_STATUSES = (502, 503, 504)
+
+
+class MissingBlobsError(requests.exceptions.HTTPError):
+    """The API no longer stores blobs a registration refers to."""
+
+    def __init__(self, digests: list[str], response: requests.Response):
+        super().__init__(f"Blobs not uploaded: {', '.join(digests)}", response=response)
+        self.digests = digests
+
+
+class APIClient:
+    """Pooled, retrying API client with a durable spool for status updates."""
+
+    def __init__(
+        self,
+        base_url: str = APISERVER_HOST,
+        spool_path: Path | str = STATUS_SPOOL_PATH,
+        pool_size: int = API_POOL_SIZE,
+        retries: int = API_RETRIES,
+        backoff: float = API_RETRY_BACKOFF,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.spool_path = Path(spool_path)
+        self.retries = retries
+        self.backoff = backoff
+        self._session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=pool_size,
+            max_retries=Retry(
+                total=retries,
+                backoff_factor=backoff,
+                status_forcelist=RETRY_STATUSES,
+                # only verbs that are safe to repeat: status updates and
+                # upload chunks are absolute. POSTs create things, the
+                # idempotent ones are retried by _post_idempotent
+                allowed_methods=frozenset({"GET", "HEAD", "PUT", "PATCH"}),
+                raise_on_status=False,
+            ),
+        )
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        self._spool_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._spooled_jobs = {u["job_id"] for u in self._read_spool()}
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._flusher: threading.Thread | None = None
+
+    def update_status(self, job_id: int, status: JobStatus) -> bool:
+        """
+        Report a job's status, spooling it if the API can't be reached.
+
+        Updates for a job that already has spooled updates are spooled behind
+        them, so a job's transitions always reach the API in order.
+
+        Returns:
+            True if the update was delivered now, False if it was spooled.
+        """
+        return self._deliver({"job_id": job_id, "job_status": status}) is not None
+
+    def claim_job(self, job_id: int) -> bool:
+        """
+        Mark a dequeued job RUNNING.
+
+        Returns:
+            False if the API refused because the job was superseded by a newer
+            commit and should be skipped. True otherwise, including when the
+            update had to be spooled.
+        """
+        update = {"job_id": job_id, "job_status": JobStatus.RUNNING}
+        return self._deliver(update) != HTTPStatus.CONFLICT
+
+    def post_log(self, job_id: int, offset: int, data: bytes) -> None:
+        """
+        Append data at offset to a job's log.
+
+        Retried like the idempotent requests, the API ignores data it
+        already has at that offset.
+
+        Raises:
+            requests.exceptions.RequestException: If the upload fails.
+        """
+        resp = self._post_idempotent(
+            f"{self.base_url}/jobs/{job_id}/logs",
+            params={"offset": offset},
+            data=data,
+            headers={"Content-Type": "application/octet-stream"},
+        )
+        resp.raise_for_status()
+
+    def _post_idempotent(self, url: str, **kwargs) -> requests.Response:
+        """POST that the API applies at most once, retried with backoff."""
+        for attempt in range(self.retries + 1):
+            last = attempt == self.retries
+            try:
+                resp = self._session.post(url, timeout=TIMEOUT, **kwargs)
+                if last or resp.status_code not in RETRY_STATUSES:
+                    return resp
+            except (
+                requests.exceptions.ConnectionError,
+                requests.exceptions.Timeout,
+            ):
+                if last:
+                    raise
+            time.sleep(self.backoff * 2**attempt)
+
+    def has_blob(self, digest: str) -> bool:
+        """
+        Whether the API already stores a blob, so uploading it can be skipped.
+
+        Raises:
+            requests.exceptions.RequestException: If the check fails.
+        """
+        resp = self._session.head(
+            f"{self.base_url}/artifacts/blobs/{digest}", timeout=TIMEOUT
+        )
+        if resp.status_code == HTTPStatus.NOT_FOUND:
+            return False
+        resp.raise_for_status()
+        return True
+
+    def upload_blob(
+        self, path: Path, digest: str, chunk_size: int = ARTIFACT_CHUNK_BYTES
+    ) -> None:
+        """
+        Upload a file as a blob, at most chunk_size bytes per request.
+
+        After a failed request the upload resumes from the offset the API
+        reports, up to `retries` times.
+
+        Raises:
+            requests.exceptions.RequestException: If the upload can't be
+                completed, or the API computed a different digest.
+        """
+        resp = self._session.post(f"{self.base_url}/artifacts/uploads", timeout=TIMEOUT)
+        resp.raise_for_status()
+        url = f"{self.base_url}/artifacts/uploads/{resp.json()['upload_id']}"
+        offset = 0
+        failures = 0
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            while offset < size:
+                f.seek(offset)
+                chunk = f.read(chunk_size)
+                try:
+                    resp = self._session.patch(
+                        url,
+                        params={"offset": offset},
+                        data=chunk,
+                        headers={"Content-Type": "application/octet-stream"},
+                        timeout=TIMEOUT,
+                    )
+                    resp.raise_for_status()
+                    offset = resp.json()["offset"]
+                except requests.exceptions.RequestException as e:
+                    failures += 1
+                    if failures > self.retries:
+                        raise
+                    logger.warning(
+                        "Upload of %s interrupted at %d, resuming: %s", path, offset, e
+                    )
+                    resp = self._session.get(url, timeout=TIMEOUT)
+                    resp.raise_for_status()
+                    offset = resp.json()["offset"]
+        resp = self._session.put(url, params={"digest": digest}, timeout=TIMEOUT)
+        resp.raise_for_status()
+
+    def register_artifacts(self, job_id: int, artifacts: list[dict]) -> None:
+        """
+        Register uploaded artifacts for a job.
+
+        Retried like the idempotent requests, artifacts already registered at
+        a path are left as they are.
+
+        Raises:
+            MissingBlobsError: If the API no longer has some of the blobs.
+            requests.exceptions.RequestException: If the registration fails.
+        """
+        resp = self._post_idempotent(
+            f"{self.base_url}/jobs/{job_id}/artifacts", json=artifacts
+        )
+        _raise_for_missing_blobs(resp)
+        resp.raise_for_status()
+
+    def set_bundle(self, job_id: int, digest: str, size: int) -> None:
+        """
+        Register an uploaded blob as a job's artifact bundle.
+
+        Raises:
+            MissingBlobsError: If the API no longer has the blob.
+            requests.exceptions.RequestException: If the registration fails.
+        """
+        resp = self._session.put(
+            f"{self.base_url}/jobs/{job_id}/bundle",
+            json={"digest": digest, "size": size},
+            timeout=TIMEOUT,
+        )
+        _raise_for_missing_blobs(resp)
+        resp.raise_for_status()
+
+    def flush_spool(self) -> int:
+        """
+        Replay spooled status updates in order, stopping at the first failure.
+
+        Returns:
+            The number of updates still spooled.
+        """
+        with self._flush_lock:
+            # sent without holding the spool lock, so status updates from
+            # build threads don't wait out the retries while the API is down
+            with self._spool_lock:
+                pending = self._read_spool()
+            sent = 0
+            for update in pending:
+                try:
+                    self._patch_status(update)
+                except requests.exceptions.RequestException as e:
+                    logger.warning(
+                        "API still unreachable, %d updates spooled: %s",
+                        len(pending) - sent,
+                        e,
+                    )
+                    break
+                sent += 1
+            with self._spool_lock:
+                # updates may have been appended meanwhile, only flushes
+                # remove them so the ones sent are still at the front
+                remaining = self._read_spool()[sent:]
+                if sent:
+                    self._write_spool(remaining)
+                    logger.info("Delivered %d spooled status updates", sent)
+                self._spooled_jobs = {u["job_id"] for u in remaining}
+                return len(remaining)
+
+    def start_flusher(self, interval: float = STATUS_FLUSH_INTERVAL) -> None:
+        """Replay the spool from a background thread every interval seconds."""
+        if self._flusher is not None:
+            return
+        self._stopping.clear()
+        self._flusher = threading.Thread(
+            target=self._flush_loop, args=(interval,), name="status-spool", daemon=True
+        )
+        self._flusher.start()
+
+    def close(self, timeout: float = 10) -> None:
+        """Stop the flusher after a last attempt to empty the spool."""
+        if self._flusher is not None:
+            self._stopping.set()
+            self._wake.set()
+            self._flusher.join(timeout)
+            self._flusher = None
+        self._session.close()
+
+    def _flush_loop(self, interval: float) -> None:
+        while not self._stopping.is_set():
+            self._wake.wait(interval)
+            self._wake.clear()
+            if self.spool_path.exists():
+                self.flush_spool()
+
+    def _deliver(self, update: dict) -> int | None:
+        """Send update now or spool it. Returns the response status if sent."""
+        with self._spool_lock:
+            if update["job_id"] in self._spooled_jobs:
+                self._append_spool(update)
+                self._wake.set()
+                return None
+        try:
+            return self._patch_status(update)
+        except requests.exceptions.RequestException as e:
+            logger.error(
+                "Failed to report job %s as %s: %s",
+                update["job_id"],
+                update["job_status"],
+                e,
+            )
+        with self._spool_lock:
+            self._append_spool(update)
+        self._wake.set()
+        return None
+
+    def _patch_status(self, update: dict) -> int:
+        resp = self._session.patch(
+            f"{self.base_url}/jobs/{update['job_id']}",
+            json={"job_status": update["job_status"]},
+            timeout=TIMEOUT,
+        )
+        if 400 <= resp.status_code < 500:
+            # retrying won't help, e.g. the job was deleted or superseded
+            logger.warning(
+                "API rejected status %s for job %s: %s",
+                update["job_status"],
+                update["job_id"],
+                resp.text,
+            )
+            return resp.status_code
+        resp.raise_for_status()
+        return resp.status_code
+
+    def _read_spool(self) -> list[dict]:
+        try:
+            with open(self.spool_path) as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return []
+        updates = []
+        for line in lines:
+            try:
+                updates.append(json.loads(line))
+            except json.JSONDecodeError:
+                # a torn write from a crash can only be the last line
+                logger.warning("Skipping corrupt spool entry: %r", line)
+        return updates
+
+    def _append_spool(self, update: dict) -> None:
+        self.spool_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.spool_path, "a") as f:
+            f.write(json.dumps(update) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self._spooled_jobs.add(update["job_id"])
+
+    def _write_spool(self, updates: list[dict]) -> None:
+        if not updates:
+            self.spool_path.unlink(missing_ok=True)
+            return
+        tmp = self.spool_path.with_suffix(".tmp")
+        with open(tmp, "w") as f:
+            f.writelines(json.dumps(u) + "\n" for u in updates)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.spool_path)
+
+
+def _raise_for_missing_blobs(resp: requests.Response) -> None:
+    # the API answers 400 with the digests of blobs that were collected
+    # before the registration could reference them
+    if resp.status_code != HTTPStatus.BAD_REQUEST:
+        return
+    try:
+        detail = resp.json()["detail"]
+    except (ValueError, KeyError, TypeError):
+        return
+    if not isinstance(detail, list):
+        return
+    digests = [
+        digest
+        for item in detail
+        if isinstance(item, dict)
+        for digest in item.get("digests", ())
+    ]
+    if digests:
+        raise MissingBlobsError(digests, resp)
+
+
+api_client = APIClient()
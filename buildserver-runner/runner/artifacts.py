@@ -0,0 +1,177 @@
+"""
+Artifact upload
+
+After a successful build the runner picks the artifacts out of the build tree
+and hands them to the API's content-addressed blob store. Every file is hashed
+locally first and blobs the API already has are skipped, so an unchanged
+binary is never sent twice. The rest are streamed in ARTIFACT_CHUNK_BYTES
+pieces through resumable uploads. Once all blobs are stored, the job's
+artifacts are registered in a single request. Blobs the API collected before
+the registration could reference them are uploaded again and the
+registration is retried, up to REGISTER_ATTEMPTS times.
+
+With ARTIFACT_BUNDLE set the artifacts are instead packed into one compressed
+bundle, see runner.bundle, which is uploaded as a single blob.
+"""
+
+import fnmatch
+import hashlib
+import logging
+import os
+import re
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
+from typing import Callable, Iterable
+
+from runner import bundle
+from runner.api import MissingBlobsError, api_client
+from runner.config import (
+    LOG_LEVEL,
+    ARTIFACT_BUNDLE,
+    ARTIFACT_INCLUDE,
+    ARTIFACT_EXCLUDE,
+    ARTIFACT_IGNORE_DIRS,
+    ARTIFACT_UPLOAD_WORKERS,
+)
+
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+logger.setLevel(LOG_LEVEL)
+
+REGISTER_ATTEMPTS = 3
+
+
+class ArtifactMatcher:
+    """Decides which files of a build are artifacts, by glob on file name."""
+
+    def __init__(
+        self,
+        include: Iterable[str] = ARTIFACT_INCLUDE,
+        exclude: Iterable[str] = ARTIFACT_EXCLUDE,
+        ignore_dirs: Iterable[str] = ARTIFACT_IGNORE_DIRS,
+    ):
+        self._include = _compile(include)
+        self._exclude = _compile(exclude)
+        self.ignore_dirs = frozenset(ignore_dirs)
+
+    def matches(self, file_name: str) -> bool:
+        return bool(self._include.match(file_name)) and not self._exclude.match(
+            file_name
+        )
+
+    def collect(self, path: Path) -> list[Path]:
+        """Paths relative to path of every artifact under it, in one walk."""
+        artifacts = []
+        for root, dirs, files in os.walk(path):
+            dirs[:] = [d for d in dirs if d not in self.ignore_dirs]
+            rel_root = os.path.relpath(root, path)
+            artifacts.extend(
+                Path(rel_root, name) for name in files if self.matches(name)
+            )
+        return artifacts
+
+
+def _compile(patterns: Iterable[str]) -> re.Pattern:
+    patterns = [fnmatch.translate(p.strip()) for p in patterns if p.strip()]
+    return re.compile("|".join(patterns) or r"(?!)")
+
+
+DEFAULT_MATCHER = ArtifactMatcher()
+
+
+def file_digest(path: Path) -> str:
+    """Hex SHA-256 of a file's contents."""
+    with open(path, "rb") as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+
+def upload_artifacts(
+    job_id: int,
+    repo_path: Path,
+    matcher: ArtifactMatcher = DEFAULT_MATCHER,
+    as_bundle: bool = ARTIFACT_BUNDLE,
+) -> list[dict]:
+    """
+    Upload the artifacts of a finished build and register them for its job.
+
+    Args:
+        job_id: The job that built repo_path.
+        repo_path: The built checkout.
+        matcher: Which files are artifacts.
+        as_bundle: Upload a single compressed bundle instead of one blob per
+            artifact. Ignored if zstandard is not installed.
+
+    Returns:
+        The registered artifacts, or the bundle's index.
+
+    Raises:
+        requests.exceptions.RequestException: If an upload or the
+            registration fails.
+    """
+    artifacts = matcher.collect(repo_path)
+    if as_bundle:
+        if bundle.available():
+            return _upload_bundle(job_id, repo_path, artifacts)
+        logger.warning("zstandard is not installed, uploading loose artifacts")
+
+    def upload(relative: Path) -> dict:
+        path = repo_path / relative
+        digest = file_digest(path)
+        if api_client.has_blob(digest):
+            logger.debug("Blob %s of %s already stored", digest, relative)
+        else:
+            api_client.upload_blob(path, digest)
+        return {
+            "artifact_file_name": relative.name,
+            "artifact_path": str(relative),
+            "digest": digest,
+            "size": path.stat().st_size,
+        }
+
+    with ThreadPoolExecutor(max_workers=ARTIFACT_UPLOAD_WORKERS) as pool:
+        uploaded = list(pool.map(upload, artifacts))
+    paths = {a["digest"]: repo_path / a["artifact_path"] for a in uploaded}
+    _register(partial(api_client.register_artifacts, job_id, uploaded), paths)
+    logger.info("Uploaded %d artifacts of job %s", len(uploaded), job_id)
+    return uploaded
+
+
+def _upload_bundle(job_id: int, repo_path: Path, artifacts: list[Path]) -> list[dict]:
+    with tempfile.NamedTemporaryFile(prefix=f"job-{job_id}-", suffix=".tar.zst") as f:
+        digest, size, index = bundle.write_bundle(repo_path, artifacts, f)
+        f.flush()
+        if not api_client.has_blob(digest):
+            api_client.upload_blob(Path(f.name), digest)
+        _register(
+            partial(api_client.set_bundle, job_id, digest, size),
+            {digest: Path(f.name)},
+        )
+    logger.info(
+        "Uploaded %d artifacts of job %s as a %d byte bundle",
+        len(index),
+        job_id,
+        size,
+    )
+    return index
+
+
+def _register(register: Callable[[], None], paths: dict[str, Path]) -> None:
+    """
+    Call register, uploading the blobs the API lost in the meantime again.
+
+    Args:
+        register: Registers the uploaded blobs with the API.
+        paths: Local file of each blob, by digest.
+    """
+    for attempt in range(1, REGISTER_ATTEMPTS + 1):
+        try:
+            register()
+            return
+        except MissingBlobsError as e:
+            if attempt == REGISTER_ATTEMPTS or not paths.keys() >= set(e.digests):
+                raise
+            logger.warning("Blobs were collected before registration: %s", e)
+            for digest in e.digests:
+                api_client.upload_blob(paths[digest], digest)
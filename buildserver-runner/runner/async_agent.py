@@ -0,0 +1,264 @@
+"""
+asyncio-native build agent
+
+A single event loop consumes the build queue with aio-pika, runs git and make
+as asyncio subprocesses through runner.builder.async_builder and ships logs to
+the API with one shared httpx client. Status updates go through the threaded
+agent's runner.api client, so updates the API can't take are spooled and
+replayed just the same. Each delivery gets its own task, which waits for one
+of the build slots that a ConcurrencyController sizes from host load, as in
+the threaded agent, up to ASYNC_MAX_BUILDS. The prefetch count follows the
+number of slots.
+"""
+
+import asyncio
+import logging
+import signal
+from pathlib import Path
+
+import aio_pika
+import httpx
+import requests
+from aio_pika.abc import AbstractChannel, AbstractIncomingMessage
+from pydantic import ValidationError
+
+from runner.api import api_client
+from runner.artifacts import upload_artifacts
+from runner.builder.async_builder import run as run_build
+from runner.builder.builder import BUILD_DIRS, BuildError, CloneError
+from runner.builder.buildlog import BuildLog
+from runner.builder.reaper import DiskReaper
+from runner.concurrency import ConcurrencyController
+from runner.types import Job, JobStatus
+from runner.config import (
+    LOG_LEVEL,
+    APISERVER_HOST,
+    RABBITMQ_HOST,
+    RABBITMQ_PORT,
+    RABBITMQ_USER,
+    RABBITMQ_PASS,
+    ASYNC_MAX_BUILDS,
+    LOG_BATCH_BYTES,
+    LOG_FLUSH_INTERVAL,
+)
+
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+logger.setLevel(LOG_LEVEL)
+
+BUILD_QUEUE = "build_jobs"
+
+
+class AsyncAgent:
+    """
+    Build agent that supervises many concurrent builds from one event loop.
+
+    Messages are acked once their build has finished and its status has been
+    reported, or spooled to be reported once the API is back. Builds still
+    running at shutdown are cancelled, which kills their processes, and their
+    messages are requeued for another runner.
+    """
+
+    def __init__(self, max_builds: int = ASYNC_MAX_BUILDS):
+        self._concurrency = ConcurrencyController(
+            max_slots=max_builds, on_resize=self._on_resize
+        )
+        self.active_jobs: dict[int, Job] = {}
+        self._tasks: set[asyncio.Task] = set()
+        self._client: httpx.AsyncClient | None = None
+        self._channel: AbstractChannel | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._stopping: asyncio.Event | None = None
+        # set whenever a slot may have become free
+        self._slot_freed = asyncio.Event()
+        self._reaper = DiskReaper(BUILD_DIRS)
+
+    def start(self):
+        """Start consuming from the build queue. Blocks the calling thread."""
+        asyncio.run(self.serve())
+
+    async def serve(self):
+        """Consume from the build queue until stop() is called or SIGINT/SIGTERM."""
+        logger.info("starting async agent...")
+        self._stopping = asyncio.Event()
+        self._loop = loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, self.stop)
+        # connect_robust reconnects and re-declares the consumer on its own
+        connection = await aio_pika.connect_robust(
+            host=RABBITMQ_HOST,
+            port=int(RABBITMQ_PORT),
+            login=RABBITMQ_USER,
+            password=str(RABBITMQ_PASS),
+        )
+        async with (
+            connection,
+            httpx.AsyncClient(base_url=APISERVER_HOST, timeout=5) as client,
+        ):
+            self._client = client
+            self._channel = channel = await connection.channel()
+            await channel.set_qos(prefetch_count=self._concurrency.slots.limit)
+            queue = await channel.declare_queue(BUILD_QUEUE, durable=True)
+            consumer_tag = await queue.consume(self._on_message)
+            logger.info("Consuming from '%s'", BUILD_QUEUE)
+            api_client.start_flusher()
+            self._concurrency.start()
+            self._reaper.start()
+            await self._stopping.wait()
+
+            logger.info("stopping agent...")
+            await queue.cancel(consumer_tag)
+            await asyncio.to_thread(self._concurrency.stop)
+            for task in self._tasks:
+                task.cancel()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+            await asyncio.to_thread(self._reaper.stop)
+            await asyncio.to_thread(api_client.close)
+
+    def stop(self):
+        """Stop consuming, cancel running builds and close the connection."""
+        if self._stopping is not None:
+            self._stopping.set()
+
+    def _on_resize(self, limit: int) -> None:
+        """Called from the controller's thread when the slots are resized."""
+        if self._loop is not None:
+            asyncio.run_coroutine_threadsafe(self._resize(limit), self._loop)
+
+    async def _resize(self, limit: int) -> None:
+        self._slot_freed.set()
+        if self._channel is not None:
+            await self._channel.set_qos(prefetch_count=limit)
+
+    async def _acquire_slot(self) -> None:
+        """Wait for a build slot without blocking the event loop."""
+        while not self._concurrency.slots.try_acquire():
+            self._slot_freed.clear()
+            await self._slot_freed.wait()
+
+    def _release_slot(self) -> None:
+        self._concurrency.slots.release()
+        self._slot_freed.set()
+
+    async def _on_message(self, message: AbstractIncomingMessage):
+        """Start a task for the build. Returns immediately."""
+        task = asyncio.create_task(self._handle_job(message))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _handle_job(self, message: AbstractIncomingMessage):
+        """Execute a build job and settle its message."""
+        logger.info("received data %s", message.body)
+        try:
+            job = Job.model_validate_json(message.body)
+        except ValidationError as e:
+            logger.error("Rejecting invalid job: %s", e)
+            await message.reject(requeue=False)
+            return
+        self.active_jobs[job.job_id] = job
+        try:
+            await self._acquire_slot()
+            try:
+                if await asyncio.to_thread(api_client.claim_job, job.job_id):
+                    status = await self._run_job(job)
+                    # updates the API can't take are spooled and replayed
+                    await asyncio.to_thread(
+                        api_client.update_status, job.job_id, status
+                    )
+                else:
+                    logger.info("Job %s was superseded, skipping", job.job_id)
+            finally:
+                self._release_slot()
+        except asyncio.CancelledError:
+            logger.warning("Job %s cancelled, requeueing", job.job_id)
+            await asyncio.shield(message.nack(requeue=True))
+            raise
+        except Exception as e:
+            # requeue once in case another runner fares better
+            logger.exception("Job %s raised unexpectedly: %s", job.job_id, e)
+            await message.nack(requeue=not message.redelivered)
+            return
+        finally:
+            del self.active_jobs[job.job_id]
+        await message.ack()
+
+    async def _run_job(self, job: Job) -> JobStatus:
+        log = BuildLog.for_job(job.job_id, ship=False)
+        done = asyncio.Event()
+        shipper = asyncio.create_task(self._ship_log(job.job_id, log, done))
+
+        async def upload(repo_path: Path) -> None:
+            # blocking reads and pooled requests, off the event loop
+            await asyncio.to_thread(upload_artifacts, job.job_id, repo_path)
+
+        try:
+            await run_build(
+                job.git_repository_url, job.commit_hash, log, after_build=upload
+            )
+            logger.info("Job %s succeeded", job.job_id)
+            return JobStatus.SUCCEEDED
+        except (BuildError, CloneError) as e:
+            logger.error("Job %s failed: %s", job.job_id, e)
+            return JobStatus.FAILED
+        except requests.exceptions.RequestException as e:
+            logger.error("Job %s failed to upload artifacts: %s", job.job_id, e)
+            return JobStatus.FAILED
+        finally:
+            done.set()
+            try:
+                unshipped = await asyncio.shield(shipper)
+            finally:
+                log.close()
+            if unshipped == 0:
+                log.remove()
+
+    async def _ship_log(self, job_id: int, log: BuildLog, done: asyncio.Event) -> int:
+        """
+        Post the log file to the API every LOG_FLUSH_INTERVAL until done.
+
+        Returns:
+            The number of bytes that could not be shipped.
+        """
+        offset = 0
+        while True:
+            finished = done.is_set()
+            offset = await self._ship_from(job_id, log, offset)
+            if finished:
+                break
+            try:
+                await asyncio.wait_for(done.wait(), LOG_FLUSH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+        unshipped = log.path.stat().st_size - offset
+        if unshipped:
+            logger.warning(
+                "Job %s: %d bytes of log were not shipped, see %s",
+                job_id,
+                unshipped,
+                log.path,
+            )
+        return unshipped
+
+    async def _ship_from(self, job_id: int, log: BuildLog, offset: int) -> int:
+        with open(log.path, "rb") as f:
+            while True:
+                f.seek(offset)
+                data = f.read(LOG_BATCH_BYTES)
+                if not data:
+                    return offset
+                try:
+                    resp = await self._client.post(
+                        f"/jobs/{job_id}/logs",
+                        params={"offset": offset},
+                        content=data,
+                        headers={"Content-Type": "application/octet-stream"},
+                    )
+                    resp.raise_for_status()
+                except httpx.HTTPError as e:
+                    logger.warning("Failed to ship log for job %s: %s", job_id, e)
+                    return offset
+                offset += len(data)
+
+
+if __name__ == "__main__":
+    AsyncAgent().start()
@@ -0,0 +1,359 @@
+"""
+asyncio counterpart of the functions in runner.builder.builder
+
+Runs exactly the same git and make invocations as the threaded builder, but
+through asyncio subprocesses, so a single event loop can supervise many builds
+at once. Cancelling the task running a build kills the whole process group of
+the command in flight. The shared mirror cache, workspace pool, jobserver and
+compiler cache are reused as-is. Jobserver tokens are awaited on the loop;
+mirror leases and workspace locks are taken in a pool of threads of their own,
+so builds waiting for them can't starve the threads that release them.
+"""
+
+import asyncio
+import logging
+import os
+import signal
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import AbstractContextManager, asynccontextmanager
+from pathlib import Path
+from typing import AsyncIterator, Awaitable, Callable, Sequence, TypeVar
+
+from runner import refs, utils
+from runner.builder.buildlog import CHUNK_SIZE, BuildLog
+from runner.builder.builder import (
+    BUILD_DIRS,
+    COMPILER_CACHE,
+    JOBSERVER,
+    MIRRORS,
+    WORKSPACES,
+    BuildError,
+    CloneError,
+    CloneMode,
+    GitStep,
+    _clone_steps,
+    _configured_clone_mode,
+    _fetch_commit_steps,
+    _make_invocation,
+    _report_cache_stats,
+    _update_steps,
+    _write_alternates,
+)
+from runner.builder.compiler_cache import CacheStats
+from runner.config import LOG_LEVEL, ASYNC_MAX_BUILDS, WORKSPACE_MODE
+
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+logger.setLevel(LOG_LEVEL)
+
+# how long a cancelled command gets to exit after SIGTERM before it is killed
+TERMINATE_TIMEOUT = 5
+
+T = TypeVar("T")
+
+# enters the blocking context managers of in_thread. Every build waits on at
+# most one at a time, so with a thread per build none waits for a thread
+_ENTER_EXECUTOR = ThreadPoolExecutor(
+    max_workers=ASYNC_MAX_BUILDS + 1, thread_name_prefix="async-builder-enter"
+)
+
+
+async def run_logged(
+    cmd: Sequence[str] | str,
+    log: BuildLog,
+    cwd: Path,
+    env: dict[str, str] | None = None,
+    shell: bool = False,
+    pass_fds: Sequence[int] = (),
+) -> None:
+    """
+    Run cmd and stream its combined stdout/stderr into log.
+
+    The command runs in its own session. If the calling task is cancelled
+    the session's process group is terminated, then killed if it does not
+    exit within TERMINATE_TIMEOUT seconds.
+
+    Raises:
+        subprocess.CalledProcessError: If cmd exits non-zero. Its stderr holds
+            the tail of the output.
+    """
+    shown = cmd if isinstance(cmd, str) else " ".join(cmd)
+    log.write(f"$ {shown}\n".encode())
+    kwargs = dict(
+        cwd=cwd,
+        env=env,
+        pass_fds=pass_fds,
+        start_new_session=True,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+    )
+    if shell:
+        proc = await asyncio.create_subprocess_shell(cmd, **kwargs)
+    else:
+        proc = await asyncio.create_subprocess_exec(*cmd, **kwargs)
+    try:
+        while chunk := await proc.stdout.read(CHUNK_SIZE):
+            log.write(chunk)
+        returncode = await proc.wait()
+    except asyncio.CancelledError:
+        await asyncio.shield(_terminate(proc))
+        raise
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, cmd, stderr=log.tail())
+
+
+async def _terminate(proc: asyncio.subprocess.Process) -> None:
+    # SIGTERM first so make can remove half-written targets and hand its
+    # jobserver tokens back before exiting
+    _signal_group(proc, signal.SIGTERM)
+    try:
+        await asyncio.wait_for(proc.wait(), TERMINATE_TIMEOUT)
+    except asyncio.TimeoutError:
+        _signal_group(proc, signal.SIGKILL)
+        await proc.wait()
+    logger.info("Terminated %s after cancellation", proc.pid)
+
+
+def _signal_group(proc: asyncio.subprocess.Process, sig: signal.Signals) -> None:
+    try:
+        os.killpg(proc.pid, sig)
+    except ProcessLookupError:
+        pass
+
+
+@asynccontextmanager
+async def in_thread(cm: AbstractContextManager[T]) -> AsyncIterator[T]:
+    """
+    Enter and exit a blocking context manager in worker threads.
+
+    cm is entered in a thread of _ENTER_EXECUTOR and exited in one of the
+    default executor, so exits never queue behind entries blocked waiting for
+    them. If the caller is cancelled while the thread is still blocked entering cm,
+    cm is exited as soon as the thread gets in, so whatever it acquired (a
+    jobserver token, a workspace lock, a mirror lease) is not leaked.
+    """
+    loop = asyncio.get_running_loop()
+    enter = loop.run_in_executor(_ENTER_EXECUTOR, cm.__enter__)
+    try:
+        value = await asyncio.shield(enter)
+    except asyncio.CancelledError:
+
+        def release(future: asyncio.Future) -> None:
+            if not future.cancelled() and future.exception() is None:
+                loop.run_in_executor(None, cm.__exit__, None, None, None)
+
+        enter.add_done_callback(release)
+        raise
+    try:
+        yield value
+    except BaseException as e:
+        if not await asyncio.to_thread(cm.__exit__, type(e), e, e.__traceback__):
+            raise
+    else:
+        await asyncio.to_thread(cm.__exit__, None, None, None)
+
+
+async def _git_steps(steps: list[GitStep], log: BuildLog) -> None:
+    for args, cwd in steps:
+        await run_logged(["/usr/bin/git", *args], log, cwd=cwd)
+
+
+async def _get_commit_hash(repo_path: Path) -> str:
+    commit_hash = refs.read_head(repo_path)
+    if commit_hash is not None:
+        return commit_hash
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            "/usr/bin/git",
+            "rev-parse",
+            "HEAD",
+            cwd=repo_path,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+        stdout, stderr = await proc.communicate()
+    except OSError as e:
+        raise CloneError(f"Failed to get commit hash: {e}") from e
+    if proc.returncode != 0:
+        raise CloneError(f"Failed to get commit hash: {stderr.decode().strip()}")
+    return stdout.decode().strip()
+
+
+async def clone_repo(
+    repo: str,
+    build_dir: Path,
+    commit_hash: str | None = None,
+    reference: Path | None = None,
+    mode: CloneMode | None = None,
+    log: BuildLog | None = None,
+) -> str:
+    """
+    Clone git repository into build directory.
+
+    See runner.builder.builder.clone_repo.
+
+    Returns:
+        The commit hash of the cloned repo.
+
+    Raises:
+        CloneError: If cloning fails.
+    """
+    repo_name = utils.get_dir_name(repo)
+    repo_path = build_dir / repo_name
+    log = log or BuildLog()
+    mode = mode or _configured_clone_mode()
+
+    if commit_hash is not None and mode != CloneMode.FULL:
+        logger.info(
+            "Fetching %s at %s into %s (%s)", repo, commit_hash, repo_path, mode
+        )
+        try:
+            _write_alternates(repo_path, reference)
+            await _git_steps(
+                _fetch_commit_steps(repo, repo_path, commit_hash, mode), log
+            )
+            logger.info("Fetched %s at %s", repo_name, commit_hash)
+            return commit_hash
+        except subprocess.CalledProcessError as e:
+            logger.warning(
+                "Pinned fetch of %s failed, falling back to full clone: %s",
+                repo,
+                e.stderr,
+            )
+            await asyncio.to_thread(utils.cleanup_build_files, repo_path)
+
+    logger.info("Cloning %s into %s", repo, build_dir)
+    try:
+        await _git_steps(_clone_steps(repo, build_dir, commit_hash, reference), log)
+    except subprocess.CalledProcessError as e:
+        raise CloneError(f"Failed to clone {repo}: {e.stderr}") from e
+
+    if commit_hash is None:
+        commit_hash = await _get_commit_hash(repo_path)
+
+    logger.info("Cloned %s at %s", repo_name, commit_hash)
+    return commit_hash
+
+
+async def build(repo_path: Path, log: BuildLog | None = None) -> CacheStats:
+    """
+    Compile C program into a binary.
+
+    See runner.builder.builder.build.
+
+    Returns:
+        Compiler cache hit/miss counts for this build.
+
+    Raises:
+        BuildError: If compilation fails.
+    """
+    logger.info("Building %s", repo_path)
+    cmd, env, stats_file = _make_invocation(repo_path)
+    try:
+        async with JOBSERVER.async_slot() as make_env:
+            await run_logged(
+                cmd,
+                log or BuildLog(),
+                cwd=repo_path,
+                env={**env, **make_env},
+                shell=True,
+                pass_fds=JOBSERVER.fds,
+            )
+    except subprocess.CalledProcessError as e:
+        raise BuildError(f"Build failed: {e.stderr}") from e
+    finally:
+        if COMPILER_CACHE.enabled:
+            await asyncio.to_thread(COMPILER_CACHE.evict)
+    return _report_cache_stats(repo_path, stats_file)
+
+
+async def update_checkout(
+    repo_path: Path, commit_hash: str | None = None, log: BuildLog | None = None
+) -> str:
+    """
+    Fetch into an existing clone and check out commit_hash in place.
+
+    See runner.builder.builder.update_checkout.
+
+    Returns:
+        The commit hash that is checked out.
+
+    Raises:
+        CloneError: If fetching or checking out fails.
+    """
+    logger.info("Updating %s to %s", repo_path, commit_hash or "remote HEAD")
+    try:
+        await _git_steps(_update_steps(repo_path, commit_hash), log or BuildLog())
+    except subprocess.CalledProcessError as e:
+        raise CloneError(f"Failed to update {repo_path}: {e.stderr}") from e
+    if commit_hash is None:
+        commit_hash = await _get_commit_hash(repo_path)
+    return commit_hash
+
+
+async def run(
+    repo: str,
+    commit_hash: str | None = None,
+    log: BuildLog | None = None,
+    after_build: Callable[[Path], Awaitable[None]] | None = None,
+) -> None:
+    """
+    Clone and build a C program in an isolated temp directory.
+
+    The build directory is removed when the build is done, also when it is
+    cancelled.
+    after_build is awaited with the built checkout after a successful build.
+
+    Raises:
+        CloneError: If cloning fails.
+        BuildError: If compilation fails.
+    """
+    if WORKSPACE_MODE:
+        await run_in_workspace(repo, commit_hash, log, after_build)
+        return
+
+    build_dir = BUILD_DIRS.create()
+    try:
+        async with in_thread(MIRRORS.lease(repo)) as mirror:
+            await clone_repo(repo, build_dir, commit_hash, reference=mirror, log=log)
+            repo_path = build_dir / utils.get_dir_name(repo)
+            await build(repo_path, log)
+            if after_build is not None:
+                await after_build(repo_path)
+    finally:
+        await asyncio.shield(asyncio.to_thread(BUILD_DIRS.remove, build_dir))
+
+
+async def run_in_workspace(
+    repo: str,
+    commit_hash: str | None = None,
+    log: BuildLog | None = None,
+    after_build: Callable[[Path], Awaitable[None]] | None = None,
+) -> None:
+    """
+    Build a C program incrementally in the repository's warm workspace.
+
+    See runner.builder.builder.run_in_workspace.
+
+    Raises:
+        CloneError: If cloning or updating the checkout fails.
+        BuildError: If compilation fails.
+    """
+    async with in_thread(WORKSPACES.acquire(repo)) as workspace:
+        repo_path = workspace / utils.get_dir_name(repo)
+        try:
+            if (repo_path / ".git").exists():
+                await update_checkout(repo_path, commit_hash, log)
+            else:
+                await clone_repo(repo, workspace, commit_hash, log=log)
+        except (CloneError, asyncio.CancelledError):
+            # a cancelled fetch or checkout leaves the tree in an unknown state
+            await asyncio.shield(
+                asyncio.to_thread(utils.cleanup_build_files, repo_path)
+            )
+            raise
+        await build(repo_path, log)
+        if after_build is not None:
+            await after_build(repo_path)
@@ -3,12 +3,33 @@ Functions for compiling C programs
 """
 
 import logging
+import os
+import shlex
 import subprocess
-import tempfile
+from enum import Enum
 from pathlib import Path
+from typing import Callable
 
 from runner import utils
-from runner.config import LOG_LEVEL
+from runner.builder.buildlog import BuildLog, run_logged
+from runner.builder.compiler_cache import CacheStats, CompilerCache
+from runner.builder.jobserver import JobServer, available_cores
+from runner.builder.mirror import MirrorCache
+from runner.builder.reaper import BuildDirs
+from runner.builder.workspace import WorkspacePool
+from runner.config import (
+    LOG_LEVEL,
+    CLONE_MODE,
+    GIT_MIRROR_ROOT,
+    GIT_MIRROR_MAX_BYTES,
+    COMPILER_CACHE_DIR,
+    COMPILER_CACHE_MAX_BYTES,
+    BUILD_CORES,
+    BUILD_ROOT,
+    WORKSPACE_MODE,
+    WORKSPACE_ROOT,
+    WORKSPACE_MAX_BYTES,
+)
 
 logging.basicConfig()
 logger = logging.getLogger(__name__)
@@ -16,6 +37,12 @@ logger.setLevel(LOG_LEVEL)
 
 BUILD_CMD = "make"
 
+MIRRORS = MirrorCache(GIT_MIRROR_ROOT, GIT_MIRROR_MAX_BYTES)
+COMPILER_CACHE = CompilerCache(COMPILER_CACHE_DIR, COMPILER_CACHE_MAX_BYTES)
+JOBSERVER = JobServer(BUILD_CORES or available_cores())
+WORKSPACES = WorkspacePool(WORKSPACE_ROOT, WORKSPACE_MAX_BYTES)
+BUILD_DIRS = BuildDirs(BUILD_ROOT)
+
 
 class BuildError(Exception):
     """Raised when a build fails."""
@@ -29,13 +56,47 @@ class CloneError(Exception):
     pass
 
 
-def clone_repo(repo: str, build_dir: Path) -> str:
+class CloneMode(str, Enum):
+    """How much of a repository clone_repo downloads."""
+
+    FULL = "full"  # every branch and its full history
+    SHALLOW = "shallow"  # only the pinned commit, depth 1
+    PARTIAL = "partial"  # only the pinned commit, blobs fetched on checkout
+
+
+def _configured_clone_mode() -> CloneMode:
+    # resolved per clone, an invalid setting fails builds, not the import
+    try:
+        return CloneMode(CLONE_MODE)
+    except ValueError:
+        choices = ", ".join(mode.value for mode in CloneMode)
+        raise CloneError(
+            f"Invalid CLONE_MODE {CLONE_MODE!r}, expected one of {choices}"
+        ) from None
+
+
+def clone_repo(
+    repo: str,
+    build_dir: Path,
+    commit_hash: str | None = None,
+    reference: Path | None = None,
+    mode: CloneMode | None = None,
+    log: BuildLog | None = None,
+) -> str:
     """
     Clone git repository into build directory.
 
+    When commit_hash is given the working tree is checked out at that commit
+    instead of the default branch. In SHALLOW and PARTIAL mode only that commit
+    is fetched, falling back to a full clone if the remote refuses to serve it.
+
     Args:
         repo: Git repository URL (git@ or https://)
         build_dir: Directory to clone into
+        commit_hash: Commit to check out, defaults to the remote HEAD
+        reference: Local mirror of repo to borrow objects from, if any
+        mode: Clone mode, see CloneMode. Defaults to CLONE_MODE
+        log: Where git's output is streamed, discarded if None
 
     Returns:
         The commit hash of the cloned repo.
@@ -43,73 +104,278 @@ def clone_repo(repo: str, build_dir: Path) -> str:
     Raises:
         CloneError: If cloning fails.
     """
+    repo_name = utils.get_dir_name(repo)
+    repo_path = build_dir / repo_name
+    log = log or BuildLog()
+    mode = mode or _configured_clone_mode()
+
+    if commit_hash is not None and mode != CloneMode.FULL:
+        logger.info(
+            "Fetching %s at %s into %s (%s)", repo, commit_hash, repo_path, mode
+        )
+        try:
+            _write_alternates(repo_path, reference)
+            _git_steps(_fetch_commit_steps(repo, repo_path, commit_hash, mode), log)
+            logger.info("Fetched %s at %s", repo_name, commit_hash)
+            return commit_hash
+        except subprocess.CalledProcessError as e:
+            logger.warning(
+                "Pinned fetch of %s failed, falling back to full clone: %s",
+                repo,
+                e.stderr,
+            )
+            utils.cleanup_build_files(repo_path)
+
     logger.info("Cloning %s into %s", repo, build_dir)
     try:
-        result = subprocess.run(
-            ["/usr/bin/git", "clone", repo],
-            cwd=build_dir,
-            check=True,
-            capture_output=True,
-            text=True,
-        )
+        _git_steps(_clone_steps(repo, build_dir, commit_hash, reference), log)
     except subprocess.CalledProcessError as e:
         raise CloneError(f"Failed to clone {repo}: {e.stderr}") from e
 
-    repo_name = utils.get_dir_name(repo)
-    repo_path = build_dir / repo_name
-
-    try:
-        commit_hash = utils.get_commit_hash(repo_path, logger)
-    except Exception as e:
-        raise CloneError(f"Failed to get commit hash: {e}") from e
+    if commit_hash is None:
+        try:
+            commit_hash = utils.get_commit_hash(repo_path, logger)
+        except Exception as e:
+            raise CloneError(f"Failed to get commit hash: {e}") from e
 
     logger.info("Cloned %s at %s", repo_name, commit_hash)
     return commit_hash
 
 
-def build(repo_path: Path) -> None:
+# git invocations are planned as (args, cwd) steps so the threaded and the
+# asyncio builders run exactly the same commands
+GitStep = tuple[list[str], Path]
+
+
+def _clone_steps(
+    repo: str, build_dir: Path, commit_hash: str | None, reference: Path | None
+) -> list[GitStep]:
+    """Full clone, checked out at commit_hash if given."""
+    repo_path = build_dir / utils.get_dir_name(repo)
+    clone = ["clone"]
+    if reference is not None:
+        clone += ["--reference", str(reference)]
+    if commit_hash is None:
+        return [(clone + [repo], build_dir)]
+    return [
+        (clone + ["--no-checkout", repo], build_dir),
+        (["checkout", "--detach", commit_hash], repo_path),
+    ]
+
+
+def _fetch_commit_steps(
+    repo: str, repo_path: Path, commit_hash: str, mode: CloneMode
+) -> list[GitStep]:
+    """Initialize repo_path and fetch and check out a single commit into it."""
+    fetch = ["fetch", "--quiet", "--no-tags"]
+    if mode == CloneMode.SHALLOW:
+        fetch += ["--depth", "1"]
+    else:
+        fetch += ["--filter=blob:none"]
+    return [
+        (["init", "--quiet", str(repo_path)], repo_path.parent),
+        (["remote", "add", "origin", repo], repo_path),
+        (fetch + ["origin", commit_hash], repo_path),
+        (["checkout", "--quiet", "--detach", commit_hash], repo_path),
+    ]
+
+
+def _update_steps(repo_path: Path, commit_hash: str | None) -> list[GitStep]:
+    """Fetch into an existing clone and force-checkout the fetched commit."""
+    return [
+        (["fetch", "--quiet", "origin", commit_hash or "HEAD"], repo_path),
+        (["checkout", "--quiet", "--force", "--detach", "FETCH_HEAD"], repo_path),
+    ]
+
+
+def _write_alternates(repo_path: Path, reference: Path | None) -> None:
+    """Point a not yet initialized repo_path at a mirror's object store."""
+    if reference is None:
+        return
+    info = repo_path / ".git" / "objects" / "info"
+    info.mkdir(parents=True, exist_ok=True)
+    (info / "alternates").write_text(f"{reference / 'objects'}\n")
+
+
+def _git_steps(steps: list[GitStep], log: BuildLog) -> None:
+    for args, cwd in steps:
+        run_logged(["/usr/bin/git", *args], log, cwd=cwd)
+
+
+def _make_invocation(repo_path: Path) -> tuple[str, dict[str, str], Path]:
+    """Return make's command line, environment and compiler cache stats file."""
+    cmd = BUILD_CMD
+    env = dict(os.environ)
+    stats_file = repo_path.parent / "compiler-cache.stats"
+    stats_file.unlink(missing_ok=True)
+    if COMPILER_CACHE.enabled:
+        overrides = COMPILER_CACHE.make_overrides()
+        cmd = " ".join([BUILD_CMD, *map(shlex.quote, overrides)])
+        env.update(COMPILER_CACHE.env(stats_file))
+    return cmd, env, stats_file
+
+
+def _report_cache_stats(repo_path: Path, stats_file: Path) -> CacheStats:
+    stats = CacheStats.read(stats_file)
+    logger.info(
+        "Compiler cache for %s: %d hits, %d misses, %d uncacheable",
+        repo_path,
+        stats.hits,
+        stats.misses,
+        stats.uncacheable,
+    )
+    return stats
+
+
+def build(repo_path: Path, log: BuildLog | None = None) -> CacheStats:
     """
     Compile C program into a binary.
 
+    Compiler invocations go through the runner's shared compiler cache when
+    it is enabled, and make runs in parallel with as many jobs as it can get
+    from the runner's jobserver.
+
     Args:
         repo_path: Path to the cloned repository.
+        log: Where make's output is streamed, discarded if None
+
+    Returns:
+        Compiler cache hit/miss counts for this build.
 
     Raises:
         BuildError: If compilation fails.
     """
     logger.info("Building %s", repo_path)
+    cmd, env, stats_file = _make_invocation(repo_path)
     try:
-        subprocess.run(
-            BUILD_CMD,
-            cwd=repo_path,
-            check=True,
-            capture_output=True,
-            text=True,
-            shell=True,
-        )
+        with JOBSERVER.slot() as make_env:
+            run_logged(
+                cmd,
+                log or BuildLog(),
+                cwd=repo_path,
+                env={**env, **make_env},
+                shell=True,
+                pass_fds=JOBSERVER.fds,
+            )
     except subprocess.CalledProcessError as e:
         raise BuildError(f"Build failed: {e.stderr}") from e
+    finally:
+        if COMPILER_CACHE.enabled:
+            COMPILER_CACHE.evict()
+    return _report_cache_stats(repo_path, stats_file)
+
+
+def update_checkout(
+    repo_path: Path, commit_hash: str | None = None, log: BuildLog | None = None
+) -> str:
+    """
+    Fetch into an existing clone and check out commit_hash in place.
+
+    Files that did not change keep their timestamps, so a following make
+    only rebuilds targets whose sources changed.
+
+    Args:
+        repo_path: Path to a repository previously cloned by clone_repo.
+        commit_hash: Commit to check out, defaults to the remote HEAD.
+        log: Where git's output is streamed, discarded if None
+
+    Returns:
+        The commit hash that is checked out.
+
+    Raises:
+        CloneError: If fetching or checking out fails.
+    """
+    logger.info("Updating %s to %s", repo_path, commit_hash or "remote HEAD")
+    try:
+        _git_steps(_update_steps(repo_path, commit_hash), log or BuildLog())
+    except subprocess.CalledProcessError as e:
+        raise CloneError(f"Failed to update {repo_path}: {e.stderr}") from e
+    if commit_hash is None:
+        try:
+            commit_hash = utils.get_commit_hash(repo_path, logger)
+        except Exception as e:
+            raise CloneError(f"Failed to get commit hash: {e}") from e
+    return commit_hash
 
 
-def run(repo: str) -> None:
+def run(
+    repo: str,
+    commit_hash: str | None = None,
+    log: BuildLog | None = None,
+    after_build: Callable[[Path], None] | None = None,
+) -> None:
     """
     Clone and build a C program in an isolated temp directory.
 
+    The directory is removed once the build is done, whether it succeeded
+    or not.
+
     Args:
         repo: Git repository URL.
+        commit_hash: Commit to build, defaults to the remote HEAD.
+        log: Where git and make output is streamed, discarded if None
+        after_build: Called with the built checkout after a successful build,
+            e.g. to upload its artifacts.
 
     Raises:
         CloneError: If cloning fails.
         BuildError: If compilation fails.
     """
-    build_dir = Path(tempfile.mkdtemp(prefix="job_"))
-    logger.info("Created temp build directory: %s", build_dir)
+    if WORKSPACE_MODE:
+        run_in_workspace(repo, commit_hash, log, after_build)
+        return
 
+    build_dir = BUILD_DIRS.create()
     try:
-        clone_repo(repo, build_dir)
-        repo_name = utils.get_dir_name(repo)
-        repo_path = build_dir / repo_name
-        build(repo_path)
-    except (CloneError, BuildError):
-        utils.cleanup_build_files(build_dir)
-        raise
+        # keep the mirror leased until the build is done, the clone's
+        # object store depends on it through alternates
+        with MIRRORS.lease(repo) as mirror:
+            clone_repo(repo, build_dir, commit_hash, reference=mirror, log=log)
+            repo_name = utils.get_dir_name(repo)
+            repo_path = build_dir / repo_name
+            build(repo_path, log)
+            if after_build is not None:
+                after_build(repo_path)
+    finally:
+        # artifacts have been uploaded by now, nothing else needs the tree
+        BUILD_DIRS.remove(build_dir)
+
+
+def run_in_workspace(
+    repo: str,
+    commit_hash: str | None = None,
+    log: BuildLog | None = None,
+    after_build: Callable[[Path], None] | None = None,
+) -> None:
+    """
+    Build a C program incrementally in the repository's warm workspace.
+
+    The first job for a repository clones it; later jobs update the existing
+    checkout and re-run make, which only rebuilds what changed.
+
+    Args:
+        repo: Git repository URL.
+        commit_hash: Commit to build, defaults to the remote HEAD.
+        log: Where git and make output is streamed, discarded if None
+        after_build: Called with the built checkout after a successful build,
+            while the workspace is still held.
+
+    Raises:
+        CloneError: If cloning or updating the checkout fails.
+        BuildError: If compilation fails.
+    """
+    with WORKSPACES.acquire(repo) as workspace:
+        repo_path = workspace / utils.get_dir_name(repo)
+        try:
+            if (repo_path / ".git").exists():
+                update_checkout(repo_path, commit_hash, log)
+            else:
+                # no --reference here, the workspace outlives any mirror lease
+                clone_repo(repo, workspace, commit_hash, log=log)
+        except CloneError:
+            # start over from a fresh clone next time
+            utils.cleanup_build_files(repo_path)
+            raise
+        build(repo_path, log)
+        if after_build is not None:
+            after_build(repo_path)
@@ -0,0 +1,206 @@
+"""
+Streaming capture of build output.
+
+Subprocess output is read in bounded chunks and appended to a BuildLog as it
+is produced, instead of being buffered in memory until the process exits.
+A BuildLog writes to a local file and, for jobs, a LogShipper thread sends
+the file to the API in batches so the build can be followed while it runs.
+Only a small tail of the output is kept in memory, for error messages.
+"""
+
+import collections
+import logging
+import os
+import subprocess
+import threading
+from pathlib import Path
+from typing import Sequence
+
+import requests
+
+from runner.api import api_client
+from runner.config import (
+    LOG_LEVEL,
+    BUILD_LOG_DIR,
+    LOG_BATCH_BYTES,
+    LOG_FLUSH_INTERVAL,
+)
+
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+logger.setLevel(LOG_LEVEL)
+
+CHUNK_SIZE = 64 * 1024
+TAIL_BYTES = 8 * 1024
+
+
+class LogShipper(threading.Thread):
+    """Ships a growing log file to the API in batches from a background thread."""
+
+    def __init__(
+        self,
+        job_id: int,
+        path: Path,
+        batch_bytes: int = LOG_BATCH_BYTES,
+        interval: float = LOG_FLUSH_INTERVAL,
+    ):
+        super().__init__(name=f"log-shipper-{job_id}", daemon=True)
+        self.job_id = job_id
+        self.path = path
+        self.batch_bytes = batch_bytes
+        self.interval = interval
+        self.offset = 0  # bytes of the file the API has acknowledged
+        self._closing = threading.Event()
+        self._wake = threading.Event()
+
+    def run(self) -> None:
+        while True:
+            closing = self._closing.is_set()
+            self._ship()
+            if closing:
+                return
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def notify(self, size: int) -> None:
+        """Tell the shipper the file has grown to size bytes."""
+        if size - self.offset >= self.batch_bytes:
+            self._wake.set()
+
+    def close(self, timeout: float = 30) -> int:
+        """
+        Ship whatever is left and stop the thread.
+
+        Returns:
+            The number of bytes that could not be shipped.
+        """
+        self._closing.set()
+        self._wake.set()
+        self.join(timeout)
+        unshipped = self.path.stat().st_size - self.offset
+        if unshipped:
+            logger.warning(
+                "Job %s: %d bytes of log were not shipped, see %s",
+                self.job_id,
+                unshipped,
+                self.path,
+            )
+        return unshipped
+
+    def _ship(self) -> None:
+        with open(self.path, "rb") as f:
+            while True:
+                f.seek(self.offset)
+                data = f.read(self.batch_bytes)
+                if not data:
+                    return
+                try:
+                    api_client.post_log(self.job_id, self.offset, data)
+                except requests.exceptions.RequestException as e:
+                    logger.warning("Failed to ship log for job %s: %s", self.job_id, e)
+                    return
+                self.offset += len(data)
+
+
+class BuildLog:
+    """Output of a single build, appended to as processes produce it."""
+
+    def __init__(self, path: Path | None = None, shipper: LogShipper | None = None):
+        self.path = path
+        self._file = open(path, "ab", buffering=0) if path is not None else None
+        self._shipper = shipper
+        self._size = path.stat().st_size if path is not None else 0
+        self._tail: collections.deque[bytes] = collections.deque()
+        self._tail_size = 0
+        self._lock = threading.Lock()
+        if shipper is not None:
+            shipper.start()
+
+    @classmethod
+    def for_job(cls, job_id: int, ship: bool = True) -> "BuildLog":
+        """
+        Log to BUILD_LOG_DIR/<job_id>.log.
+
+        With ship set a LogShipper thread sends the log to the API and the
+        file is deleted on close once the API has all of it. Callers that
+        ship it themselves pass ship=False and delete it with remove().
+        """
+        log_dir = Path(BUILD_LOG_DIR)
+        log_dir.mkdir(parents=True, exist_ok=True)
+        path = log_dir / f"{job_id}.log"
+        path.touch()
+        return cls(path, LogShipper(job_id, path) if ship else None)
+
+    def write(self, data: bytes) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.write(data)
+            self._size += len(data)
+            self._tail.append(data)
+            self._tail_size += len(data)
+            while self._tail_size - len(self._tail[0]) >= TAIL_BYTES:
+                self._tail_size -= len(self._tail.popleft())
+        if self._shipper is not None:
+            self._shipper.notify(self._size)
+
+    def tail(self) -> str:
+        """The last few KiB of output, for error messages."""
+        with self._lock:
+            data = b"".join(self._tail)[-TAIL_BYTES:]
+        return data.decode(errors="replace")
+
+    def close(self) -> None:
+        unshipped = self._shipper.close() if self._shipper is not None else None
+        if self._file is not None:
+            self._file.close()
+        if unshipped == 0:
+            self.remove()
+
+    def remove(self) -> None:
+        """
+        Delete the log file, once it has been shipped. A log that could not
+        be shipped is kept for an operator to look at.
+        """
+        if self.path is not None:
+            self.path.unlink(missing_ok=True)
+
+    def __enter__(self) -> "BuildLog":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def run_logged(
+    cmd: Sequence[str] | str,
+    log: BuildLog,
+    cwd: Path,
+    env: dict[str, str] | None = None,
+    shell: bool = False,
+    pass_fds: Sequence[int] = (),
+) -> None:
+    """
+    Run cmd and stream its combined stdout/stderr into log.
+
+    Raises:
+        subprocess.CalledProcessError: If cmd exits non-zero. Its stderr holds
+            the tail of the output.
+    """
+    shown = cmd if isinstance(cmd, str) else " ".join(cmd)
+    log.write(f"$ {shown}\n".encode())
+    with subprocess.Popen(
+        cmd,
+        cwd=cwd,
+        env=env,
+        shell=shell,
+        pass_fds=pass_fds,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+    ) as proc:
+        fd = proc.stdout.fileno()
+        while chunk := os.read(fd, CHUNK_SIZE):
+            log.write(chunk)
+        returncode = proc.wait()
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, cmd, stderr=log.tail())
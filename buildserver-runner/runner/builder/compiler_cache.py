@@ -0,0 +1,300 @@
+"""
+Content-addressed object cache for C/C++ compiler invocations.
+
+The builder points make's CC/CXX at this module, which runs as a thin
+compiler wrapper:
+
+    python -m runner.builder.compiler_cache cc -c foo.c -o foo.o
+
+Invocations that compile a single source file to an object are keyed by the
+preprocessed source, the compiler arguments and the identity of the compiler
+binary. A hit copies the cached object into place, a miss runs the real
+compiler and stores its output. The make dependency file written by -MD or
+-MMD is cached and restored along with the object. Everything else is passed
+straight through.
+
+The cache directory is shared by every build on the runner; entries are
+written with an atomic rename, so concurrent builds never observe partial
+objects. This module is imported once per compiler invocation and keeps its
+imports to the standard library.
+"""
+
+import hashlib
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+
+import runner
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR_ENV = "BUILDSERVER_COMPILER_CACHE_DIR"
+STATS_FILE_ENV = "BUILDSERVER_COMPILER_CACHE_STATS"
+
+KEY_VERSION = b"1"
+SOURCE_SUFFIXES = (".c", ".cc", ".cpp", ".cxx", ".C")
+# flags whose side effects (extra output files, non-object output) we can't replay
+UNCACHEABLE_FLAGS = ("-M", "-MM", "-E", "-S")
+UNCACHEABLE_PREFIXES = ("--save-temps", "-save-temps")
+# flags that write a dependency file next to the object
+DEPFILE_FLAGS = ("-MD", "-MMD")
+# dependency file options, and those of them that take a value
+DEPFILE_OPTIONS = ("-MD", "-MMD", "-MP", "-MG")
+DEPFILE_VALUE_OPTIONS = ("-MF", "-MT", "-MQ")
+CHUNK_SIZE = 64 * 1024
+
+
+@dataclass
+class CacheStats:
+    """Compiler cache hit/miss counts for a single build."""
+
+    hits: int = 0
+    misses: int = 0
+    uncacheable: int = 0
+
+    @classmethod
+    def read(cls, stats_file: Path) -> "CacheStats":
+        """Tally the outcomes the wrapper appended to stats_file."""
+        stats = cls()
+        try:
+            lines = stats_file.read_text().split()
+        except FileNotFoundError:
+            return stats
+        stats.hits = lines.count("hit")
+        stats.misses = lines.count("miss")
+        stats.uncacheable = lines.count("skip")
+        return stats
+
+
+class CompilerCache:
+    """Size-bounded object cache shared by every build on the runner."""
+
+    def __init__(self, root: Path | str, max_bytes: int):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self._evict_lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def make_overrides(self) -> list[str]:
+        """make variable overrides that route compilation through the cache."""
+        wrapper = [sys.executable, "-m", __name__]
+        return [
+            "CC=" + " ".join(wrapper + ["cc"]),
+            "CXX=" + " ".join(wrapper + ["c++"]),
+        ]
+
+    def env(self, stats_file: Path) -> dict[str, str]:
+        """Environment variables the wrapper needs to find the cache."""
+        pythonpath = str(Path(runner.__file__).resolve().parent.parent)
+        if os.environ.get("PYTHONPATH"):
+            pythonpath += os.pathsep + os.environ["PYTHONPATH"]
+        return {
+            CACHE_DIR_ENV: str(self.root),
+            STATS_FILE_ENV: str(stats_file),
+            "PYTHONPATH": pythonpath,
+        }
+
+    def evict(self) -> None:
+        """Remove least recently used entries until the cache fits its cap."""
+        with self._evict_lock:
+            if not self.root.is_dir():
+                return
+            entries = []
+            total = 0
+            for root, _, files in os.walk(self.root):
+                for name in files:
+                    path = Path(root, name)
+                    try:
+                        st = path.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((st.st_mtime, st.st_size, path))
+                    total += st.st_size
+            if total <= self.max_bytes:
+                return
+            entries.sort()
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                path.unlink(missing_ok=True)
+                total -= size
+            logger.info("Evicted compiler cache down to %d bytes", total)
+
+
+def _source_and_output(args: list[str]) -> tuple[str, str, str | None] | None:
+    """
+    Check whether args compile exactly one source to an object.
+
+    Returns:
+        (source, output, depfile), depfile being None unless -MD or -MMD ask
+        for one. None if the invocation can't be cached.
+    """
+    if "-c" not in args:
+        return None
+    sources = []
+    output = None
+    depfile = None
+    skip_next = False
+    for i, arg in enumerate(args):
+        if skip_next:
+            skip_next = False
+            continue
+        if arg in ("-o", *DEPFILE_VALUE_OPTIONS):
+            if i + 1 >= len(args):
+                return None
+            if arg == "-o":
+                output = args[i + 1]
+            elif arg == "-MF":
+                depfile = args[i + 1]
+            skip_next = True
+        elif arg.startswith("-MF"):
+            depfile = arg[len("-MF") :]
+        elif (
+            arg in UNCACHEABLE_FLAGS
+            or arg.startswith(UNCACHEABLE_PREFIXES)
+            or arg.startswith("@")
+            or arg == "-"
+        ):
+            return None
+        elif arg.endswith(SOURCE_SUFFIXES) and not arg.startswith("-"):
+            sources.append(arg)
+    if len(sources) != 1:
+        return None
+    if output is None:
+        output = Path(sources[0]).with_suffix(".o").name
+    if not any(arg in DEPFILE_FLAGS for arg in args):
+        depfile = None
+    elif depfile is None:
+        # without -MF the compiler names it after the object
+        depfile = str(Path(output).with_suffix(".d"))
+    return sources[0], output, depfile
+
+
+def _preprocessor_args(args: list[str]) -> list[str]:
+    """args without the dependency file options, which -E would act on."""
+    cpp_args = []
+    skip_next = False
+    for arg in args:
+        if skip_next:
+            skip_next = False
+        elif arg in DEPFILE_VALUE_OPTIONS:
+            skip_next = True
+        elif arg not in DEPFILE_OPTIONS and not arg.startswith(DEPFILE_VALUE_OPTIONS):
+            cpp_args.append(arg)
+    return cpp_args
+
+
+def _compiler_identity(compiler: str) -> bytes:
+    # resolved path, size and mtime identify the installed compiler version
+    # without forking `cc --version` for every translation unit
+    path = shutil.which(compiler)
+    if path is None:
+        raise FileNotFoundError(compiler)
+    real = os.path.realpath(path)
+    st = os.stat(real)
+    return f"{real}\0{st.st_size}\0{st.st_mtime_ns}".encode()
+
+
+def _cache_key(compiler: str, args: list[str], output: str) -> str | None:
+    """Hash the preprocessed source, arguments and compiler. None on failure."""
+    digest = hashlib.sha256(KEY_VERSION)
+    digest.update(_compiler_identity(compiler))
+    key_args = []
+    skip_next = False
+    for arg in args:
+        if skip_next:
+            skip_next = False
+        elif arg == "-o":
+            skip_next = True
+        elif arg != "-c":
+            key_args.append(arg)
+    digest.update(b"\0".join(arg.encode() for arg in key_args))
+    if any(arg.startswith("-g") for arg in args):
+        # debug info records the compilation directory
+        digest.update(os.getcwd().encode())
+    if any(arg in DEPFILE_FLAGS for arg in args):
+        # the dependency file's default target is the object
+        digest.update(b"\0" + output.encode())
+    proc = subprocess.Popen(
+        [compiler, *_preprocessor_args(key_args), "-E"],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+    )
+    while chunk := proc.stdout.read(CHUNK_SIZE):
+        digest.update(chunk)
+    if proc.wait() != 0:
+        return None
+    return digest.hexdigest()
+
+
+def _record(outcome: str) -> None:
+    stats_file = os.environ.get(STATS_FILE_ENV)
+    if not stats_file:
+        return
+    fd = os.open(stats_file, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, f"{outcome}\n".encode())
+    finally:
+        os.close(fd)
+
+
+def _copy_atomic(src: Path, dst: Path) -> None:
+    tmp = dst.with_name(f".{dst.name}.{uuid.uuid4().hex}")
+    try:
+        shutil.copyfile(src, tmp)
+        os.replace(tmp, dst)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+
+def run_compiler(argv: list[str]) -> int:
+    """Run one compiler invocation through the cache. Returns the exit code."""
+    compiler, args = argv[0], argv[1:]
+    cache_dir = os.environ.get(CACHE_DIR_ENV)
+    target = _source_and_output(args)
+    key = None
+    if cache_dir and target is not None:
+        try:
+            key = _cache_key(compiler, args, target[1])
+        except OSError as e:
+            logger.debug("Not caching %s: %s", argv, e)
+    if key is None:
+        _record("skip")
+        return subprocess.call(argv)
+
+    _, output, depfile = target
+    entry = Path(cache_dir, key[:2], key + ".o")
+    # (cache entry, build output) pairs, a hit needs every entry
+    files = [(entry, Path(output))]
+    if depfile is not None:
+        files.insert(0, (entry.with_suffix(".d"), Path(depfile)))
+    try:
+        for cached, path in files:
+            _copy_atomic(cached, path)
+        for cached, _ in files:
+            os.utime(cached)
+        _record("hit")
+        return 0
+    except FileNotFoundError:
+        pass
+
+    returncode = subprocess.call(argv)
+    _record("miss")
+    if returncode == 0 and all(path.exists() for _, path in files):
+        entry.parent.mkdir(parents=True, exist_ok=True)
+        for cached, path in files:
+            _copy_atomic(path, cached)
+    return returncode
+
+
+if __name__ == "__main__":
+    sys.exit(run_compiler(sys.argv[1:]))
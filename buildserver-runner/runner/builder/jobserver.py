@@ -0,0 +1,116 @@
+"""
+GNU make jobserver shared by every build running on the runner.
+
+The runner owns a single token pipe holding one token per core in its budget.
+Each build takes a token for make's own implicit job before it starts, and
+make acquires the rest from the same pipe as it finds parallel work. An idle
+runner therefore lets one build use every core, while concurrent builds split
+the budget between them instead of oversubscribing the host.
+"""
+
+import asyncio
+import logging
+import os
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Iterator
+
+from runner.config import LOG_LEVEL
+
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+logger.setLevel(LOG_LEVEL)
+
+
+def available_cores() -> int:
+    """Number of cores this process is allowed to run on."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+class JobServer:
+    """Token pipe that hands out -j slots from a fixed core budget."""
+
+    def __init__(self, slots: int):
+        self.slots = slots
+        self._read_fd, self._write_fd = os.pipe()
+        os.write(self._write_fd, b"+" * slots)
+        # non-blocking reader and its lock, for async_slot on an event loop
+        self._async_fd: int | None = None
+        self._async_lock: asyncio.Lock | None = None
+        self._async_loop: asyncio.AbstractEventLoop | None = None
+        logger.info("Jobserver started with %d slots", slots)
+
+    @property
+    def fds(self) -> tuple[int, int]:
+        """File descriptors make must inherit to reach the jobserver."""
+        return self._read_fd, self._write_fd
+
+    @contextmanager
+    def slot(self) -> Iterator[dict[str, str]]:
+        """
+        Hold one slot for the duration of a make invocation.
+
+        Blocks until a slot is free. Yields the environment variables that
+        make needs to join the jobserver; run it with pass_fds=self.fds.
+        """
+        token = os.read(self._read_fd, 1)
+        try:
+            yield self._make_env()
+        finally:
+            os.write(self._write_fd, token)
+
+    @asynccontextmanager
+    async def async_slot(self) -> AsyncIterator[dict[str, str]]:
+        """
+        slot() for a build supervised by an event loop.
+
+        Waits for the token on the loop instead of in a thread, and hands it
+        back with a write that never blocks.
+        """
+        token = await self._read_token()
+        try:
+            yield self._make_env()
+        finally:
+            os.write(self._write_fd, token)
+
+    async def _read_token(self) -> bytes:
+        loop = asyncio.get_running_loop()
+        if self._async_fd is None:
+            # a separate open file description of the pipe, so make's reads
+            # through _read_fd stay blocking
+            self._async_fd = os.open(
+                f"/proc/self/fd/{self._read_fd}", os.O_RDONLY | os.O_NONBLOCK
+            )
+        if self._async_loop is not loop:
+            self._async_lock = asyncio.Lock()
+            self._async_loop = loop
+        # a loop watches an fd for one callback only, waiters take turns
+        async with self._async_lock:
+            while True:
+                try:
+                    return os.read(self._async_fd, 1)
+                except BlockingIOError:
+                    pass
+                readable = loop.create_future()
+                loop.add_reader(self._async_fd, _set_done, readable)
+                try:
+                    await readable
+                finally:
+                    loop.remove_reader(self._async_fd)
+
+    def _make_env(self) -> dict[str, str]:
+        return {"MAKEFLAGS": f"-j --jobserver-auth={self._read_fd},{self._write_fd}"}
+
+    def close(self) -> None:
+        if self._async_fd is not None:
+            os.close(self._async_fd)
+        os.close(self._read_fd)
+        os.close(self._write_fd)
+
+
+def _set_done(future: asyncio.Future) -> None:
+    # the reader can fire again before the waiting task removes it
+    if not future.done():
+        future.set_result(None)
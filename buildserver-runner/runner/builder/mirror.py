@@ -0,0 +1,167 @@
+"""
+Persistent bare-mirror cache for repository clones.
+
+Each repository URL gets one bare mirror under GIT_MIRROR_ROOT. Jobs lease the
+mirror, bring it up to date with an incremental fetch and clone against it with
+`--reference`, so only new objects ever cross the network. Mirrors that are not
+leased are evicted least-recently-used first once the cache exceeds its cap.
+Each mirror's size is measured after it is updated, so checking the cap never
+walks the whole cache.
+"""
+
+import hashlib
+import logging
+import os
+import shutil
+import subprocess
+import threading
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator
+
+from runner import utils
+from runner.config import LOG_LEVEL
+
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+logger.setLevel(LOG_LEVEL)
+
+
+class MirrorCache:
+    """LRU cache of bare repository mirrors bounded by total size on disk."""
+
+    def __init__(self, root: Path | str, max_bytes: int):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._repo_locks: dict[str, threading.Lock] = {}
+        self._leases: dict[str, int] = {}
+        # bytes on disk of each mirror, by directory name
+        self._sizes: dict[str, int] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def mirror_path(self, repo: str) -> Path:
+        """Location of the mirror for a repository URL."""
+        digest = hashlib.sha256(repo.encode()).hexdigest()[:16]
+        return self.root / f"{utils.get_dir_name(repo)}-{digest}.git"
+
+    @contextmanager
+    def lease(self, repo: str) -> Iterator[Path | None]:
+        """
+        Yield an up-to-date mirror of repo that will not be evicted while held.
+
+        Yields None when the cache is disabled or the mirror could not be
+        updated, in which case callers should clone straight from the remote.
+        """
+        if not self.enabled:
+            yield None
+            return
+        path = self.mirror_path(repo)
+        with self._lock:
+            self._leases[path.name] = self._leases.get(path.name, 0) + 1
+            repo_lock = self._repo_locks.setdefault(path.name, threading.Lock())
+        try:
+            with repo_lock:
+                updated = self._update(repo, path)
+                size = utils.dir_size(path) if path.exists() else None
+            with self._lock:
+                if size is None:
+                    self._sizes.pop(path.name, None)
+                else:
+                    self._sizes[path.name] = size
+            yield path if updated else None
+        finally:
+            with self._lock:
+                self._leases[path.name] -= 1
+                if self._leases[path.name] == 0:
+                    del self._leases[path.name]
+            self.evict()
+
+    def evict(self) -> None:
+        """Remove least recently used mirrors until the cache fits its cap."""
+        if not self.root.is_dir():
+            return
+        mirrors = [p for p in self.root.iterdir() if p.suffix == ".git"]
+        names = {p.name for p in mirrors}
+        with self._lock:
+            for name in list(self._sizes):
+                if name not in names and name not in self._leases:
+                    del self._sizes[name]
+            unknown = [p for p in mirrors if p.name not in self._sizes]
+        # mirrors left by an earlier process are measured once, unlocked
+        for path in unknown:
+            size = utils.dir_size(path)
+            with self._lock:
+                self._sizes.setdefault(path.name, size)
+        with self._lock:
+            total = sum(self._sizes.values())
+        if total <= self.max_bytes:
+            return
+
+        mtimes = {}
+        for path in mirrors:
+            try:
+                mtimes[path] = path.stat().st_mtime
+            except FileNotFoundError:
+                pass
+        evicted = []
+        with self._lock:
+            total = sum(self._sizes.values())
+            for path in sorted(mtimes, key=mtimes.get):
+                if total <= self.max_bytes:
+                    break
+                if path.name in self._leases or path.name not in self._sizes:
+                    continue
+                # renamed under the lock, so a new lease creates a fresh
+                # mirror instead of fetching into one being removed
+                trash = self.root / f".evicted-{path.name}.{uuid.uuid4().hex}"
+                try:
+                    path.rename(trash)
+                except FileNotFoundError:
+                    continue
+                size = self._sizes.pop(path.name)
+                total -= size
+                evicted.append((path, trash, size))
+        for path, trash, size in evicted:
+            logger.info("Evicting mirror %s (%d bytes)", path, size)
+            shutil.rmtree(trash, ignore_errors=True)
+
+    def _update(self, repo: str, path: Path) -> bool:
+        """Create or fetch into the mirror. Returns False if it is unusable."""
+        try:
+            if (path / "HEAD").exists():
+                logger.info("Fetching %s into mirror %s", repo, path)
+                subprocess.run(
+                    ["/usr/bin/git", "--git-dir", str(path), "fetch", "--prune"],
+                    check=True,
+                    capture_output=True,
+                    text=True,
+                )
+            else:
+                self._create(repo, path)
+        except subprocess.CalledProcessError as e:
+            logger.warning("Failed to update mirror for %s: %s", repo, e.stderr)
+            return False
+        os.utime(path)
+        return True
+
+    def _create(self, repo: str, path: Path) -> None:
+        # clone next to the final location and rename, so an interrupted
+        # clone never leaves a half-written mirror behind
+        logger.info("Creating mirror of %s at %s", repo, path)
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.root / f".{path.name}.{uuid.uuid4().hex}"
+        try:
+            subprocess.run(
+                ["/usr/bin/git", "clone", "--mirror", repo, str(tmp_path)],
+                check=True,
+                capture_output=True,
+                text=True,
+            )
+            tmp_path.rename(path)
+        finally:
+            shutil.rmtree(tmp_path, ignore_errors=True)
@@ -0,0 +1,167 @@
+"""
+Temporary build directories and the reaper that keeps them off the disk.
+
+Every build without a workspace runs in its own job_* directory under
+BUILD_ROOT, removed when the build is done. A build holds a shared flock on a
+lease file inside its directory while it runs, so directories left behind by a
+runner that crashed or was killed can be told apart from ones in use, by this
+process or any other, without keeping a registry. A DiskReaper thread checks
+the filesystem every few seconds and, once its usage crosses the high
+watermark, removes abandoned build directories oldest first until usage is
+back under the low watermark.
+"""
+
+import fcntl
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from runner import utils
+from runner.config import (
+    LOG_LEVEL,
+    REAPER_HIGH_WATERMARK,
+    REAPER_LOW_WATERMARK,
+    REAPER_INTERVAL,
+)
+
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+logger.setLevel(LOG_LEVEL)
+
+PREFIX = "job_"
+LEASE = ".lease"
+# a directory is only ever reaped after this many seconds, closing the window
+# between creating it and taking its lease
+MIN_AGE = 60
+
+
+class BuildDirs:
+    """Leased temporary build directories under one root."""
+
+    def __init__(self, root: Path | str):
+        self.root = Path(root)
+        self._lock = threading.Lock()
+        self._leases: dict[Path, object] = {}
+
+    def create(self) -> Path:
+        """Create a build directory, leased until remove() is called."""
+        self.root.mkdir(parents=True, exist_ok=True)
+        path = Path(tempfile.mkdtemp(prefix=PREFIX, dir=self.root))
+        lease = open(path / LEASE, "wb")
+        fcntl.flock(lease, fcntl.LOCK_SH)
+        with self._lock:
+            self._leases[path] = lease
+        logger.info("Created temp build directory: %s", path)
+        return path
+
+    def remove(self, path: Path) -> None:
+        """Delete a build directory and give up its lease."""
+        utils.cleanup_build_files(path)
+        with self._lock:
+            lease = self._leases.pop(path, None)
+        if lease is not None:
+            lease.close()
+
+    def usage(self) -> float:
+        """Fraction of the root's filesystem in use."""
+        disk = shutil.disk_usage(self.root)
+        return disk.used / disk.total
+
+    def reap(
+        self,
+        high: float = REAPER_HIGH_WATERMARK,
+        low: float = REAPER_LOW_WATERMARK,
+    ) -> int:
+        """
+        Free abandoned build directories if the disk is filling up.
+
+        Nothing happens below the high watermark. Above it, directories no
+        build holds a lease on are removed, oldest first, until usage drops to
+        the low watermark or there are none left.
+
+        Returns:
+            The number of directories removed.
+        """
+        if not self.root.is_dir() or self.usage() < high:
+            return 0
+        cutoff = time.time() - MIN_AGE
+        candidates = []
+        for entry in os.scandir(self.root):
+            if not entry.name.startswith(PREFIX) or not entry.is_dir():
+                continue
+            try:
+                mtime = entry.stat().st_mtime
+            except FileNotFoundError:
+                continue
+            if mtime < cutoff:
+                candidates.append((mtime, Path(entry.path)))
+        removed = 0
+        for _, path in sorted(candidates):
+            if self.usage() <= low:
+                break
+            if self._remove_abandoned(path):
+                removed += 1
+        if removed or self.usage() >= high:
+            logger.info(
+                "Reaped %d abandoned build directories, disk %.0f%% used",
+                removed,
+                self.usage() * 100,
+            )
+        return removed
+
+    def _remove_abandoned(self, path: Path) -> bool:
+        try:
+            lease = open(path / LEASE, "rb")
+        except FileNotFoundError:
+            if not path.is_dir():
+                return False
+            # created before leases existed, or never got its lease
+            lease = None
+        except OSError:
+            return False
+        try:
+            if lease is not None:
+                try:
+                    fcntl.flock(lease, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    return False  # a build is still using it
+            logger.info("Removing abandoned build directory %s", path)
+            utils.cleanup_build_files(path)
+            return True
+        finally:
+            if lease is not None:
+                lease.close()
+
+
+class DiskReaper:
+    """Runs BuildDirs.reap every interval seconds from a background thread."""
+
+    def __init__(self, build_dirs: BuildDirs, interval: float = REAPER_INTERVAL):
+        self.build_dirs = build_dirs
+        self.interval = interval
+        self._stopping = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        self._stopping.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="disk-reaper", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stopping.wait(self.interval):
+            try:
+                self.build_dirs.reap()
+            except OSError as e:
+                logger.warning("Failed to reap build directories: %s", e)
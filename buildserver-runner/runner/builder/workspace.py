@@ -0,0 +1,83 @@
+"""
+Warm per-repository workspaces for incremental builds.
+
+A workspace is a build directory that outlives the job: the next job for the
+same repository fetches and checks out its commit in place and re-runs make,
+so only targets whose sources changed are rebuilt. Each workspace is guarded
+by an flock on a sibling lock file, which serializes jobs for the same
+repository across threads and runner processes alike. Workspaces that are not
+locked are evicted least-recently-used first once the pool exceeds its cap.
+"""
+
+import fcntl
+import hashlib
+import logging
+import os
+import shutil
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator
+
+from runner import utils
+from runner.config import LOG_LEVEL
+
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+logger.setLevel(LOG_LEVEL)
+
+
+class WorkspacePool:
+    """Persistent build directories, one per repository URL."""
+
+    def __init__(self, root: Path | str, max_bytes: int):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+
+    def workspace_path(self, repo: str) -> Path:
+        """Location of the workspace for a repository URL."""
+        digest = hashlib.sha256(repo.encode()).hexdigest()[:16]
+        return self.root / f"{utils.get_dir_name(repo)}-{digest}"
+
+    @contextmanager
+    def acquire(self, repo: str) -> Iterator[Path]:
+        """
+        Lock and yield the workspace for repo, creating it if needed.
+
+        Blocks while another job holds the same workspace.
+        """
+        path = self.workspace_path(repo)
+        self.root.mkdir(parents=True, exist_ok=True)
+        with open(_lock_path(path), "w") as lock:
+            logger.debug("Waiting for workspace %s", path)
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                # created under the lock so a concurrent eviction can't race us
+                path.mkdir(exist_ok=True)
+                os.utime(path)
+                yield path
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+        self.evict()
+
+    def evict(self) -> None:
+        """Remove least recently used workspaces until the pool fits its cap."""
+        if not self.root.is_dir():
+            return
+        workspaces = [p for p in self.root.iterdir() if p.is_dir()]
+        sizes = {p: utils.dir_size(p) for p in workspaces}
+        total = sum(sizes.values())
+        for path in sorted(workspaces, key=lambda p: p.stat().st_mtime):
+            if total <= self.max_bytes:
+                break
+            with open(_lock_path(path), "w") as lock:
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue  # in use by a running job
+                logger.info("Evicting workspace %s (%d bytes)", path, sizes[path])
+                shutil.rmtree(path, ignore_errors=True)
+                total -= sizes[path]
+
+
+def _lock_path(path: Path) -> Path:
+    return path.with_name(path.name + ".lock")
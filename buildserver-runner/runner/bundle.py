@@ -0,0 +1,132 @@
+"""
+Compressed artifact bundles
+
+Packs a build's artifacts into one .tar.zst file so they are uploaded, stored
+and downloaded as a single blob. Every tar member (header, data and padding)
+is compressed as its own zstd frame, followed by a frame with the end of
+archive marker, so the whole file is an ordinary zstd stream: `zstd -d | tar x`
+unpacks it. Behind the archive are two zstd skippable frames that decoders
+ignore:
+
+- the index, a JSON list with each member's name, size, mode, sha256 and the
+  offset and length of its compressed frame
+- a fixed-size footer holding the index frame's offset
+
+The API reads the footer and the index to extract a single member by
+decompressing only its frame, see buildserver.artifacts.bundle.
+
+Bundles need the optional zstandard package.
+"""
+
+import hashlib
+import io
+import json
+import logging
+import struct
+import tarfile
+from pathlib import Path
+from typing import BinaryIO
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from runner.config import LOG_LEVEL, ARTIFACT_BUNDLE_LEVEL
+
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+logger.setLevel(LOG_LEVEL)
+
+INDEX_MAGIC = 0x184D2A5E  # zstd skippable frame, ignored by decoders
+FOOTER_MAGIC = 0x184D2A5F
+FOOTER_TAG = b"bsbndl01"
+SKIPPABLE_HEADER = struct.Struct("<II")  # magic, payload size
+FOOTER = struct.Struct("<IIQ8s")  # magic, payload size, index offset, tag
+COPY_BYTES = 1024 * 1024
+
+
+class _CountingWriter(io.RawIOBase):
+    """Passes writes through to f, hashing and counting them."""
+
+    def __init__(self, f: BinaryIO):
+        self._file = f
+        self.position = 0
+        self.sha256 = hashlib.sha256()
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._file.write(data)
+        self.sha256.update(data)
+        self.position += len(data)
+        return len(data)
+
+
+def available() -> bool:
+    return zstandard is not None
+
+
+def write_bundle(
+    repo_path: Path,
+    artifacts: list[Path],
+    out: BinaryIO,
+    level: int = ARTIFACT_BUNDLE_LEVEL,
+) -> tuple[str, int, list[dict]]:
+    """
+    Write a bundle of artifacts to out, reading each file in COPY_BYTES pieces.
+
+    Args:
+        repo_path: The build the artifacts are in.
+        artifacts: Paths relative to repo_path.
+        out: Where the bundle is written, from its current position.
+        level: zstd compression level.
+
+    Returns:
+        The bundle's sha256, its size and its index.
+    """
+    writer = _CountingWriter(out)
+    compressor = zstandard.ZstdCompressor(level=level)
+    index = []
+    for relative in artifacts:
+        path = repo_path / relative
+        stat = path.stat()
+        info = tarfile.TarInfo(relative.as_posix())
+        info.size = stat.st_size
+        info.mode = stat.st_mode & 0o7777
+        info.mtime = int(stat.st_mtime)
+        header = info.tobuf(format=tarfile.PAX_FORMAT)
+        start = writer.position
+        digest = hashlib.sha256()
+        with (
+            open(path, "rb") as f,
+            compressor.stream_writer(writer, closefd=False) as frame,
+        ):
+            frame.write(header)
+            while chunk := f.read(COPY_BYTES):
+                frame.write(chunk)
+                digest.update(chunk)
+            frame.write(b"\0" * (-info.size % tarfile.BLOCKSIZE))
+        index.append(
+            {
+                "name": info.name,
+                "size": info.size,
+                "mode": info.mode,
+                "digest": digest.hexdigest(),
+                "offset": start,
+                "length": writer.position - start,
+                "header": len(header),
+            }
+        )
+    writer.write(compressor.compress(b"\0" * (2 * tarfile.BLOCKSIZE)))
+    index_offset = writer.position
+    payload = json.dumps(index, separators=(",", ":")).encode()
+    writer.write(SKIPPABLE_HEADER.pack(INDEX_MAGIC, len(payload)) + payload)
+    writer.write(
+        FOOTER.pack(
+            FOOTER_MAGIC, FOOTER.size - SKIPPABLE_HEADER.size, index_offset, FOOTER_TAG
+        )
+    )
+    logger.debug("Bundled %d artifacts into %d bytes", len(index), writer.position)
+    return writer.sha256.hexdigest(), writer.position, index
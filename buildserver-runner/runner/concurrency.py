@@ -0,0 +1,195 @@
+"""
+Adaptive build concurrency for the runner.
+
+A ConcurrencyController samples the host every few seconds and moves the
+number of build slots between a floor and a ceiling. It adds slots while every
+slot is busy and the load average leaves room, several at a time on an idle
+host, gives one back when the host is overloaded, and halves the slots when
+free memory or free disk in the build directory runs low. Resizes are reported
+to a callback so the agent can update its RabbitMQ prefetch count to match.
+"""
+
+import logging
+import os
+import shutil
+import threading
+from dataclasses import dataclass
+from typing import Callable
+
+from runner.builder.jobserver import available_cores
+from runner.config import (
+    LOG_LEVEL,
+    BUILD_ROOT,
+    MIN_BUILDS,
+    MAX_BUILDS,
+    CONCURRENCY_INTERVAL,
+    LOAD_HIGH,
+    LOAD_LOW,
+    MIN_FREE_MEMORY,
+    MIN_FREE_DISK,
+)
+
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+logger.setLevel(LOG_LEVEL)
+
+
+@dataclass
+class HostSample:
+    """Resource readings the controller sizes the slots from."""
+
+    load: float  # 1 minute load average per core
+    memory_available: int  # bytes
+    disk_free: int  # bytes free in the build directory's filesystem
+
+    @classmethod
+    def take(cls, path: str = BUILD_ROOT) -> "HostSample":
+        # BUILD_ROOT is only created by the first build
+        while not os.path.exists(path):
+            path = os.path.dirname(path)
+        return cls(
+            load=os.getloadavg()[0] / available_cores(),
+            memory_available=_memory_available(),
+            disk_free=shutil.disk_usage(path).free,
+        )
+
+
+def _memory_available() -> int:
+    """MemAvailable from /proc/meminfo, or free physical pages elsewhere."""
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+
+
+class BuildSlots:
+    """Counting semaphore whose size can change while slots are held."""
+
+    def __init__(self, limit: int):
+        self._limit = limit
+        self._active = 0
+        self._cond = threading.Condition()
+
+    @property
+    def limit(self) -> int:
+        return self._limit
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    def acquire(self) -> None:
+        """Block until a slot is free and take it."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._active < self._limit)
+            self._active += 1
+
+    def try_acquire(self) -> bool:
+        """Take a slot if one is free. Never blocks, for use from asyncio."""
+        with self._cond:
+            if self._active >= self._limit:
+                return False
+            self._active += 1
+            return True
+
+    def release(self) -> None:
+        with self._cond:
+            self._active -= 1
+            self._cond.notify()
+
+    def resize(self, limit: int) -> None:
+        """
+        Change the number of slots.
+
+        Shrinking never interrupts a build, it only keeps new ones from
+        starting until enough running ones have finished.
+        """
+        with self._cond:
+            self._limit = limit
+            self._cond.notify_all()
+
+    def __enter__(self) -> "BuildSlots":
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.release()
+
+
+class ConcurrencyController:
+    """Resizes BuildSlots from periodic host samples."""
+
+    def __init__(
+        self,
+        min_slots: int = MIN_BUILDS,
+        max_slots: int = MAX_BUILDS or available_cores(),
+        on_resize: Callable[[int], None] | None = None,
+        interval: float = CONCURRENCY_INTERVAL,
+        sample: Callable[[], HostSample] = HostSample.take,
+    ):
+        self.min_slots = min_slots
+        self.max_slots = max(min_slots, max_slots)
+        self.slots = BuildSlots(min_slots)
+        self.interval = interval
+        self._on_resize = on_resize
+        self._sample = sample
+        self._stopping = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def target(self, sample: HostSample) -> int:
+        """Number of slots the host can take given a sample."""
+        limit = self.slots.limit
+        if (
+            sample.memory_available < MIN_FREE_MEMORY
+            or sample.disk_free < MIN_FREE_DISK
+        ):
+            limit //= 2
+        elif sample.load > LOAD_HIGH:
+            limit -= 1
+        elif sample.load < LOAD_LOW and self.slots.active >= limit:
+            # ramp up quickly on an idle host, carefully near the threshold
+            limit += max(1, limit // 2) if sample.load < LOAD_LOW / 2 else 1
+        return max(self.min_slots, min(self.max_slots, limit))
+
+    def adjust(self) -> int:
+        """Take a sample and resize the slots. Returns the new limit."""
+        sample = self._sample()
+        limit = self.target(sample)
+        if limit != self.slots.limit:
+            logger.info(
+                "Build slots %d -> %d (load %.2f/core, %d MiB memory, %d MiB disk free)",
+                self.slots.limit,
+                limit,
+                sample.load,
+                sample.memory_available // 1024**2,
+                sample.disk_free // 1024**2,
+            )
+            self.slots.resize(limit)
+            if self._on_resize is not None:
+                self._on_resize(limit)
+        return limit
+
+    def start(self) -> None:
+        """Adjust every interval seconds from a background thread."""
+        self._stopping.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="concurrency-controller", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stopping.wait(self.interval):
+            try:
+                self.adjust()
+            except OSError as e:
+                logger.warning("Failed to sample host resources: %s", e)
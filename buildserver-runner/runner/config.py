@@ -1,7 +1,9 @@
 import logging
+import os
+import tempfile
 
 from starlette.config import Config
-from starlette.datastructures import Secret
+from starlette.datastructures import CommaSeparatedStrings, Secret
 
 config = Config(".env")
 
@@ -11,3 +13,92 @@ RABBITMQ_USER = config("RABBITMQ_USER", default="guest")
 RABBITMQ_PASS = config("RABBITMQ_PASS", default="guest", cast=Secret)
 RABBITMQ_PORT = config("RABBITMQ_PORT", default=5672)
 APISERVER_HOST = config("APISERVER_HOST", default="http://localhost:8000")
+
+# Bare mirrors of every repository this runner has built, reused across jobs
+GIT_MIRROR_ROOT = config(
+    "GIT_MIRROR_ROOT",
+    default=os.path.join(tempfile.gettempdir(), "buildserver-mirrors"),
+)
+# Set to 0 to disable the mirror cache
+GIT_MIRROR_MAX_BYTES = config("GIT_MIRROR_MAX_BYTES", default=10 * 1024**3, cast=int)
+# One of "full", "shallow" or "partial", see runner.builder.builder.CloneMode
+CLONE_MODE = config("CLONE_MODE", default="full")
+
+# Object cache shared by every build on this runner, set max bytes to 0 to disable
+COMPILER_CACHE_DIR = config(
+    "COMPILER_CACHE_DIR",
+    default=os.path.join(tempfile.gettempdir(), "buildserver-compiler-cache"),
+)
+COMPILER_CACHE_MAX_BYTES = config(
+    "COMPILER_CACHE_MAX_BYTES", default=5 * 1024**3, cast=int
+)
+
+# Cores shared by all concurrent builds through make's jobserver, 0 uses every core
+BUILD_CORES = config("BUILD_CORES", default=0, cast=int)
+
+# Temporary job_* build directories, one per build outside of workspace mode
+BUILD_ROOT = config("BUILD_ROOT", default=tempfile.gettempdir())
+# Once BUILD_ROOT's filesystem is this full, build directories abandoned by
+# crashed runners are removed until it is back under the low watermark
+REAPER_HIGH_WATERMARK = config("REAPER_HIGH_WATERMARK", default=0.9, cast=float)
+REAPER_LOW_WATERMARK = config("REAPER_LOW_WATERMARK", default=0.8, cast=float)
+REAPER_INTERVAL = config("REAPER_INTERVAL", default=30.0, cast=float)
+
+# Opt-in incremental builds in one persistent directory per repository
+WORKSPACE_MODE = config("WORKSPACE_MODE", default=False, cast=bool)
+WORKSPACE_ROOT = config(
+    "WORKSPACE_ROOT",
+    default=os.path.join(tempfile.gettempdir(), "buildserver-workspaces"),
+)
+WORKSPACE_MAX_BYTES = config("WORKSPACE_MAX_BYTES", default=20 * 1024**3, cast=int)
+
+# Local copies of build logs, shipped to the API in batches while the build runs
+BUILD_LOG_DIR = config(
+    "BUILD_LOG_DIR",
+    default=os.path.join(tempfile.gettempdir(), "buildserver-logs"),
+)
+LOG_BATCH_BYTES = config("LOG_BATCH_BYTES", default=256 * 1024, cast=int)
+LOG_FLUSH_INTERVAL = config("LOG_FLUSH_INTERVAL", default=2.0, cast=float)
+
+# Concurrent builds supervised by one `buildserver-runner start --async` process
+ASYNC_MAX_BUILDS = config("ASYNC_MAX_BUILDS", default=32, cast=int)
+
+# Connections kept alive to the API, shared by status updates and log uploads
+API_POOL_SIZE = config("API_POOL_SIZE", default=8, cast=int)
+API_RETRIES = config("API_RETRIES", default=3, cast=int)
+API_RETRY_BACKOFF = config("API_RETRY_BACKOFF", default=0.5, cast=float)
+# Status updates the API could not take, replayed once it is reachable again
+STATUS_SPOOL_PATH = config(
+    "STATUS_SPOOL_PATH",
+    default=os.path.join(tempfile.gettempdir(), "buildserver-status-spool.jsonl"),
+)
+STATUS_FLUSH_INTERVAL = config("STATUS_FLUSH_INTERVAL", default=10.0, cast=float)
+
+# Concurrent builds are resized between these bounds from host load, MAX_BUILDS=0
+# allows one build per core
+MIN_BUILDS = config("MIN_BUILDS", default=1, cast=int)
+MAX_BUILDS = config("MAX_BUILDS", default=0, cast=int)
+CONCURRENCY_INTERVAL = config("CONCURRENCY_INTERVAL", default=10.0, cast=float)
+# 1 minute load average per core above which slots shrink, and below which they grow
+LOAD_HIGH = config("LOAD_HIGH", default=1.5, cast=float)
+LOAD_LOW = config("LOAD_LOW", default=1.0, cast=float)
+# Slots are halved when either drops below its floor
+MIN_FREE_MEMORY = config("MIN_FREE_MEMORY", default=1024**3, cast=int)
+MIN_FREE_DISK = config("MIN_FREE_DISK", default=5 * 1024**3, cast=int)
+
+# Files uploaded to the API after a successful build, matched by file name like
+# the API's own ARTIFACT_INCLUDE/ARTIFACT_EXCLUDE
+ARTIFACT_INCLUDE = config("ARTIFACT_INCLUDE", default="*", cast=CommaSeparatedStrings)
+ARTIFACT_EXCLUDE = config(
+    "ARTIFACT_EXCLUDE", default="Makefile,*.c,*.h", cast=CommaSeparatedStrings
+)
+ARTIFACT_IGNORE_DIRS = config(
+    "ARTIFACT_IGNORE_DIRS", default=".git", cast=CommaSeparatedStrings
+)
+ARTIFACT_UPLOAD_WORKERS = config("ARTIFACT_UPLOAD_WORKERS", default=4, cast=int)
+# Size of each resumable upload request, the most of a file held in memory
+ARTIFACT_CHUNK_BYTES = config("ARTIFACT_CHUNK_BYTES", default=8 * 1024**2, cast=int)
+# Upload a build's artifacts as one .tar.zst bundle instead of one blob per
+# file, needs the zstandard package
+ARTIFACT_BUNDLE = config("ARTIFACT_BUNDLE", default=False, cast=bool)
+ARTIFACT_BUNDLE_LEVEL = config("ARTIFACT_BUNDLE_LEVEL", default=3, cast=int)
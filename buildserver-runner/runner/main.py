@@ -4,6 +4,7 @@ import typer
 
 from runner.config import LOG_LEVEL
 from runner.agent import Agent
+from runner.async_agent import AsyncAgent
 
 logging.basicConfig()
 logger = logging.getLogger(__name__)
@@ -34,8 +35,17 @@ def main(
 
 
 @app.command(name="start", help="Start buildserver-runner")
-def start_runner():
-    Agent().start()
+def start_runner(
+    async_mode: bool = typer.Option(
+        False,
+        "--async",
+        help="Supervise builds from a single asyncio event loop",
+    ),
+):
+    if async_mode:
+        AsyncAgent().start()
+    else:
+        Agent().start()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,124 @@
+"""
+In-process resolution of git refs
+
+Reads HEAD, loose refs and packed-refs straight from the repository's git
+directory, so looking up the checked out commit costs a couple of small file
+reads instead of forking git. Layouts this reader doesn't understand, such as
+the reftable backend, return None and callers fall back to git.
+
+Run `python -m runner.refs [path]` to compare against `git rev-parse HEAD`.
+"""
+
+import logging
+import os
+import re
+import stat
+import subprocess
+import sys
+import timeit
+from pathlib import Path
+
+from runner.config import LOG_LEVEL
+
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+logger.setLevel(LOG_LEVEL)
+
+OBJECT_ID = re.compile(r"[0-9a-f]{40}([0-9a-f]{24})?")
+MAX_SYMREF_DEPTH = 5  # same limit git uses
+
+
+def read_head(path: Path) -> str | None:
+    """
+    Commit checked out in the repository containing path.
+
+    Returns:
+        The commit hash, or None if it can't be resolved without git.
+    """
+    # plain os.path on strings, pathlib's overhead is most of the cost here
+    git_dir = _find_git_dir(os.fspath(path))
+    if git_dir is None or os.path.exists(os.path.join(git_dir, "reftable")):
+        return None
+    # worktrees keep HEAD to themselves and share every other ref
+    common_dir = git_dir
+    commondir_file = _read(os.path.join(git_dir, "commondir"))
+    if commondir_file is not None:
+        common_dir = os.path.normpath(os.path.join(git_dir, commondir_file))
+    value = _read(os.path.join(git_dir, "HEAD"))
+    for _ in range(MAX_SYMREF_DEPTH):
+        if value is None:
+            return None
+        if OBJECT_ID.fullmatch(value):
+            return value
+        if not value.startswith("ref:"):
+            return None
+        value = _read_ref(common_dir, value[4:].strip())
+    return None
+
+
+def _find_git_dir(path: str) -> str | None:
+    path = os.path.abspath(path)
+    while True:
+        dot_git = os.path.join(path, ".git")
+        try:
+            mode = os.stat(dot_git).st_mode
+        except OSError:
+            mode = 0
+        if stat.S_ISDIR(mode):
+            return dot_git
+        if stat.S_ISREG(mode):
+            content = _read(dot_git) or ""
+            if not content.startswith("gitdir:"):
+                return None
+            return os.path.normpath(os.path.join(path, content[7:].strip()))
+        parent = os.path.dirname(path)
+        if parent == path:
+            return None
+        path = parent
+
+
+def _read(path: str) -> str | None:
+    try:
+        with open(path, "rb") as f:
+            return f.read().decode().strip()
+    except OSError:
+        return None
+
+
+def _read_ref(common_dir: str, name: str) -> str | None:
+    """Value of a loose ref, or its packed object id."""
+    value = _read(os.path.join(common_dir, name))
+    if value is not None:
+        return value
+    try:
+        with open(os.path.join(common_dir, "packed-refs")) as f:
+            for line in f:
+                # skip the header and peeled tag lines
+                if line.startswith(("#", "^")):
+                    continue
+                object_id, _, ref = line.rstrip("\n").partition(" ")
+                if ref == name:
+                    return object_id
+    except FileNotFoundError:
+        pass
+    return None
+
+
+def _benchmark(path: Path, number: int = 1000) -> None:
+    native = timeit.timeit(lambda: read_head(path), number=number) / number
+    forked = timeit.timeit(
+        lambda: subprocess.run(
+            ["/usr/bin/git", "rev-parse", "HEAD"],
+            cwd=path,
+            check=True,
+            stdout=subprocess.PIPE,
+        ),
+        number=number // 10,
+    ) / (number // 10)
+    print(f"read_head:          {native * 1e6:10.1f} us  ({read_head(path)})")
+    print(f"git rev-parse HEAD: {forked * 1e6:10.1f} us")
+    print(f"speedup:            {forked / native:10.0f}x")
+
+
+if __name__ == "__main__":
+    _benchmark(Path(sys.argv[1] if len(sys.argv) > 1 else ".").resolve())
@@ -1,11 +1,13 @@
 """RabbitMQ connection, producer, and consumer classes"""
 
 import logging
+import threading
 from typing import Callable
 import time
 
 import pika
 import pika.channel
+import pika.exceptions
 import pika.spec
 
 from runner.config import LOG_LEVEL, RABBITMQ_HOST, RABBITMQ_USER, RABBITMQ_PASS
@@ -58,6 +60,54 @@ class RabbitMQProducer(RabbitMQConnection):
         connection.close()
 
 
+class Delivery:
+    """A consumed message that the handler settles once it is done with it.
+
+    ack and nack may be called from any thread; the call is handed to the
+    connection's ioloop. A message whose channel closed before it was settled
+    is redelivered by the broker.
+    """
+
+    def __init__(
+        self,
+        connection: pika.SelectConnection,
+        channel: pika.channel.Channel,
+        method: pika.spec.Basic.Deliver,
+    ):
+        self._connection = connection
+        self._channel = channel
+        self.delivery_tag = method.delivery_tag
+        self.redelivered = method.redelivered
+
+    def ack(self) -> None:
+        """Tell the broker the message was handled."""
+        self._settle(lambda: self._channel.basic_ack(self.delivery_tag))
+
+    def nack(self, requeue: bool = True) -> None:
+        """Return the message to the queue, or drop it if requeue is False."""
+        self._settle(
+            lambda: self._channel.basic_nack(self.delivery_tag, requeue=requeue)
+        )
+
+    def _settle(self, callback: Callable[[], None]) -> None:
+        def settle():
+            if self._channel.is_open:
+                callback()
+            else:
+                logger.warning(
+                    "Channel closed before delivery %d was settled, "
+                    "the broker will redeliver it",
+                    self.delivery_tag,
+                )
+
+        try:
+            self._connection.ioloop.add_callback_threadsafe(settle)
+        except pika.exceptions.ConnectionWrongStateError:
+            logger.warning(
+                "Connection closed, delivery %d not settled", self.delivery_tag
+            )
+
+
 class RabbitMQConsumer(RabbitMQConnection):
     """Consumes messages from a RabbitMQ queue using a select connection with auto-reconnect."""
 
@@ -66,12 +116,17 @@ class RabbitMQConsumer(RabbitMQConnection):
         self._connection: pika.SelectConnection | None = None
         self._channel: pika.channel.Channel | None = None
         self._stopping = False
+        self._running = False
+        self._consumer_tag: str | None = None
         self._queue: str | None = None
-        self._on_message: Callable[[bytes], None] | None = None
+        self._on_message: Callable[[bytes, Delivery], None] | None = None
         self._prefetch_count: int = 1
 
     def start(
-        self, queue: str, on_message: Callable[[bytes], None], prefetch_count: int = 1
+        self,
+        queue: str,
+        on_message: Callable[[bytes, Delivery], None],
+        prefetch_count: int = 1,
     ) -> None:
         """Connect to RabbitMQ and begin consuming from the given queue.
 
@@ -79,8 +134,11 @@ class RabbitMQConsumer(RabbitMQConnection):
 
         Args:
             queue: The queue name to consume from.
-            on_message: Callback that receives the raw message body as bytes.
-                Messages are acked on success and nacked on exception.
+            on_message: Callback that receives the raw message body as bytes
+                and its Delivery. The callback owns the delivery and must ack
+                or nack it, possibly later and from another thread, so the
+                broker only hands out prefetch_count messages until then. A
+                message is nacked without requeue if the callback raises.
             prefetch_count: Max unacked messages to allow (limits concurrency).
         """
         self._queue = queue
@@ -88,17 +146,67 @@ class RabbitMQConsumer(RabbitMQConnection):
         self._prefetch_count = prefetch_count
         while not self._stopping:
             self._connect()
-            self._connection.ioloop.start()
+            self._running = True
+            try:
+                self._connection.ioloop.start()
+            finally:
+                self._running = False
             if not self._stopping:
                 logger.info("Reconnecting in %d seconds...", self.RECONNECT_DELAY)
                 time.sleep(self.RECONNECT_DELAY)
 
-    def stop(self) -> None:
-        """Gracefully stop consuming and close the connection. Thread-safe."""
+    def stop(self, drain: Callable[[], None] | None = None) -> None:
+        """Gracefully stop consuming and close the connection. Thread-safe.
+
+        The consumer is cancelled first so no more messages arrive, then drain
+        runs in a helper thread while the ioloop keeps running, so deliveries
+        settled until it returns still reach the broker instead of being
+        redelivered. If start() was interrupted, e.g. by KeyboardInterrupt,
+        its ioloop is run again here until the connection is closed.
+
+        Args:
+            drain: Blocks until the handlers have settled their deliveries.
+        """
         logger.info("Stopping RabbitMQ connection...")
         self._stopping = True
+        connection = self._connection
+        if not (connection and connection.is_open):
+            if drain:
+                drain()
+            return
+
+        def close():
+            try:
+                if drain:
+                    drain()
+            finally:
+                connection.ioloop.add_callback_threadsafe(self._shutdown)
+
+        connection.ioloop.add_callback_threadsafe(self._cancel)
+        closer = threading.Thread(target=close, name="rmq-close")
+        closer.start()
+        if not self._running:
+            connection.ioloop.start()
+        closer.join()
+
+    def set_prefetch_count(self, prefetch_count: int) -> None:
+        """Change the number of unacked messages allowed in flight. Thread-safe.
+
+        Args:
+            prefetch_count: The new limit, applied to the open channel and
+                to channels opened after a reconnect.
+        """
+        self._prefetch_count = prefetch_count
         if self._connection and self._connection.is_open:
-            self._connection.ioloop.add_callback_threadsafe(self._shutdown)
+            self._connection.ioloop.add_callback_threadsafe(self._apply_prefetch)
+
+    def _apply_prefetch(self) -> None:
+        if self._channel and self._channel.is_open:
+            self._channel.basic_qos(prefetch_count=self._prefetch_count)
+
+    def _cancel(self) -> None:
+        if self._channel and self._channel.is_open and self._consumer_tag:
+            self._channel.basic_cancel(self._consumer_tag)
 
     def _shutdown(self) -> None:
         if self._channel and self._channel.is_open:
@@ -156,7 +264,7 @@ class RabbitMQConsumer(RabbitMQConnection):
 
     def _on_queue_declared(self, frame: pika.frame.Method) -> None:
         logger.info("Queue '%s' declared", self._queue)
-        self._channel.basic_consume(self._queue, self._dispatch)
+        self._consumer_tag = self._channel.basic_consume(self._queue, self._dispatch)
         logger.info("Consuming from '%s'", self._queue)
 
     def _dispatch(
@@ -166,10 +274,9 @@ class RabbitMQConsumer(RabbitMQConnection):
         properties: pika.spec.BasicProperties,
         body: bytes,
     ) -> None:
-        # try:
-        self._on_message(body)
-        channel.basic_ack(delivery_tag=method.delivery_tag)
-
-    # except Exception as e:
-    #     logger.error("Message handler failed: %s", e)
-    #     channel.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
+        delivery = Delivery(self._connection, channel, method)
+        try:
+            self._on_message(body, delivery)
+        except Exception as e:
+            logger.error("Message handler failed: %s", e)
+            channel.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
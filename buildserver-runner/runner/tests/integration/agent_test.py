@@ -45,7 +45,7 @@ class TestJobSubmission:
     def test_agent_receives_and_executes_job(self, run_agent, producer):
         with (
             patch("runner.agent.run_build") as mock_run_build,
-            patch("runner.agent.requests"),
+            patch("runner.agent.api_client"),
         ):
             mock_run_build.return_value = None
 
@@ -57,7 +57,7 @@ class TestJobSubmission:
     def test_agent_executes_multiple_jobs(self, run_agent, producer):
         with (
             patch("runner.agent.run_build") as mock_run_build,
-            patch("runner.agent.requests"),
+            patch("runner.agent.api_client"),
         ):
             mock_run_build.return_value = None
 
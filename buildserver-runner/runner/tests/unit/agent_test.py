@@ -0,0 +1,92 @@
+import json
+from unittest.mock import MagicMock, patch
+
+import pytest
+import requests
+
+from runner.agent import Agent
+from runner.builder.builder import BuildError
+from runner.types import JobStatus
+
+BODY = json.dumps(
+    {
+        "job_id": 1,
+        "git_repository_url": "git@github.com:user/repo.git",
+        "commit_hash": "a" * 40,
+        "job_status": JobStatus.QUEUED,
+        "created_at": "2024-01-01T00:00:00",
+    }
+).encode()
+
+
+@pytest.fixture
+def agent():
+    with patch("runner.agent.RabbitMQConsumer"):
+        yield Agent()
+
+
+@pytest.fixture
+def delivery():
+    delivery = MagicMock()
+    delivery.redelivered = False
+    return delivery
+
+
+@patch("runner.agent.BuildLog")
+@patch("runner.agent.api_client")
+@patch("runner.agent.run_build")
+class TestHandleJob:
+
+    def test_acks_after_build_and_status_report(
+        self, mock_run_build, mock_client, _, agent, delivery
+    ):
+        order = []
+        mock_run_build.side_effect = lambda *a, **kw: order.append("build")
+        mock_client.update_status.side_effect = lambda *a: order.append("report")
+        delivery.ack.side_effect = lambda: order.append("ack")
+
+        agent._handle_job(BODY, delivery)
+
+        assert order == ["build", "report", "ack"]
+        delivery.nack.assert_not_called()
+
+    def test_acks_failed_build(self, mock_run_build, mock_client, _, agent, delivery):
+        mock_run_build.side_effect = BuildError("boom")
+
+        agent._handle_job(BODY, delivery)
+
+        mock_client.update_status.assert_called_once_with(1, JobStatus.FAILED)
+        delivery.ack.assert_called_once()
+
+    def test_fails_job_when_artifact_upload_fails(
+        self, mock_run_build, mock_client, _, agent, delivery
+    ):
+        mock_run_build.side_effect = requests.exceptions.ConnectionError()
+
+        agent._handle_job(BODY, delivery)
+
+        assert mock_run_build.call_args.kwargs["after_build"].args == (1,)
+        mock_client.update_status.assert_called_once_with(1, JobStatus.FAILED)
+        delivery.ack.assert_called_once()
+
+    def test_rejects_invalid_body(self, mock_run_build, _client, _, agent, delivery):
+        agent._handle_job(b"not json", delivery)
+
+        mock_run_build.assert_not_called()
+        delivery.nack.assert_called_once_with(requeue=False)
+
+    def test_requeues_once_on_unexpected_error(
+        self, mock_run_build, _client, _, agent, delivery
+    ):
+        mock_run_build.side_effect = RuntimeError("disk on fire")
+
+        agent._handle_job(BODY, delivery)
+        delivery.redelivered = True
+        agent._handle_job(BODY, delivery)
+
+        assert [c.kwargs for c in delivery.nack.call_args_list] == [
+            {"requeue": True},
+            {"requeue": False},
+        ]
+        delivery.ack.assert_not_called()
+        assert agent.active_jobs == []
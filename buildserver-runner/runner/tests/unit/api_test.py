@@ -0,0 +1,258 @@
+from unittest.mock import MagicMock
+
+import pytest
+import requests
+
+from runner.api import APIClient, MissingBlobsError
+from runner.types import JobStatus
+
+
+@pytest.fixture
+def client(tmp_path):
+    client = APIClient("http://api", spool_path=tmp_path / "spool.jsonl", retries=0)
+    client._session = MagicMock()
+    client._session.patch.return_value.status_code = 200
+    return client
+
+
+def _patched(client) -> list[tuple[str, str]]:
+    return [
+        (c.args[0], c.kwargs["json"]["job_status"])
+        for c in client._session.patch.call_args_list
+    ]
+
+
+class TestUpdateStatus:
+
+    def test_delivers_directly(self, client):
+        assert client.update_status(1, JobStatus.RUNNING)
+
+        assert _patched(client) == [("http://api/jobs/1", JobStatus.RUNNING)]
+        assert not client.spool_path.exists()
+
+    def test_spools_on_failure(self, client):
+        client._session.patch.side_effect = requests.exceptions.ConnectionError()
+
+        assert not client.update_status(1, JobStatus.RUNNING)
+
+        assert client._read_spool() == [{"job_id": 1, "job_status": "RUNNING"}]
+
+    def test_keeps_order_behind_spooled_updates(self, client):
+        client._session.patch.side_effect = requests.exceptions.ConnectionError()
+        client.update_status(1, JobStatus.RUNNING)
+        client._session.patch.side_effect = None
+        client._session.patch.reset_mock()
+
+        # the API is back, but RUNNING must not land after SUCCEEDED
+        assert not client.update_status(1, JobStatus.SUCCEEDED)
+        assert client._session.patch.call_count == 0
+
+        assert client.flush_spool() == 0
+        assert _patched(client) == [
+            ("http://api/jobs/1", "RUNNING"),
+            ("http://api/jobs/1", "SUCCEEDED"),
+        ]
+        assert not client.spool_path.exists()
+
+    def test_flush_stops_at_first_failure(self, client):
+        client._session.patch.side_effect = requests.exceptions.ConnectionError()
+        client.update_status(1, JobStatus.RUNNING)
+        client.update_status(2, JobStatus.RUNNING)
+        client._session.patch.side_effect = [
+            MagicMock(status_code=200),
+            requests.exceptions.ConnectionError(),
+        ]
+
+        assert client.flush_spool() == 1
+        assert client._read_spool() == [{"job_id": 2, "job_status": "RUNNING"}]
+
+    def test_spool_survives_restart(self, client, tmp_path):
+        client._session.patch.side_effect = requests.exceptions.ConnectionError()
+        client.update_status(1, JobStatus.FAILED)
+
+        restarted = APIClient("http://api", spool_path=client.spool_path)
+        restarted._session = MagicMock()
+        restarted._session.patch.return_value.status_code = 200
+
+        assert restarted.flush_spool() == 0
+        assert _patched(restarted) == [("http://api/jobs/1", "FAILED")]
+
+    def test_drops_rejected_update(self, client):
+        client._session.patch.return_value.status_code = 404
+
+        assert client.update_status(1, JobStatus.RUNNING)
+        assert not client.spool_path.exists()
+
+
+class TestClaimJob:
+
+    def test_claims_queued_job(self, client):
+        assert client.claim_job(1)
+
+        assert _patched(client) == [("http://api/jobs/1", JobStatus.RUNNING)]
+
+    def test_refuses_superseded_job(self, client):
+        client._session.patch.return_value.status_code = 409
+
+        assert not client.claim_job(1)
+        assert not client.spool_path.exists()
+
+    def test_builds_when_api_unreachable(self, client):
+        client._session.patch.side_effect = requests.exceptions.ConnectionError()
+
+        assert client.claim_job(1)
+        assert client._read_spool() == [{"job_id": 1, "job_status": "RUNNING"}]
+
+
+class TestUploadBlob:
+
+    @pytest.fixture
+    def artifact(self, tmp_path):
+        path = tmp_path / "main"
+        path.write_bytes(b"0123456789")
+        return path
+
+    @pytest.fixture
+    def uploading(self, client):
+        client.retries = 1
+        client._session.post.return_value.json.return_value = {"upload_id": "u1"}
+        received = bytearray()
+
+        def patch_upload(url, params, data, **kwargs):
+            assert params["offset"] == len(received)
+            received.extend(data)
+            resp = MagicMock()
+            resp.json.return_value = {"offset": len(received)}
+            return resp
+
+        client._session.patch.side_effect = patch_upload
+        client._session.get.side_effect = lambda url, **kw: MagicMock(
+            **{"json.return_value": {"offset": len(received)}}
+        )
+        return received
+
+    def test_uploads_in_chunks(self, client, artifact, uploading):
+        client.upload_blob(artifact, "d" * 64, chunk_size=4)
+
+        assert bytes(uploading) == b"0123456789"
+        assert client._session.patch.call_count == 3
+        client._session.put.assert_called_once_with(
+            "http://api/artifacts/uploads/u1", params={"digest": "d" * 64}, timeout=5
+        )
+
+    def test_resumes_from_server_offset(self, client, artifact, uploading):
+        side_effect = client._session.patch.side_effect
+        calls = []
+
+        def flaky(url, params, data, **kwargs):
+            calls.append(params["offset"])
+            if len(calls) == 2:
+                # the server got the chunk but the response was lost
+                side_effect(url, params, data, **kwargs)
+                raise requests.exceptions.ConnectionError()
+            return side_effect(url, params, data, **kwargs)
+
+        client._session.patch.side_effect = flaky
+
+        client.upload_blob(artifact, "d" * 64, chunk_size=4)
+
+        assert bytes(uploading) == b"0123456789"
+        assert calls == [0, 4, 8]
+
+    def test_gives_up_after_retries(self, client, artifact, uploading):
+        client._session.patch.side_effect = requests.exceptions.ConnectionError()
+
+        with pytest.raises(requests.exceptions.ConnectionError):
+            client.upload_blob(artifact, "d" * 64, chunk_size=4)
+        client._session.put.assert_not_called()
+
+
+class TestHasBlob:
+
+    def test_found(self, client):
+        client._session.head.return_value.status_code = 200
+
+        assert client.has_blob("d" * 64)
+
+    def test_missing(self, client):
+        client._session.head.return_value.status_code = 404
+
+        assert not client.has_blob("d" * 64)
+
+
+class TestPostLog:
+
+    def test_retries_unavailable_api(self, client):
+        client.retries = 2
+        client.backoff = 0
+        client._session.post.side_effect = [
+            requests.exceptions.ConnectionError(),
+            MagicMock(status_code=503),
+            MagicMock(status_code=200),
+        ]
+
+        client.post_log(1, 0, b"out")
+
+        assert client._session.post.call_count == 3
+        assert client._session.post.call_args.kwargs["params"] == {"offset": 0}
+
+    def test_gives_up_after_retries(self, client):
+        client._session.post.side_effect = requests.exceptions.ConnectionError()
+
+        with pytest.raises(requests.exceptions.ConnectionError):
+            client.post_log(1, 0, b"out")
+
+        assert client._session.post.call_count == 1
+
+
+class TestRegisterArtifacts:
+
+    def test_retries_unavailable_api(self, client):
+        client.retries = 1
+        client.backoff = 0
+        client._session.post.side_effect = [
+            MagicMock(status_code=502),
+            MagicMock(status_code=200),
+        ]
+
+        client.register_artifacts(1, [])
+
+        assert client._session.post.call_count == 2
+
+    def test_reports_missing_blobs(self, client):
+        resp = MagicMock(status_code=400)
+        resp.json.return_value = {
+            "detail": [{"msg": "Blobs not uploaded", "digests": ["d" * 64]}]
+        }
+        client._session.post.return_value = resp
+
+        with pytest.raises(MissingBlobsError) as exc_info:
+            client.register_artifacts(1, [])
+
+        assert exc_info.value.digests == ["d" * 64]
+
+
+def test_does_not_retry_posts():
+    client = APIClient("http://api")
+
+    retry = client._session.get_adapter("http://api").max_retries
+
+    assert "POST" not in retry.allowed_methods
+    assert "PATCH" in retry.allowed_methods
+
+
+class TestFlushSpool:
+
+    def test_keeps_updates_spooled_while_flushing(self, client):
+        client._session.patch.side_effect = requests.exceptions.ConnectionError()
+        client.update_status(1, JobStatus.RUNNING)
+
+        def deliver(*args, **kwargs):
+            # a build thread reports while the flush is sending
+            assert not client.update_status(1, JobStatus.SUCCEEDED)
+            return MagicMock(status_code=200)
+
+        client._session.patch.side_effect = deliver
+
+        assert client.flush_spool() == 1
+        assert client._read_spool() == [{"job_id": 1, "job_status": "SUCCEEDED"}]
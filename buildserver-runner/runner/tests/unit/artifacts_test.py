@@ -0,0 +1,98 @@
+import hashlib
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from runner.api import MissingBlobsError
+from runner.artifacts import REGISTER_ATTEMPTS, ArtifactMatcher, upload_artifacts
+
+
+@pytest.fixture
+def build(tmp_path):
+    """A built checkout with sources, objects and a binary."""
+    path = tmp_path / "repo"
+    (path / ".git").mkdir(parents=True)
+    (path / ".git" / "HEAD").write_text("ref: refs/heads/main\n")
+    (path / "src").mkdir()
+    (path / "Makefile").write_text("all:\n")
+    (path / "main.c").write_text("int main(void) { return 0; }\n")
+    (path / "src" / "util.o").write_bytes(b"object")
+    (path / "main").write_bytes(b"binary")
+    return path
+
+
+class TestArtifactMatcher:
+
+    def test_collects_build_outputs_only(self, build):
+        found = ArtifactMatcher().collect(build)
+
+        assert sorted(map(str, found)) == ["main", "src/util.o"]
+
+    def test_include_and_exclude(self):
+        matcher = ArtifactMatcher(include=["*.o", "*.a"], exclude=["test_*"])
+
+        assert matcher.matches("lib.a")
+        assert not matcher.matches("main")
+        assert not matcher.matches("test_util.o")
+
+
+@patch("runner.artifacts.api_client")
+class TestUploadArtifacts:
+
+    def test_skips_blobs_the_api_has(self, mock_client, build):
+        known = hashlib.sha256(b"binary").hexdigest()
+        mock_client.has_blob.side_effect = lambda digest: digest == known
+
+        uploaded = upload_artifacts(1, build)
+
+        mock_client.upload_blob.assert_called_once_with(
+            build / "src" / "util.o", hashlib.sha256(b"object").hexdigest()
+        )
+        mock_client.register_artifacts.assert_called_once_with(1, uploaded)
+        assert sorted(a["artifact_path"] for a in uploaded) == ["main", "src/util.o"]
+        assert {a["size"] for a in uploaded} == {6}
+
+    def test_does_not_register_after_failed_upload(self, mock_client, build):
+        mock_client.has_blob.return_value = False
+        mock_client.upload_blob.side_effect = OSError("disk gone")
+
+        with pytest.raises(OSError):
+            upload_artifacts(1, build)
+        mock_client.register_artifacts.assert_not_called()
+
+    def test_uploads_collected_blobs_again(self, mock_client, build):
+        mock_client.has_blob.return_value = True
+        lost = hashlib.sha256(b"binary").hexdigest()
+        mock_client.register_artifacts.side_effect = [
+            MissingBlobsError([lost], MagicMock()),
+            None,
+        ]
+
+        upload_artifacts(1, build)
+
+        mock_client.upload_blob.assert_called_once_with(build / "main", lost)
+        assert mock_client.register_artifacts.call_count == 2
+
+    def test_gives_up_when_blobs_keep_disappearing(self, mock_client, build):
+        mock_client.has_blob.return_value = True
+        lost = hashlib.sha256(b"binary").hexdigest()
+        mock_client.register_artifacts.side_effect = MissingBlobsError(
+            [lost], MagicMock()
+        )
+
+        with pytest.raises(MissingBlobsError):
+            upload_artifacts(1, build)
+        assert mock_client.register_artifacts.call_count == REGISTER_ATTEMPTS
+
+    def test_uploads_one_bundle(self, mock_client, build):
+        pytest.importorskip("zstandard")
+        mock_client.has_blob.return_value = False
+
+        index = upload_artifacts(1, build, as_bundle=True)
+
+        assert [m["name"] for m in index] == ["main", "src/util.o"]
+        mock_client.upload_blob.assert_called_once()
+        digest = mock_client.upload_blob.call_args.args[1]
+        size = mock_client.set_bundle.call_args.args[2]
+        mock_client.set_bundle.assert_called_once_with(1, digest, size)
+        mock_client.register_artifacts.assert_not_called()
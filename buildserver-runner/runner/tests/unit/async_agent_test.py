@@ -0,0 +1,97 @@
+import asyncio
+import json
+from unittest.mock import AsyncMock, patch
+
+import pytest
+import requests
+
+from runner.async_agent import AsyncAgent
+from runner.types import JobStatus
+
+BODY = json.dumps(
+    {
+        "job_id": 1,
+        "git_repository_url": "git@github.com:user/repo.git",
+        "commit_hash": "a" * 40,
+        "job_status": JobStatus.QUEUED,
+        "created_at": "2024-01-01T00:00:00",
+    }
+).encode()
+
+
+@pytest.fixture
+def message():
+    return AsyncMock(body=BODY)
+
+
+@patch("runner.async_agent.api_client")
+class TestHandleJob:
+
+    @pytest.mark.asyncio
+    async def test_reports_through_spooling_client(self, mock_client, message):
+        # update_status spools when the API is down, the message is still acked
+        mock_client.claim_job.return_value = True
+        mock_client.update_status.return_value = False
+        agent = AsyncAgent()
+        agent._run_job = AsyncMock(return_value=JobStatus.SUCCEEDED)
+
+        await agent._handle_job(message)
+
+        mock_client.claim_job.assert_called_once_with(1)
+        mock_client.update_status.assert_called_once_with(1, JobStatus.SUCCEEDED)
+        message.ack.assert_awaited_once()
+
+    @pytest.mark.asyncio
+    async def test_skips_superseded_job(self, mock_client, message):
+        mock_client.claim_job.return_value = False
+        agent = AsyncAgent()
+        agent._run_job = AsyncMock()
+
+        await agent._handle_job(message)
+
+        agent._run_job.assert_not_called()
+        mock_client.update_status.assert_not_called()
+        message.ack.assert_awaited_once()
+
+    @pytest.mark.asyncio
+    async def test_waits_for_a_build_slot(self, mock_client, message):
+        mock_client.claim_job.return_value = True
+        agent = AsyncAgent(max_builds=1)
+        agent._run_job = AsyncMock(return_value=JobStatus.SUCCEEDED)
+        agent._concurrency.slots.acquire()
+
+        task = asyncio.create_task(agent._handle_job(message))
+        await asyncio.sleep(0.1)
+        mock_client.claim_job.assert_not_called()
+
+        agent._release_slot()
+        await asyncio.wait_for(task, 5)
+        message.ack.assert_awaited_once()
+        assert agent._concurrency.slots.active == 0
+
+    @pytest.mark.asyncio
+    async def test_requeues_once_on_unexpected_error(self, mock_client, message):
+        mock_client.claim_job.side_effect = requests.ConnectionError
+        message.redelivered = False
+        agent = AsyncAgent()
+
+        await agent._handle_job(message)
+
+        message.nack.assert_awaited_once_with(requeue=True)
+        message.ack.assert_not_called()
+        assert agent.active_jobs == {}
+        assert agent._concurrency.slots.active == 0
+
+    @pytest.mark.asyncio
+    async def test_drops_redelivered_job_on_unexpected_error(
+        self, mock_client, message
+    ):
+        mock_client.claim_job.return_value = True
+        message.redelivered = True
+        agent = AsyncAgent()
+        agent._run_job = AsyncMock(side_effect=OSError("disk full"))
+
+        await agent._handle_job(message)
+
+        message.nack.assert_awaited_once_with(requeue=False)
+        message.ack.assert_not_called()
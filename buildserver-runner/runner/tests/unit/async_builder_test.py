@@ -0,0 +1,143 @@
+import asyncio
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import pytest
+
+from runner.builder import async_builder
+from runner.builder.async_builder import in_thread, run_logged
+from runner.builder.builder import BuildError, CloneMode
+from runner.builder.buildlog import BuildLog
+
+
+class TestRunLogged:
+
+    @pytest.mark.asyncio
+    async def test_streams_output_to_file(self, tmp_path):
+        path = tmp_path / "build.log"
+        with BuildLog(path) as log:
+            await run_logged(["sh", "-c", "echo out; echo err >&2"], log, cwd=tmp_path)
+
+        assert path.read_text() == "$ sh -c echo out; echo err >&2\nout\nerr\n"
+
+    @pytest.mark.asyncio
+    async def test_failure_carries_output_tail(self, tmp_path):
+        log = BuildLog()
+        with pytest.raises(subprocess.CalledProcessError) as exc_info:
+            await run_logged("echo broken; exit 2", log, cwd=tmp_path, shell=True)
+
+        assert exc_info.value.returncode == 2
+        assert "broken" in exc_info.value.stderr
+
+    @pytest.mark.asyncio
+    async def test_cancel_kills_process_group(self, tmp_path):
+        pid_file = tmp_path / "child.pid"
+        task = asyncio.create_task(
+            run_logged(
+                f"sleep 60 & echo $! > {pid_file}; wait",
+                BuildLog(),
+                cwd=tmp_path,
+                shell=True,
+            )
+        )
+        while not pid_file.exists() or not pid_file.read_text():
+            await asyncio.sleep(0.01)
+
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+        child = int(pid_file.read_text())
+        deadline = time.monotonic() + 5
+        while _alive(child) and time.monotonic() < deadline:
+            await asyncio.sleep(0.01)
+        assert not _alive(child)
+
+
+class TestInThread:
+
+    @pytest.mark.asyncio
+    async def test_releases_when_cancelled_while_entering(self):
+        entered, released = asyncio.Event(), []
+        loop = asyncio.get_running_loop()
+
+        @contextmanager
+        def slow():
+            time.sleep(0.2)
+            loop.call_soon_threadsafe(entered.set)
+            try:
+                yield
+            finally:
+                released.append(True)
+
+        async def hold():
+            async with in_thread(slow()):
+                await asyncio.sleep(60)
+
+        task = asyncio.create_task(hold())
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+        await entered.wait()
+        for _ in range(100):
+            if released:
+                break
+            await asyncio.sleep(0.01)
+        assert released == [True]
+
+    @pytest.mark.asyncio
+    async def test_waiting_entries_leave_threads_for_exits(self):
+        # a lock held by one build and awaited by more builds than the
+        # default executor has threads, as with a workspace flock
+        asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(2))
+        lock = threading.Lock()
+
+        @contextmanager
+        def locked():
+            with lock:
+                yield
+
+        async def build():
+            async with in_thread(locked()):
+                await asyncio.sleep(0.01)
+
+        await asyncio.wait_for(asyncio.gather(*(build() for _ in range(5))), 5)
+
+
+class TestAsyncBuilder:
+
+    @pytest.mark.asyncio
+    async def test_clone_and_build(self, local_repo, tmp_path):
+        build_dir = tmp_path / "build"
+        build_dir.mkdir()
+
+        commit = await async_builder.clone_repo(
+            str(local_repo.path), build_dir, mode=CloneMode.FULL
+        )
+        await async_builder.build(build_dir / "repo")
+
+        assert commit == local_repo.git("rev-parse", "HEAD")
+        assert (build_dir / "repo" / "main").exists()
+
+    @pytest.mark.asyncio
+    async def test_build_failure_raises(self, local_repo, tmp_path):
+        local_repo.commit({"main.c": "not c\n"})
+        build_dir = tmp_path / "build"
+        build_dir.mkdir()
+        await async_builder.clone_repo(str(local_repo.path), build_dir)
+
+        with pytest.raises(BuildError):
+            await async_builder.build(build_dir / "repo")
+
+
+def _alive(pid: int) -> bool:
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            return f.read().split()[2] != "Z"
+    except FileNotFoundError:
+        return False
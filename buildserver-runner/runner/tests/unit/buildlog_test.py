@@ -0,0 +1,88 @@
+import subprocess
+from unittest.mock import MagicMock, patch
+
+import pytest
+import requests
+
+from runner.builder.buildlog import BuildLog, LogShipper, run_logged, TAIL_BYTES
+
+
+class TestRunLogged:
+
+    def test_streams_output_to_file(self, tmp_path):
+        path = tmp_path / "build.log"
+        with BuildLog(path) as log:
+            run_logged(["sh", "-c", "echo out; echo err >&2"], log, cwd=tmp_path)
+
+        assert path.read_text() == "$ sh -c echo out; echo err >&2\nout\nerr\n"
+
+    def test_failure_carries_output_tail(self, tmp_path):
+        log = BuildLog()
+        with pytest.raises(subprocess.CalledProcessError) as exc_info:
+            run_logged("echo broken; exit 2", log, cwd=tmp_path, shell=True)
+
+        assert exc_info.value.returncode == 2
+        assert "broken" in exc_info.value.stderr
+
+    def test_tail_is_bounded(self, tmp_path):
+        log = BuildLog()
+        run_logged(["head", "-c", str(10 * TAIL_BYTES), "/dev/zero"], log, cwd=tmp_path)
+
+        assert len(log.tail()) <= TAIL_BYTES
+
+
+class TestLogShipper:
+
+    @patch("runner.builder.buildlog.api_client")
+    def test_ships_file_in_batches(self, mock_client, tmp_path):
+        path = tmp_path / "build.log"
+        path.write_bytes(b"a" * 10)
+        shipper = LogShipper(1, path, batch_bytes=4, interval=60)
+
+        shipper._ship()
+
+        offsets = [c.args[1] for c in mock_client.post_log.call_args_list]
+        sizes = [len(c.args[2]) for c in mock_client.post_log.call_args_list]
+        assert offsets == [0, 4, 8]
+        assert sizes == [4, 4, 2]
+        assert shipper.offset == 10
+
+    @patch("runner.builder.buildlog.api_client")
+    def test_keeps_offset_on_failure(self, mock_client, tmp_path):
+        mock_client.post_log.side_effect = requests.exceptions.ConnectionError("503")
+        path = tmp_path / "build.log"
+        path.write_bytes(b"data")
+        shipper = LogShipper(1, path, batch_bytes=4, interval=60)
+
+        shipper._ship()
+
+        assert shipper.offset == 0
+
+
+class TestBuildLogClose:
+
+    def test_removes_shipped_log(self, tmp_path):
+        path = tmp_path / "1.log"
+        log = BuildLog(path, shipper=MagicMock(**{"close.return_value": 0}))
+        log.write(b"out\n")
+
+        log.close()
+
+        assert not path.exists()
+
+    def test_keeps_log_not_fully_shipped(self, tmp_path):
+        path = tmp_path / "1.log"
+        log = BuildLog(path, shipper=MagicMock(**{"close.return_value": 4}))
+        log.write(b"out\n")
+
+        log.close()
+
+        assert path.read_bytes() == b"out\n"
+
+    def test_keeps_log_without_shipper(self, tmp_path):
+        path = tmp_path / "build.log"
+
+        with BuildLog(path) as log:
+            log.write(b"out\n")
+
+        assert path.exists()
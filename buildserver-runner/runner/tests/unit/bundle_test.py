@@ -0,0 +1,65 @@
+import hashlib
+import io
+import json
+import tarfile
+from pathlib import Path
+
+import pytest
+
+from runner import bundle
+from runner.bundle import write_bundle
+
+zstandard = pytest.importorskip("zstandard")
+
+
+@pytest.fixture
+def build(tmp_path):
+    (tmp_path / "src").mkdir()
+    (tmp_path / "main").write_bytes(b"binary" * 1000)
+    (tmp_path / "main").chmod(0o755)
+    (tmp_path / "src" / "util.o").write_bytes(b"object")
+    return tmp_path
+
+
+ARTIFACTS = [Path("main"), Path("src/util.o")]
+
+
+class TestWriteBundle:
+
+    def test_unpacks_with_plain_zstd_and_tar(self, build):
+        out = io.BytesIO()
+        digest, size, _ = write_bundle(build, ARTIFACTS, out)
+
+        data = out.getvalue()
+        assert digest == hashlib.sha256(data).hexdigest()
+        assert size == len(data)
+        with zstandard.ZstdDecompressor().stream_reader(
+            io.BytesIO(data), read_across_frames=True
+        ) as reader:
+            raw = reader.read()
+        with tarfile.open(fileobj=io.BytesIO(raw)) as tar:
+            assert tar.getnames() == ["main", "src/util.o"]
+            assert tar.getmember("main").mode == 0o755
+            assert tar.extractfile("src/util.o").read() == b"object"
+
+    def test_each_member_is_its_own_frame(self, build):
+        out = io.BytesIO()
+        _, _, index = write_bundle(build, ARTIFACTS, out)
+
+        member = index[1]
+        frame = out.getvalue()[member["offset"] : member["offset"] + member["length"]]
+        raw = zstandard.ZstdDecompressor().decompressobj().decompress(frame)
+        assert raw[member["header"] :][: member["size"]] == b"object"
+        assert member["digest"] == hashlib.sha256(b"object").hexdigest()
+
+    def test_footer_points_at_index(self, build):
+        out = io.BytesIO()
+        _, _, index = write_bundle(build, ARTIFACTS, out)
+
+        data = out.getvalue()
+        magic, _, index_offset, tag = bundle.FOOTER.unpack(data[-bundle.FOOTER.size :])
+        assert (magic, tag) == (bundle.FOOTER_MAGIC, bundle.FOOTER_TAG)
+        magic, length = bundle.SKIPPABLE_HEADER.unpack_from(data, index_offset)
+        start = index_offset + bundle.SKIPPABLE_HEADER.size
+        assert magic == bundle.INDEX_MAGIC
+        assert json.loads(data[start : start + length]) == index
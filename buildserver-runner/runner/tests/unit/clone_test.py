@@ -0,0 +1,58 @@
+from unittest.mock import patch
+
+import pytest
+
+from runner.builder.builder import clone_repo, CloneError, CloneMode
+
+
+@pytest.fixture
+def build_dir(tmp_path):
+    path = tmp_path / "build"
+    path.mkdir()
+    return path
+
+
+class TestCloneRepo:
+
+    def test_full_clone_returns_head(self, build_dir, local_repo):
+        commit_hash = clone_repo(str(local_repo.path), build_dir)
+        assert commit_hash == local_repo.git("rev-parse", "HEAD")
+        assert (build_dir / "repo" / "main.c").exists()
+
+    @pytest.mark.parametrize("mode", list(CloneMode))
+    def test_checks_out_pinned_commit(self, build_dir, local_repo, mode):
+        pinned = local_repo.git("rev-parse", "HEAD")
+        local_repo.commit({"later.c": "int y;\n"})
+
+        commit_hash = clone_repo(
+            f"file://{local_repo.path}", build_dir, pinned, mode=mode
+        )
+
+        assert commit_hash == pinned
+        assert (build_dir / "repo" / "main.c").exists()
+        assert not (build_dir / "repo" / "later.c").exists()
+
+    def test_shallow_clone_fetches_one_commit(self, build_dir, local_repo):
+        first = local_repo.git("rev-parse", "HEAD")
+        pinned = local_repo.commit({"later.c": "int y;\n"})
+
+        clone_repo(
+            f"file://{local_repo.path}", build_dir, pinned, mode=CloneMode.SHALLOW
+        )
+
+        assert (build_dir / "repo" / ".git" / "shallow").read_text().strip() == pinned
+        assert first != pinned
+
+    def test_unknown_commit_raises(self, build_dir, local_repo):
+        with pytest.raises(CloneError):
+            clone_repo(
+                f"file://{local_repo.path}",
+                build_dir,
+                "f" * 40,
+                mode=CloneMode.SHALLOW,
+            )
+
+    @patch("runner.builder.builder.CLONE_MODE", "deep")
+    def test_invalid_configured_mode_raises(self, build_dir, local_repo):
+        with pytest.raises(CloneError, match="CLONE_MODE 'deep'"):
+            clone_repo(str(local_repo.path), build_dir)
@@ -0,0 +1,120 @@
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+from runner.builder.compiler_cache import CacheStats, CompilerCache
+
+SOURCE = "int answer(void) { return 42; }\n"
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return CompilerCache(tmp_path / "cache", 1024**3)
+
+
+def _compile(cache, workdir, stats_file, *args):
+    workdir.mkdir(exist_ok=True)
+    (workdir / "answer.c").write_text(SOURCE)
+    return subprocess.run(
+        [sys.executable, "-m", "runner.builder.compiler_cache", "cc", *args],
+        cwd=workdir,
+        env={**os.environ, **cache.env(stats_file)},
+        check=True,
+    )
+
+
+class TestCompilerCache:
+
+    def test_second_compile_hits(self, tmp_path, cache):
+        stats_file = tmp_path / "stats"
+        _compile(cache, tmp_path / "a", stats_file, "-c", "answer.c", "-o", "answer.o")
+        _compile(cache, tmp_path / "b", stats_file, "-c", "answer.c", "-o", "answer.o")
+
+        assert CacheStats.read(stats_file) == CacheStats(hits=1, misses=1)
+        first = (tmp_path / "a" / "answer.o").read_bytes()
+        assert (tmp_path / "b" / "answer.o").read_bytes() == first
+
+    def test_different_flags_miss(self, tmp_path, cache):
+        stats_file = tmp_path / "stats"
+        _compile(cache, tmp_path / "a", stats_file, "-c", "answer.c", "-O0")
+        _compile(cache, tmp_path / "b", stats_file, "-c", "answer.c", "-O2")
+
+        assert CacheStats.read(stats_file) == CacheStats(misses=2)
+        assert (tmp_path / "b" / "answer.o").exists()
+
+    def test_restores_dependency_file(self, tmp_path, cache):
+        stats_file = tmp_path / "stats"
+        args = ("-c", "answer.c", "-o", "answer.o", "-MMD", "-MP")
+        _compile(cache, tmp_path / "a", stats_file, *args)
+        _compile(cache, tmp_path / "b", stats_file, *args)
+
+        assert CacheStats.read(stats_file) == CacheStats(hits=1, misses=1)
+        first = (tmp_path / "a" / "answer.d").read_text()
+        assert first.startswith("answer.o:")
+        assert (tmp_path / "b" / "answer.d").read_text() == first
+
+    def test_restores_named_dependency_file(self, tmp_path, cache):
+        stats_file = tmp_path / "stats"
+        args = ("-c", "answer.c", "-MD", "-MF", "deps.mk")
+        _compile(cache, tmp_path / "a", stats_file, *args)
+        _compile(cache, tmp_path / "b", stats_file, *args)
+
+        assert CacheStats.read(stats_file) == CacheStats(hits=1, misses=1)
+        assert (tmp_path / "b" / "deps.mk").exists()
+        assert not (tmp_path / "b" / "answer.d").exists()
+
+    def test_dependency_only_compile_is_not_cached(self, tmp_path, cache):
+        stats_file = tmp_path / "stats"
+        _compile(cache, tmp_path / "a", stats_file, "-c", "answer.c", "-MM")
+
+        assert CacheStats.read(stats_file) == CacheStats(uncacheable=1)
+
+    def test_link_step_is_not_cached(self, tmp_path, cache):
+        stats_file = tmp_path / "stats"
+        workdir = tmp_path / "a"
+        workdir.mkdir()
+        (workdir / "main.c").write_text("int main(void) { return 0; }\n")
+        _compile(cache, workdir, stats_file, "-o", "main", "main.c")
+
+        assert CacheStats.read(stats_file) == CacheStats(uncacheable=1)
+        assert (workdir / "main").exists()
+
+    def test_evicts_oldest_entries(self, tmp_path):
+        cache = CompilerCache(tmp_path / "cache", 10)
+        (tmp_path / "cache" / "ab").mkdir(parents=True)
+        old = tmp_path / "cache" / "ab" / "old.o"
+        new = tmp_path / "cache" / "ab" / "new.o"
+        old.write_bytes(b"x" * 8)
+        new.write_bytes(b"x" * 8)
+        os.utime(old, (0, 0))
+
+        cache.evict()
+
+        assert not old.exists()
+        assert new.exists()
+
+
+@pytest.mark.skipif(shutil.which("make") is None, reason="make is not installed")
+class TestBuildReportsStats:
+
+    def test_build_uses_cache(self, tmp_path, cache, monkeypatch, local_repo):
+        from runner.builder import builder
+
+        monkeypatch.setattr(builder, "COMPILER_CACHE", cache)
+        local_repo.commit(
+            {"Makefile": "main: main.o\n\t$(CC) -o main main.o\n"}, "split compile"
+        )
+        stats = []
+        for name in ("first", "second"):
+            build_dir = tmp_path / name
+            build_dir.mkdir()
+            shutil.copytree(local_repo.path, build_dir / "repo")
+            stats.append(builder.build(build_dir / "repo"))
+
+        assert stats == [
+            CacheStats(misses=1, uncacheable=1),
+            CacheStats(hits=1, uncacheable=1),
+        ]
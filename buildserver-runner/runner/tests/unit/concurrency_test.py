@@ -0,0 +1,113 @@
+import threading
+
+import pytest
+
+from runner.concurrency import BuildSlots, ConcurrencyController, HostSample
+
+GiB = 1024**3
+
+
+def _sample(load=0.8, memory=16 * GiB, disk=100 * GiB) -> HostSample:
+    return HostSample(load=load, memory_available=memory, disk_free=disk)
+
+
+@pytest.fixture
+def controller():
+    resizes = []
+    controller = ConcurrencyController(
+        min_slots=1, max_slots=64, on_resize=resizes.append
+    )
+    controller.resizes = resizes
+    return controller
+
+
+def _fill(slots: BuildSlots):
+    for _ in range(slots.limit):
+        slots.acquire()
+
+
+class TestConcurrencyController:
+
+    def test_grows_only_when_saturated(self, controller):
+        assert controller.target(_sample()) == 1
+
+        _fill(controller.slots)
+        assert controller.target(_sample()) == 2
+
+    def test_ramps_up_faster_on_idle_host(self, controller):
+        controller.slots.resize(8)
+        _fill(controller.slots)
+
+        assert controller.target(_sample(load=0.1)) == 12
+
+    def test_shrinks_when_overloaded(self, controller):
+        controller.slots.resize(8)
+
+        assert controller.target(_sample(load=3.0)) == 7
+
+    @pytest.mark.parametrize(
+        "sample", [_sample(memory=GiB // 2), _sample(disk=GiB)], ids=["mem", "disk"]
+    )
+    def test_halves_when_resources_run_low(self, controller, sample):
+        controller.slots.resize(8)
+
+        assert controller.target(sample) == 4
+
+    def test_stays_within_bounds(self, controller):
+        assert controller.target(_sample(memory=0)) == 1
+        controller.slots.resize(64)
+        _fill(controller.slots)
+        assert controller.target(_sample(load=0.0)) == 64
+
+    def test_adjust_reports_resize(self, controller):
+        controller._sample = lambda: _sample()
+        _fill(controller.slots)
+
+        assert controller.adjust() == 2
+        assert controller.resizes == [2]
+        assert controller.adjust() == 2
+        assert controller.resizes == [2]
+
+
+class TestBuildSlots:
+
+    def test_blocks_until_released(self):
+        slots = BuildSlots(1)
+        slots.acquire()
+        acquired = threading.Event()
+        t = threading.Thread(target=lambda: (slots.acquire(), acquired.set()))
+        t.start()
+
+        assert not acquired.wait(0.1)
+        slots.release()
+        assert acquired.wait(5)
+        t.join()
+
+    def test_grow_wakes_waiters(self):
+        slots = BuildSlots(1)
+        slots.acquire()
+        acquired = threading.Event()
+        t = threading.Thread(target=lambda: (slots.acquire(), acquired.set()))
+        t.start()
+
+        slots.resize(2)
+        assert acquired.wait(5)
+        t.join()
+        assert slots.active == 2
+
+    def test_try_acquire_does_not_block(self):
+        slots = BuildSlots(1)
+
+        assert slots.try_acquire()
+        assert not slots.try_acquire()
+        slots.release()
+        assert slots.try_acquire()
+
+
+class TestHostSample:
+
+    def test_samples_nearest_existing_directory(self, tmp_path):
+        # BUILD_ROOT doesn't exist until the first build creates it
+        sample = HostSample.take(str(tmp_path / "builds" / "root"))
+
+        assert sample.disk_free > 0
@@ -0,0 +1,56 @@
+"""Fixtures for unit tests"""
+
+import subprocess
+
+import pytest
+
+GIT_ENV = {
+    "GIT_AUTHOR_NAME": "test",
+    "GIT_AUTHOR_EMAIL": "test@test.com",
+    "GIT_COMMITTER_NAME": "test",
+    "GIT_COMMITTER_EMAIL": "test@test.com",
+    "PATH": "/usr/bin:/bin:/usr/sbin:/sbin:/usr/local/bin",
+}
+
+
+class LocalRepo:
+    """A git repository on local disk that tests can commit to."""
+
+    def __init__(self, path, home):
+        self.path = path
+        self._env = {**GIT_ENV, "HOME": str(home)}
+
+    def git(self, *args: str) -> str:
+        p = subprocess.run(
+            ["git", "-C", str(self.path), *args],
+            check=True,
+            capture_output=True,
+            text=True,
+            env=self._env,
+        )
+        return p.stdout.strip()
+
+    def commit(self, files: dict[str, str], message: str = "commit") -> str:
+        """Write files, commit them and return the new commit hash."""
+        for name, content in files.items():
+            (self.path / name).write_text(content)
+        self.git("add", ".")
+        self.git("commit", "-m", message)
+        return self.git("rev-parse", "HEAD")
+
+
+@pytest.fixture
+def local_repo(tmp_path):
+    """A local repository with a single commit containing a buildable program."""
+    path = tmp_path / "repo"
+    path.mkdir()
+    repo = LocalRepo(path, tmp_path)
+    repo.git("init", "-b", "main")
+    repo.commit(
+        {
+            "main.c": "int main(void) { return 0; }\n",
+            "Makefile": "main: main.c\n\t$(CC) -o main main.c\n",
+        },
+        "init",
+    )
+    return repo
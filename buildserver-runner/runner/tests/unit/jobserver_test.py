@@ -0,0 +1,98 @@
+import asyncio
+import os
+import subprocess
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from runner.builder.jobserver import JobServer
+
+# four independent targets that each take a measurable amount of time
+MAKEFILE = "all: a b c d\na b c d:\n\t@sleep 0.5\n"
+
+
+@pytest.fixture
+def makefile(tmp_path):
+    (tmp_path / "Makefile").write_text(MAKEFILE)
+    return tmp_path
+
+
+def _timed_make(jobserver: JobServer, cwd) -> float:
+    start = time.monotonic()
+    with jobserver.slot() as make_env:
+        subprocess.run(
+            ["make"],
+            cwd=cwd,
+            env={**os.environ, **make_env},
+            pass_fds=jobserver.fds,
+            check=True,
+            capture_output=True,
+        )
+    return time.monotonic() - start
+
+
+@pytest.mark.skipif(shutil.which("make") is None, reason="make is not installed")
+class TestJobServer:
+
+    def test_single_slot_runs_serially(self, makefile):
+        jobserver = JobServer(1)
+        assert _timed_make(jobserver, makefile) >= 2.0
+        jobserver.close()
+
+    def test_make_uses_free_slots(self, makefile):
+        jobserver = JobServer(4)
+        assert _timed_make(jobserver, makefile) < 1.5
+        jobserver.close()
+
+    def test_slot_blocks_until_released(self):
+        jobserver = JobServer(1)
+        acquired = threading.Event()
+
+        def second_build():
+            with jobserver.slot():
+                acquired.set()
+
+        with jobserver.slot():
+            t = threading.Thread(target=second_build)
+            t.start()
+            assert not acquired.wait(timeout=0.2)
+        assert acquired.wait(timeout=1)
+        t.join()
+        jobserver.close()
+
+    @pytest.mark.asyncio
+    async def test_async_slot_needs_no_threads(self):
+        # more builds wait for a token than the default executor has threads
+        asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(3))
+        jobserver = JobServer(1)
+        held = []
+
+        async def build(i):
+            async with jobserver.async_slot() as make_env:
+                held.append(i)
+                assert "--jobserver-auth" in make_env["MAKEFLAGS"]
+                await asyncio.to_thread(time.sleep, 0.01)
+
+        await asyncio.wait_for(asyncio.gather(*(build(i) for i in range(5))), 5)
+
+        assert sorted(held) == list(range(5))
+        assert os.read(jobserver.fds[0], 1) == b"+"
+        jobserver.close()
+
+    @pytest.mark.asyncio
+    async def test_async_slot_cancelled_while_waiting(self):
+        jobserver = JobServer(1)
+        async with jobserver.async_slot():
+            waiter = asyncio.create_task(jobserver.async_slot().__aenter__())
+            await asyncio.sleep(0.05)
+            waiter.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await waiter
+
+        async with asyncio.timeout(1):
+            async with jobserver.async_slot():
+                pass
+        jobserver.close()
@@ -0,0 +1,91 @@
+import subprocess
+from unittest.mock import patch
+
+from runner.builder.builder import clone_repo
+from runner.builder.mirror import MirrorCache
+
+
+def _mirror_head(path) -> str:
+    p = subprocess.run(
+        ["git", "--git-dir", str(path), "rev-parse", "HEAD"],
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    return p.stdout.strip()
+
+
+class TestMirrorCache:
+
+    def test_lease_creates_mirror(self, tmp_path, local_repo):
+        cache = MirrorCache(tmp_path / "mirrors", 1024**3)
+        with cache.lease(str(local_repo.path)) as mirror:
+            assert mirror == cache.mirror_path(str(local_repo.path))
+            assert _mirror_head(mirror) == local_repo.git("rev-parse", "HEAD")
+
+    def test_lease_fetches_new_commits(self, tmp_path, local_repo):
+        cache = MirrorCache(tmp_path / "mirrors", 1024**3)
+        with cache.lease(str(local_repo.path)):
+            pass
+        new_hash = local_repo.commit({"new.c": "int x;\n"})
+        with cache.lease(str(local_repo.path)) as mirror:
+            assert _mirror_head(mirror) == new_hash
+
+    def test_disabled_cache_yields_none(self, tmp_path, local_repo):
+        cache = MirrorCache(tmp_path / "mirrors", 0)
+        with cache.lease(str(local_repo.path)) as mirror:
+            assert mirror is None
+
+    def test_unreachable_repo_yields_none(self, tmp_path):
+        cache = MirrorCache(tmp_path / "mirrors", 1024**3)
+        with cache.lease(str(tmp_path / "missing")) as mirror:
+            assert mirror is None
+
+    def test_evicts_when_over_cap(self, tmp_path, local_repo):
+        cache = MirrorCache(tmp_path / "mirrors", 1)
+        with cache.lease(str(local_repo.path)) as mirror:
+            pass
+        assert not mirror.exists()
+
+    def test_leased_mirror_is_not_evicted(self, tmp_path, local_repo):
+        cache = MirrorCache(tmp_path / "mirrors", 1)
+        with cache.lease(str(local_repo.path)) as mirror:
+            cache.evict()
+            assert mirror.exists()
+
+    def test_under_cap_only_measures_leased_mirror(self, tmp_path, local_repo):
+        cache = MirrorCache(tmp_path / "mirrors", 1024**3)
+        other = tmp_path / "mirrors" / "other.git"
+        other.mkdir(parents=True)
+        with cache.lease(str(local_repo.path)):
+            pass
+
+        with patch("runner.builder.mirror.utils.dir_size", return_value=1) as size:
+            with cache.lease(str(local_repo.path)) as mirror:
+                pass
+
+        size.assert_called_once_with(mirror)
+
+    def test_evicts_mirrors_of_earlier_processes(self, tmp_path, local_repo):
+        stale = tmp_path / "mirrors" / "stale.git"
+        stale.mkdir(parents=True)
+        (stale / "pack").write_bytes(b"x" * 100)
+        cache = MirrorCache(tmp_path / "mirrors", 1)
+
+        cache.evict()
+
+        assert not stale.exists()
+        assert list((tmp_path / "mirrors").iterdir()) == []
+
+
+class TestCloneWithReference:
+
+    def test_clone_borrows_objects_from_mirror(self, tmp_path, local_repo):
+        cache = MirrorCache(tmp_path / "mirrors", 1024**3)
+        build_dir = tmp_path / "build"
+        build_dir.mkdir()
+        with cache.lease(str(local_repo.path)) as mirror:
+            commit_hash = clone_repo(str(local_repo.path), build_dir, reference=mirror)
+        alternates = build_dir / "repo" / ".git" / "objects" / "info" / "alternates"
+        assert alternates.read_text().strip() == str(mirror / "objects")
+        assert commit_hash == local_repo.git("rev-parse", "HEAD")
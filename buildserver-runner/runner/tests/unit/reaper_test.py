@@ -0,0 +1,66 @@
+import os
+import time
+
+import pytest
+
+from runner.builder.reaper import BuildDirs, LEASE, MIN_AGE
+
+
+@pytest.fixture
+def build_dirs(tmp_path):
+    return BuildDirs(tmp_path / "builds")
+
+
+def _abandon(build_dirs: BuildDirs, age: float = MIN_AGE + 60):
+    """A build directory whose runner died without removing it."""
+    path = build_dirs.create()
+    (path / "repo").mkdir()
+    (path / "repo" / "main.o").write_bytes(b"object")
+    # drop the lease without removing the directory, like a crashed process
+    build_dirs._leases.pop(path).close()
+    then = time.time() - age
+    os.utime(path, (then, then))
+    return path
+
+
+class TestBuildDirs:
+
+    def test_remove_deletes_the_directory(self, build_dirs):
+        path = build_dirs.create()
+        assert (path / LEASE).exists()
+
+        build_dirs.remove(path)
+        assert not path.exists()
+        assert build_dirs._leases == {}
+
+    def test_reaps_abandoned_directories_above_high_watermark(self, build_dirs):
+        abandoned = _abandon(build_dirs)
+        leased = build_dirs.create()
+        then = time.time() - MIN_AGE - 60
+        os.utime(leased, (then, then))
+
+        assert build_dirs.reap(high=0.0, low=0.0) == 1
+        assert not abandoned.exists()
+        assert leased.exists()
+
+    def test_leaves_disk_alone_below_high_watermark(self, build_dirs):
+        abandoned = _abandon(build_dirs)
+
+        assert build_dirs.reap(high=1.1, low=0.0) == 0
+        assert abandoned.exists()
+
+    def test_spares_fresh_directories(self, build_dirs):
+        fresh = _abandon(build_dirs, age=0)
+
+        assert build_dirs.reap(high=0.0, low=0.0) == 0
+        assert fresh.exists()
+
+    def test_stops_at_low_watermark_oldest_first(self, build_dirs, monkeypatch):
+        oldest = _abandon(build_dirs, age=MIN_AGE + 300)
+        newer = _abandon(build_dirs, age=MIN_AGE + 60)
+        remaining = iter([0.95, 0.95, 0.75, 0.75])
+        monkeypatch.setattr(build_dirs, "usage", lambda: next(remaining))
+
+        assert build_dirs.reap(high=0.9, low=0.8) == 1
+        assert not oldest.exists()
+        assert newer.exists()
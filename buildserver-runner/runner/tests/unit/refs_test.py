@@ -0,0 +1,55 @@
+from pathlib import Path
+
+from runner import refs
+
+
+def _head(repo) -> str:
+    return refs.read_head(repo.path)
+
+
+class TestReadHead:
+
+    def test_loose_branch_ref(self, local_repo):
+        assert _head(local_repo) == local_repo.git("rev-parse", "HEAD")
+
+    def test_packed_ref(self, local_repo):
+        local_repo.git("pack-refs", "--all")
+        assert not (local_repo.path / ".git" / "refs" / "heads" / "main").exists()
+
+        assert _head(local_repo) == local_repo.git("rev-parse", "HEAD")
+
+    def test_detached_head(self, local_repo):
+        first = local_repo.git("rev-parse", "HEAD")
+        local_repo.commit({"extra.c": "\n"})
+        local_repo.git("checkout", "-q", "--detach", first)
+
+        assert _head(local_repo) == first
+
+    def test_subdirectory(self, local_repo):
+        sub = local_repo.path / "src"
+        sub.mkdir()
+
+        assert refs.read_head(sub) == local_repo.git("rev-parse", "HEAD")
+
+    def test_worktree(self, local_repo, tmp_path):
+        local_repo.git("branch", "other")
+        local_repo.commit({"extra.c": "\n"})
+        worktree = tmp_path / "worktree"
+        local_repo.git("worktree", "add", "-q", str(worktree), "other")
+
+        assert refs.read_head(worktree) == local_repo.git("rev-parse", "other")
+        assert _head(local_repo) == local_repo.git("rev-parse", "main")
+
+    def test_unborn_branch_is_unresolved(self, tmp_path):
+        (tmp_path / ".git" / "refs" / "heads").mkdir(parents=True)
+        (tmp_path / ".git" / "HEAD").write_text("ref: refs/heads/main\n")
+
+        assert refs.read_head(tmp_path) is None
+
+    def test_reftable_is_left_to_git(self, local_repo):
+        (local_repo.path / ".git" / "reftable").mkdir()
+
+        assert _head(local_repo) is None
+
+    def test_outside_repository(self):
+        assert refs.read_head(Path("/")) is None
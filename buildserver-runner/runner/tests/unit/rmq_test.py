@@ -0,0 +1,98 @@
+from unittest.mock import MagicMock
+
+from runner.rmq.rmq import Delivery, RabbitMQConsumer
+
+
+def _run_callbacks(connection):
+    for call in connection.ioloop.add_callback_threadsafe.call_args_list:
+        call.args[0]()
+
+
+class TestDelivery:
+
+    def test_ack_runs_on_ioloop(self):
+        connection, channel = MagicMock(), MagicMock()
+        delivery = Delivery(connection, channel, MagicMock(delivery_tag=7))
+
+        delivery.ack()
+        channel.basic_ack.assert_not_called()
+        _run_callbacks(connection)
+
+        channel.basic_ack.assert_called_once_with(7)
+
+    def test_nack_skipped_when_channel_closed(self):
+        connection, channel = MagicMock(), MagicMock()
+        channel.is_open = False
+        delivery = Delivery(connection, channel, MagicMock(delivery_tag=7))
+
+        delivery.nack(requeue=True)
+        _run_callbacks(connection)
+
+        channel.basic_nack.assert_not_called()
+
+
+class TestDispatch:
+
+    def test_does_not_ack_for_handler(self):
+        consumer = RabbitMQConsumer()
+        handler = MagicMock()
+        consumer._on_message = handler
+        channel = MagicMock()
+
+        consumer._dispatch(channel, MagicMock(delivery_tag=3), None, b"body")
+
+        assert handler.call_args.args[0] == b"body"
+        assert isinstance(handler.call_args.args[1], Delivery)
+        channel.basic_ack.assert_not_called()
+
+    def test_nacks_when_handler_raises(self):
+        consumer = RabbitMQConsumer()
+        consumer._on_message = MagicMock(side_effect=RuntimeError)
+        channel = MagicMock()
+
+        consumer._dispatch(channel, MagicMock(delivery_tag=3), None, b"body")
+
+        channel.basic_nack.assert_called_once_with(delivery_tag=3, requeue=False)
+
+
+class TestStop:
+
+    def _consumer(self, running: bool):
+        consumer = RabbitMQConsumer()
+        consumer._connection = MagicMock(is_open=True)
+        consumer._channel = MagicMock(is_open=True)
+        consumer._consumer_tag = "ctag"
+        consumer._running = running
+        return consumer
+
+    def test_cancels_then_drains_then_closes(self):
+        consumer = self._consumer(running=True)
+        ioloop = consumer._connection.ioloop
+        order = []
+        ioloop.add_callback_threadsafe.side_effect = lambda cb: order.append(
+            cb.__name__
+        )
+
+        consumer.stop(drain=lambda: order.append("drain"))
+
+        assert order == ["_cancel", "drain", "_shutdown"]
+        ioloop.start.assert_not_called()
+        _run_callbacks(consumer._connection)
+        consumer._channel.basic_cancel.assert_called_once_with("ctag")
+
+    def test_runs_stopped_ioloop_until_closed(self):
+        consumer = self._consumer(running=False)
+        drain = MagicMock()
+
+        consumer.stop(drain=drain)
+
+        drain.assert_called_once()
+        consumer._connection.ioloop.start.assert_called_once()
+
+    def test_drains_without_connection(self):
+        consumer = RabbitMQConsumer()
+        drain = MagicMock()
+
+        consumer.stop(drain=drain)
+
+        drain.assert_called_once()
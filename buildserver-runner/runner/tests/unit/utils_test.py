@@ -0,0 +1,32 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from runner import utils
+
+
+class TestGetCommitHash:
+
+    def test_concurrent_lookups_do_not_race(self, local_repo, tmp_path):
+        other = tmp_path / "other"
+        local_repo.git("clone", "-q", str(local_repo.path), str(other))
+        head = local_repo.commit({"extra.c": "\n"})
+        cwd = os.getcwd()
+        log = logging.getLogger("test")
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            hashes = list(
+                pool.map(
+                    lambda p: utils.get_commit_hash(p, log),
+                    [local_repo.path, other] * 16,
+                )
+            )
+
+        assert hashes == [head, local_repo.git("rev-parse", "HEAD~1")] * 16
+        assert os.getcwd() == cwd
+
+    def test_missing_path_raises(self, tmp_path):
+        with pytest.raises(OSError):
+            utils.get_commit_hash(tmp_path / "missing", logging.getLogger("test"))
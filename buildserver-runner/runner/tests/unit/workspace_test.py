@@ -0,0 +1,68 @@
+import shutil
+import threading
+
+import pytest
+
+from runner.builder import builder
+from runner.builder.compiler_cache import CompilerCache
+from runner.builder.workspace import WorkspacePool
+
+
+@pytest.fixture
+def pool(tmp_path):
+    return WorkspacePool(tmp_path / "workspaces", 1024**3)
+
+
+class TestWorkspacePool:
+
+    def test_acquire_reuses_directory(self, pool):
+        with pool.acquire("git@github.com:user/repo.git") as first:
+            (first / "marker").write_text("warm")
+        with pool.acquire("git@github.com:user/repo.git") as second:
+            assert second == first
+            assert (second / "marker").read_text() == "warm"
+
+    def test_acquire_is_exclusive(self, pool):
+        acquired = threading.Event()
+
+        def second_job():
+            with pool.acquire("git@github.com:user/repo.git"):
+                acquired.set()
+
+        with pool.acquire("git@github.com:user/repo.git"):
+            t = threading.Thread(target=second_job)
+            t.start()
+            assert not acquired.wait(timeout=0.2)
+        assert acquired.wait(timeout=1)
+        t.join()
+
+    def test_evicts_unlocked_workspaces(self, tmp_path):
+        pool = WorkspacePool(tmp_path / "workspaces", 1)
+        with pool.acquire("git@github.com:user/repo.git") as workspace:
+            (workspace / "output").write_text("data")
+            pool.evict()
+            assert workspace.exists()
+        assert not workspace.exists()
+
+
+@pytest.mark.skipif(shutil.which("make") is None, reason="make is not installed")
+class TestRunInWorkspace:
+
+    @pytest.fixture(autouse=True)
+    def workspace_mode(self, tmp_path, monkeypatch, pool):
+        monkeypatch.setattr(builder, "WORKSPACE_MODE", True)
+        monkeypatch.setattr(builder, "WORKSPACES", pool)
+        monkeypatch.setattr(builder, "COMPILER_CACHE", CompilerCache(tmp_path, 0))
+
+    def test_rebuilds_only_when_sources_change(self, pool, local_repo):
+        repo = str(local_repo.path)
+        binary = pool.workspace_path(repo) / "repo" / "main"
+
+        builder.run(repo)
+        first_build = binary.stat().st_mtime_ns
+        builder.run(repo)
+        assert binary.stat().st_mtime_ns == first_build
+
+        new_hash = local_repo.commit({"main.c": "int main(void) { return 1; }\n"})
+        builder.run(repo, new_hash)
+        assert binary.stat().st_mtime_ns != first_build
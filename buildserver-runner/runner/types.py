@@ -14,6 +14,7 @@ class JobStatus(str, Enum):
     SUCCEEDED = "SUCCEEDED"
     QUEUED = "QUEUED"
     RUNNING = "RUNNING"
+    SUPERSEDED = "SUPERSEDED"  # replaced by a newer commit, skipped when dequeued
     # CREATED = "CREATED"
 
 
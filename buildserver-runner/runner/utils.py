@@ -8,6 +8,7 @@ import subprocess
 import os
 import shutil
 
+from runner import refs
 from runner.config import LOG_LEVEL
 
 logging.basicConfig()
@@ -36,16 +37,28 @@ def get_dir_name(url: str):
 def get_commit_hash(path: Path, logger: logging.Logger) -> str:
     """
     Get commit hash of the checked out branch
+
+    Refs are read from the git directory in-process, git only runs for
+    layouts the reader doesn't handle. Neither changes the process's working
+    directory, so concurrent threads can look up different repositories.
+
+    Raises:
+        OSError: If path does not exist
+        subprocess.CalledProcessError: If path is not in a git repository
     """
-    try:
-        os.chdir(path)
-        logger.debug("Path: %s cwd: %s", path, Path.cwd())
-    except OSError as e:
-        logger.error("chdir: %s", e)
-        raise e
+    path = Path(path)
+    if not path.is_dir():
+        raise FileNotFoundError(f"No such directory: {path}")
+    commit_hash = refs.read_head(path)
+    if commit_hash is not None:
+        return commit_hash
+    logger.debug("Resolving HEAD of %s with git", path)
     p = subprocess.run(
-        ["/usr/bin/git", "rev-parse", "HEAD"], check=True, stdout=subprocess.PIPE
-    )  # NOTE: consider using command pattern for all of these subproccess calls
+        ["/usr/bin/git", "rev-parse", "HEAD"],
+        cwd=path,
+        check=True,
+        stdout=subprocess.PIPE,
+    )
     commit_hash = str(p.stdout, encoding="utf-8").strip("\n")
     return commit_hash
 
@@ -68,6 +81,20 @@ def compare_hashes(local_hash: str, remote_hash: str) -> bool:
     return local_hash == remote_hash
 
 
+def dir_size(path: Path) -> int:
+    """
+    Total size in bytes of the files under path
+    """
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
 def cleanup_build_files(build_path: Path):
     """
     Cleanup a build directory after a build has completed